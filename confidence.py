@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# ランキングの信頼区間 (ブートストラップ)
+# 1人の着順の列を復元抽出し直すのは「1着・2着・3着の回数を多項分布で引き直す」のと同じなので、
+# 全員分をまとめて numpy の多項分布で引いて平均着順とトップ率の区間を出す
+# ==========================================
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE_LEVEL = 0.95
+CHUNK_PLAYERS = 256   # 一度に引く人数（メモリを 人数 × 回数 × 3 で抑える）
+PRIOR_GAMES = 1       # 引き直す確率に各着順これだけの回数を足す（2戦2勝の人の区間が 100%〜100% に潰れないように）
+INTERVAL_COLS = [
+    "name", "games", "first_count", "avg_rank", "avg_rank_low", "avg_rank_high",
+    "top_rate", "top_rate_low", "top_rate_high",
+]
+# 下限順のときに並べ替える列: (列, 昇順か)。平均着順は「悪い側の端」、トップ率は下限で比べる
+BOUND_KEYS = {
+    "avg_rank": ("avg_rank_high", True),
+    "top_rate": ("top_rate_low", False),
+}
+
+def bootstrap_intervals(totals, n_boot=BOOTSTRAP_SAMPLES, level=CONFIDENCE_LEVEL, seed=0):
+    # totals は Leaderboard と同じ {name: [打数, 着順合計, 1着回数, 3着回数]}
+    names = [n for n, t in totals.items() if t[0] > 0]
+    if not names:
+        return pd.DataFrame(columns=INTERVAL_COLS)
+    t = np.array([totals[n] for n in names], dtype=np.int64)
+    games, first, third = t[:, 0], t[:, 2], t[:, 3]
+    counts = np.stack([first, games - first - third, third], axis=1)
+    probs = (counts + PRIOR_GAMES) / (games + 3 * PRIOR_GAMES)[:, None]
+
+    # 同じデータなら毎回同じ区間になるよう乱数は固定する
+    rng = np.random.default_rng(seed)
+    q = [(1 - level) / 2, 1 - (1 - level) / 2]
+    avg_q = np.empty((len(names), 2))
+    top_q = np.empty((len(names), 2))
+    for lo in range(0, len(names), CHUNK_PLAYERS):
+        hi = lo + CHUNK_PLAYERS
+        n = games[lo:hi]
+        draws = rng.multinomial(n[:, None], probs[lo:hi, None, :], size=(len(n), n_boot))
+        avg = (draws @ np.array([1, 2, 3])) / n[:, None]
+        top = draws[:, :, 0] / n[:, None] * 100
+        avg_q[lo:hi] = np.quantile(avg, q, axis=1).T
+        top_q[lo:hi] = np.quantile(top, q, axis=1).T
+
+    return pd.DataFrame({
+        "name": names, "games": games, "first_count": first,
+        "avg_rank": counts @ np.array([1, 2, 3]) / games,
+        "avg_rank_low": avg_q[:, 0], "avg_rank_high": avg_q[:, 1],
+        "top_rate": first / games * 100,
+        "top_rate_low": top_q[:, 0], "top_rate_high": top_q[:, 1],
+    })
+
+def top_by_bound(intervals, metric, min_games, n=5):
+    # 区間の控えめな側で並べた上位 n 人（打数が少なく区間が広い人ほど下がる）
+    col, ascending = BOUND_KEYS[metric]
+    res = intervals[intervals["games"] >= min_games]
+    res = res.sort_values([col, "games", "name"], ascending=[ascending, False, True], kind="stable").head(n)
+    res = res.reset_index(drop=True)
+    res["順位"] = res.index + 1
+    return res
+
+def interval_label(intervals, metric, fmt):
+    # name -> "下限〜上限" の表示用文字列
+    labels = intervals[f"{metric}_low"].map(fmt.format) + "〜" + intervals[f"{metric}_high"].map(fmt.format)
+    return pd.Series(labels.values, index=intervals["name"].values)
@@ -0,0 +1,147 @@
+import argparse
+import html
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+from paper_sheet import PAPER_SHEET_CSS, iter_sheet_sets, set_sheet_html
+from score_stats import logical_today
+from settlement import SETTLEMENT_COLS, TYPE_LIST, calculate_day_totals, calculate_set_summary
+from stats_api import ScoreSource
+
+# ==========================================
+# 閉店後の日次レポート
+# 論理日付 × 卓ごとに、画面と同じ紙の成績表 (HTML) と対局一覧 (CSV)、
+# 「本日の合計」と同じゲーム代・バックの集計を書き出す。卓・日ごとの作成はプロセスを分けて並行に行う
+#
+#   python daily_report.py                       # 今日の分
+#   python daily_report.py --date 2024-05-01 --end 2024-05-31 --out reports
+# ==========================================
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+GAME_CSV_COLS = [
+    "DailyNo", "SetNo", "日時", "Aさん", "Aタイプ", "A着順",
+    "Bさん", "Bタイプ", "B着順", "Cさん", "Cタイプ", "C着順", "備考",
+]
+SET_SUMMARY_COLS = ["論理日付", "TableNo", "SetNo", "ゲーム数", "ゲーム代"] + TYPE_LIST
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+    body {{ font-family: "Hiragino Kaku Gothic ProN", Meiryo, sans-serif; margin: 20px; }}
+    .day-total {{ background: #f0f7ff; border: 1px solid #9cc; padding: 10px; margin-bottom: 16px; }}
+    .index-table {{ border-collapse: collapse; }}
+    .index-table th, .index-table td {{ border: 1px solid #999; padding: 4px 10px; text-align: center; }}
+    {css}
+</style></head>
+<body>
+<h2>{title}</h2>
+{body}
+</body></html>
+"""
+
+def day_total_html(fee, back_a, back_b, type_counts):
+    return (
+        f'<div class="day-total">💰 本日の合計: ゲーム代 <b>{fee}</b> 枚<br>'
+        f'🎁 バック: A客: <b>{back_a}</b> 枚 / B客: <b>{back_b}</b> 枚<br>'
+        f'📊 内訳: ' + " / ".join(f"{t}:{type_counts[t]}" for t in TYPE_LIST) + '</div>'
+    )
+
+def render_table_day(day, table_no, df_day, out_dir):
+    # 1日1卓分の HTML / CSV を書き、(精算の行, セットごとの行) を返す（子プロセスで動く）
+    fee, back_a, back_b, type_counts = calculate_day_totals(df_day)
+    sheets, set_rows = [], []
+    for _, set_no, subset in iter_sheet_sets(df_day):
+        sheets.append(set_sheet_html(table_no, set_no, subset))
+        set_fee, set_types = calculate_set_summary(subset)
+        set_rows.append({
+            "論理日付": day, "TableNo": table_no, "SetNo": int(set_no),
+            "ゲーム数": len(subset), "ゲーム代": set_fee, **set_types,
+        })
+
+    day_dir = os.path.join(out_dir, day.isoformat())
+    os.makedirs(day_dir, exist_ok=True)
+    name = f"table{table_no}"
+    page = PAGE_TEMPLATE.format(
+        title=f"{day.isoformat()} {table_no}卓", css=PAPER_SHEET_CSS,
+        body=day_total_html(fee, back_a, back_b, type_counts) + "\n".join(sheets),
+    )
+    with open(os.path.join(day_dir, f"{name}.html"), "w", encoding="utf-8") as f:
+        f.write(page)
+    df_day.sort_values("DailyNo")[GAME_CSV_COLS].to_csv(
+        os.path.join(day_dir, f"{name}.csv"), index=False, encoding="utf-8-sig",
+    )
+
+    settlement_row = {
+        "論理日付": day, "TableNo": table_no, "ゲーム数": len(df_day),
+        "ゲーム代": fee, "バックA": back_a, "バックB": back_b, **type_counts,
+    }
+    return settlement_row, set_rows
+
+def write_day_index(day, rows, out_dir):
+    # その日の卓ごとの合計とページへのリンク
+    lines = ['<table class="index-table"><tr><th>卓</th><th>ゲーム数</th><th>ゲーム代</th><th>バック A/B</th></tr>']
+    for r in rows:
+        link = f'<a href="table{r["TableNo"]}.html">{r["TableNo"]}卓</a>'
+        lines.append(
+            f'<tr><td>{link}</td><td>{r["ゲーム数"]}</td><td>{r["ゲーム代"]} 枚</td>'
+            f'<td>{r["バックA"]} / {r["バックB"]}</td></tr>'
+        )
+    lines.append("</table>")
+    title = html.escape(f"{day.isoformat()} 日次レポート")
+    with open(os.path.join(out_dir, day.isoformat(), "index.html"), "w", encoding="utf-8") as f:
+        f.write(PAGE_TEMPLATE.format(title=title, css="", body="\n".join(lines)))
+
+def generate_reports(df, start, end, out_dir=REPORT_DIR, workers=None):
+    # start〜end の全日・全卓を作り、(精算表, セットごとの集計) を返す
+    target = df[(df["論理日付"] >= start) & (df["論理日付"] <= end)]
+    jobs = [(day, int(table_no), df_day) for (day, table_no), df_day in target.groupby(["論理日付", "TableNo"], sort=True)]
+    if not jobs:
+        return pd.DataFrame(columns=SETTLEMENT_COLS), pd.DataFrame(columns=SET_SUMMARY_COLS)
+
+    if workers == 1 or len(jobs) == 1:
+        results = [render_table_day(day, table_no, df_day, out_dir) for day, table_no, df_day in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_table_day, day, table_no, df_day, out_dir) for day, table_no, df_day in jobs]
+            results = [f.result() for f in futures]
+
+    settlement = pd.DataFrame([r[0] for r in results], columns=SETTLEMENT_COLS)
+    sets = pd.DataFrame([row for r in results for row in r[1]], columns=SET_SUMMARY_COLS)
+    for day, rows in settlement.groupby("論理日付", sort=True):
+        write_day_index(day, rows.to_dict("records"), out_dir)
+        day_dir = os.path.join(out_dir, day.isoformat())
+        rows.to_csv(os.path.join(day_dir, "settlement.csv"), index=False, encoding="utf-8-sig")
+        sets[sets["論理日付"] == day].to_csv(os.path.join(day_dir, "sets.csv"), index=False, encoding="utf-8-sig")
+    return settlement, sets
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="日次の成績表・精算レポートを書き出す")
+    parser.add_argument("--date", help="対象の論理日付 (YYYY-MM-DD)。省略時は今日")
+    parser.add_argument("--end", help="期間の最終日 (省略時は --date の1日だけ)")
+    parser.add_argument("--out", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="並行して作るプロセス数 (既定は CPU 数)")
+    args = parser.parse_args(argv)
+
+    try:
+        start = date.fromisoformat(args.date) if args.date else logical_today()
+        end = date.fromisoformat(args.end) if args.end else start
+        df, _ = ScoreSource().get()
+    except (ValueError, FileNotFoundError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+
+    settlement, _ = generate_reports(df, start, end, args.out, args.workers)
+    if settlement.empty:
+        print(f"{start}〜{end} の対局はありません")
+        return 0
+    print(
+        f"{settlement['論理日付'].nunique()} 日 / {len(settlement)} 卓分を {args.out} に書き出しました"
+        f"（ゲーム代 合計 {int(settlement['ゲーム代'].sum())} 枚）"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
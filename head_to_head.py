@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from score_stats import SEATS
+
+# ==========================================
+# 対戦成績 (2人ずつの同卓数・上位回数)
+# 全対局を1回の numpy 処理で集計し、行ごとに圧縮した疎行列 (CSR) で持つ
+# ==========================================
+SEAT_PAIRS = [(0, 1), (0, 2), (1, 2)]
+
+class HeadToHead:
+    def __init__(self, names, indptr, indices, shared, wins):
+        self.names = names                      # id -> 名前
+        self.ids = {n: i for i, n in enumerate(names)}
+        self.indptr = indptr                    # 行 i の相手は indices[indptr[i]:indptr[i+1]]
+        self.indices = indices                  # 相手の id（行内で昇順）
+        self.shared = shared                    # 同卓した回数
+        self.wins = wins                        # 行の人が相手より上の着順だった回数
+
+    @classmethod
+    def build(cls, df):
+        if df.empty:
+            return cls([], np.zeros(1, dtype=np.int64), *(np.zeros(0, dtype=np.int64) for _ in range(3)))
+
+        seat_names = df[[f"{s}さん" for s in SEATS]].astype(str).to_numpy()
+        ranks = df[[f"{s}着順" for s in SEATS]].apply(pd.to_numeric, errors="coerce").fillna(0).astype(int).to_numpy()
+        codes, names = pd.factorize(seat_names.ravel())
+        codes = codes.reshape(seat_names.shape)
+        codes[(seat_names == "") | (ranks <= 0)] = -1
+        n = len(names)
+
+        rows, cols, win = [], [], []
+        for p, q in SEAT_PAIRS:
+            valid = (codes[:, p] >= 0) & (codes[:, q] >= 0) & (codes[:, p] != codes[:, q])
+            a, b = codes[valid, p], codes[valid, q]
+            a_wins = ranks[valid, p] < ranks[valid, q]
+            rows += [a, b]
+            cols += [b, a]
+            win += [a_wins, ~a_wins]
+
+        keys = np.concatenate(rows).astype(np.int64) * n + np.concatenate(cols)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        shared = np.bincount(inverse).astype(np.int64)
+        wins = np.bincount(inverse, weights=np.concatenate(win)).astype(np.int64)
+        row_ids = uniq // n
+        indptr = np.searchsorted(row_ids, np.arange(n + 1))
+        return cls(list(names), indptr, (uniq % n).astype(np.int64), shared, wins)
+
+    def pair(self, name_a, name_b):
+        # (同卓数, A が上, B が上)
+        i, j = self.ids.get(name_a), self.ids.get(name_b)
+        if i is None or j is None:
+            return 0, 0, 0
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        k = lo + np.searchsorted(self.indices[lo:hi], j)
+        if k >= hi or self.indices[k] != j:
+            return 0, 0, 0
+        return int(self.shared[k]), int(self.wins[k]), int(self.shared[k] - self.wins[k])
+
+    def row(self, name):
+        # 1人分の全対戦相手との成績
+        i = self.ids.get(name)
+        cols = ["相手", "同卓数", "勝ち", "負け", "勝率"]
+        if i is None:
+            return pd.DataFrame(columns=cols)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        shared = self.shared[lo:hi]
+        wins = self.wins[lo:hi]
+        res = pd.DataFrame({
+            "相手": [self.names[j] for j in self.indices[lo:hi]],
+            "同卓数": shared,
+            "勝ち": wins,
+            "負け": shared - wins,
+            "勝率": wins / shared * 100,
+        })
+        return res.sort_values(["同卓数", "相手"], ascending=[False, True]).reset_index(drop=True)
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+# ==========================================
+# 操作ログの手元コピー (SQLite)
+# シートのログは追記だけなので、増えた行だけを取り込み、絞り込みと件数の計算は SQL に任せる
+# ==========================================
+LOG_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", "logs.sqlite")
+LOG_FIELDS = ["日時", "操作", "GameNo", "詳細"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    sheet_row INTEGER PRIMARY KEY,
+    ts TEXT,
+    logical_date TEXT,
+    action TEXT,
+    game_no INTEGER,
+    game_no_text TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_date ON logs (logical_date, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_action ON logs (action, logical_date);
+CREATE INDEX IF NOT EXISTS idx_logs_game ON logs (game_no);
+"""
+
+def _text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+def _to_record(sheet_row, ts, action, game_no, detail):
+    ts = _text(ts)
+    # 朝9時切替の論理日付（1晩の操作が同じ日付にまとまる）
+    parsed = pd.to_datetime(ts, errors="coerce")
+    logical = "" if pd.isna(parsed) else (parsed - pd.Timedelta(hours=9)).strftime("%Y-%m-%d")
+    game_text = _text(game_no)
+    try:
+        game_int = int(float(game_text))
+        game_text = str(game_int)
+    except ValueError:
+        game_int = None
+    return (int(sheet_row), ts, logical, _text(action), game_int, game_text, _text(detail))
+
+class LogStore:
+    def __init__(self, path=LOG_DB_PATH):
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+        except (OSError, sqlite3.Error):
+            self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    # --- 取り込み ---
+    def last_row(self):
+        # (最後に取り込んだシート行, その行の値)。空なら (1, None)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT sheet_row, ts, action, game_no_text, detail FROM logs ORDER BY sheet_row DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return 1, None
+        return row[0], list(row[1:])
+
+    def append(self, start_row, rows):
+        # rows は LOG_FIELDS 順の値のリスト。start_row から順にシート行を振る
+        records = [_to_record(start_row + i, *(list(r) + [""] * 4)[:4]) for i, r in enumerate(rows)]
+        records = [r for r in records if any(r[i] for i in (1, 3, 5, 6))]
+        with self._lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+        return len(records)
+
+    def replace(self, df):
+        # シート全体から作り直す（index + 2 がシート行）
+        cols = [df[c] if c in df.columns else pd.Series("", index=df.index) for c in LOG_FIELDS]
+        rows = list(zip(*cols))
+        records = [_to_record(i + 2, *r) for i, r in zip(df.index, rows)]
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM logs")
+            self.db.executemany("INSERT INTO logs VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+
+    # --- 検索 ---
+    def _where(self, start=None, end=None, actions=None, game_no=None):
+        clauses, params = [], []
+        if start:
+            clauses.append("logical_date >= ?")
+            params.append(str(start))
+        if end:
+            clauses.append("logical_date <= ?")
+            params.append(str(end))
+        if actions:
+            clauses.append(f"action IN ({', '.join('?' * len(actions))})")
+            params += list(actions)
+        if game_no is not None:
+            clauses.append("game_no = ?")
+            params.append(int(game_no))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM logs{where}", params).fetchone()[0]
+
+    def query(self, limit=100, offset=0, **filters):
+        # 新しい順に1ページ分だけ返す
+        where, params = self._where(**filters)
+        sql = (
+            f"SELECT ts, action, game_no_text, detail FROM logs{where}"
+            " ORDER BY ts DESC, sheet_row DESC LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self.db.execute(sql, params + [int(limit), int(offset)]).fetchall()
+        return pd.DataFrame(rows, columns=LOG_FIELDS)
+
+    def actions(self):
+        with self._lock:
+            rows = self.db.execute("SELECT DISTINCT action FROM logs WHERE action != '' ORDER BY action").fetchall()
+        return [r[0] for r in rows]
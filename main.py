@@ -1,10 +1,43 @@
+import time
+_SCRIPT_START = time.perf_counter()
+
+import os
 import streamlit as st
 import pandas as pd
-import altair as alt
-import streamlit.components.v1 as components
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta, timezone
+from streamlit.logger import get_logger
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_gsheets import GSheetsConnection
+from head_to_head import HeadToHead
+from log_store import LogStore
+from name_index import NameIndex, normalize_name
+from paper_sheet import iter_sheet_sets, set_sheet_html
+from ranking_board import (
+    get_rank_intervals, get_range_rankings, get_ranking_snapshot, get_ratings, render_ranking_tabs,
+)
+from score_events import (
+    EVENT_COLS, EVENT_DELETE, EVENT_INSERT, EVENT_UPDATE, EventHistory, inverse_event, make_event,
+    parse_event_row, state_to_df,
+)
+from score_data import (
+    EXPECTED_COLS, HOME_SHOP, SCORE_PARTITION, SHEET_SCORE, SHOPS, STORAGE_BACKEND, TABLE_NOS, TOMBSTONE_COL, live_rows,
+    merge_into_partitions, missing_score_cols, partition_names, partition_of, shape_score_df, split_partitions,
+    worksheet_titles,
+)
+from score_stats import (
+    CUBE_DIM_LABELS, CUBE_DIMS, RANKING_VIEWS, Leaderboard, StatsCube, data_version, filter_period,
+    logical_today, merge_rollups, period_key, player_rollup, rollup_totals,
+)
+from settlement import SettlementLedger, calculate_day_totals
+from storage import SqliteStore
+from streaks import (
+    FIVE_WIN_MIN, FIVE_WIN_NOTE, StreakTracker, ordered_ranks, session_top_streak, streak_table,
+)
+from trends import TREND_MAX_POINTS, TREND_METHODS, TREND_WINDOWS, downsample_trend, player_trend
+
+logger = get_logger(__name__)
 
 # ==========================================
 # 1. ページ設定 & デザイン調整
@@ -132,32 +165,221 @@ def check_password():
             st.error("パスワードが違います")
     return False
 
-if not check_password():
-    st.stop()
+def log_first_render(view):
+    # セッションごとに、各画面が最初に描画されるまでの時間をログに残す
+    logged = st.session_state.setdefault("ttfr_logged", set())
+    if view in logged:
+        return
+    logged.add(view)
+    logger.info("time-to-first-render [main:%s] %.0f ms", view, (time.perf_counter() - _SCRIPT_START) * 1000)
 
 # ==========================================
 # 3. データ管理関数 (安全装置付き)
 # ==========================================
-SHEET_SCORE = "score"
 SHEET_MEMBER = "members"
 SHEET_LOG = "logs"
+SHEET_EVENTS = "events"
 
-# 期待する列定義
-EXPECTED_COLS = [
-    "GameNo", "TableNo", "SetNo", "日時", "備考",
-    "Aさん", "Aタイプ", "A着順",
-    "Bさん", "Bタイプ", "B着順",
-    "Cさん", "Cタイプ", "C着順"
-]
+LOG_COLS = ["日時", "操作", "GameNo", "詳細"]
+
+NAME_SUGGEST_LIMIT = 30
+
+# 保存先 (STORAGE_BACKEND)・成績シートの分割 (SCORE_PARTITION)・店舗 (SHOPS) は score_data.py で決める
+REPLICATE_TO_GSHEETS = os.environ.get("SCORE_REPLICATE_GSHEETS", "1") == "1"
+PARTITION_TTL = 60
+
+# 画面表示でまとめて読み込むシート（分割しているときの成績は別にシートごとにキャッシュする）
+CACHED_SHEETS = (SHEET_SCORE, SHEET_MEMBER, SHEET_LOG) if SCORE_PARTITION == "none" else (SHEET_MEMBER, SHEET_LOG)
 
+@st.cache_resource
 def get_conn():
-    return st.connection("gsheets", type=GSheetsConnection)
+    # 通常の画面は先頭の店舗 (HOME_SHOP) のスプレッドシートを使う
+    if STORAGE_BACKEND == "sqlite" and not REPLICATE_TO_GSHEETS:
+        return None
+    return st.connection(SHOPS[HOME_SHOP], type=GSheetsConnection)
+
+@st.cache_resource
+def get_shop_conn(conn_name):
+    return st.connection(conn_name, type=GSheetsConnection)
+
+@st.cache_resource
+def get_local_store():
+    # SQLite を使うときだけ作る。中身が空なら最初の1回だけスプレッドシートから取り込む
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    store = SqliteStore()
+    conn = get_conn()
+    if conn is not None and store.is_empty(SHEET_SCORE):
+        for name in CACHED_SHEETS:
+            try:
+                store.write(name, _read_sheet(conn, name))
+            except Exception as e:
+                logger.warning("initial import of sheet '%s' failed: %s", name, e)
+    return store
+
+@st.cache_resource
+def get_replicator():
+    return {"executor": ThreadPoolExecutor(max_workers=1), "pending": set(), "lock": threading.Lock()}
 
-@st.cache_data(ttl=60)
-def fetch_data_cached(_conn, sheet_name):
-    return _conn.read(worksheet=sheet_name, ttl=0)
+def replicate_sheet(name):
+    # 手元の内容をスプレッドシートにも書き写す。画面は待たせず、続けて書いた分は1回にまとめる
+    conn = get_conn()
+    if conn is None:
+        return
+    rep = get_replicator()
+    with rep["lock"]:
+        if name in rep["pending"]:
+            return
+        rep["pending"].add(name)
+
+    def push():
+        with rep["lock"]:
+            rep["pending"].discard(name)
+        try:
+            conn.update(worksheet=name, data=get_local_store().read(name))
+        except Exception as e:
+            logger.warning("replication of sheet '%s' failed: %s", name, e)
+
+    rep["executor"].submit(push)
+
+def write_sheet(conn, name, df):
+    # シート全体を書き換える（SQLite のときは手元に書いてからシートへ書き写す）
+    store = get_local_store()
+    if store is None:
+        conn.update(worksheet=name, data=df)
+        return
+    store.write(name, df)
+    replicate_sheet(name)
+
+def run_parallel(tasks):
+    # {名前: (関数, 引数...)} をスレッドで同時に実行し、{名前: (結果, 例外)} を返す
+    ctx = get_script_run_ctx()
+
+    def run(func, *args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+
+    with ThreadPoolExecutor(max_workers=max(len(tasks), 1)) as ex:
+        futures = {key: ex.submit(run, *task) for key, task in tasks.items()}
+    return {key: (None if f.exception() else f.result(), f.exception()) for key, f in futures.items()}
+
+def _values_to_df(values):
+    # values_batch_get の結果 (1行目がヘッダー) を DataFrame にする
+    if not values:
+        return pd.DataFrame()
+    header = [str(h) for h in values[0]]
+    width = len(header)
+    rows = [list(r[:width]) + [""] * (width - len(r)) for r in values[1:]]
+    df = pd.DataFrame(rows, columns=header)
+    # 末尾の空行だけ落とす（途中の空行は残し、行番号 = index + 2 の対応を保つ）
+    filled = (df != "").any(axis=1).to_numpy().nonzero()[0]
+    df = df.iloc[:filled[-1] + 1] if len(filled) else df.iloc[:0]
+    return df.mask(df == "")
+
+def _read_sheet(conn, sheet_name):
+    return conn.read(worksheet=sheet_name, ttl=0)
+
+def read_sheets(conn, sheet_names, local=True):
+    # 複数シートを1回の通信でまとめて取得する。できない接続ではスレッドで同時に読む
+    # 戻り値は {シート名: DataFrame または 例外}。local=False なら手元の SQLite ではなく必ず conn から読む（他店舗用）
+    store = get_local_store() if local else None
+    if store is not None:
+        return {name: store.read(name) for name in sheet_names}
+    client = conn.client
+    if hasattr(client, "_open_spreadsheet"):
+        try:
+            res = client._open_spreadsheet().values_batch_get([f"'{name}'" for name in sheet_names])
+            ranges = res.get("valueRanges", [])
+            return {name: _values_to_df(vr.get("values", [])) for name, vr in zip(sheet_names, ranges)}
+        except Exception:
+            pass
+
+    results = run_parallel({name: (_read_sheet, conn, name) for name in sheet_names})
+    return {name: (df if err is None else err) for name, (df, err) in results.items()}
+
+# 再起動直後の表示用に、最後に取得した score / members をディスクに残しておく
+# score は stats_api.py / daily_report.py も読むので、読み直したときと保存したときにも書き換える
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+SNAPSHOT_SHEETS = (SHEET_SCORE, SHEET_MEMBER)
+
+def save_snapshot(sheets):
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        for name in SNAPSHOT_SHEETS:
+            df = sheets.get(name)
+            if isinstance(df, pd.DataFrame):
+                path = os.path.join(SNAPSHOT_DIR, f"{name}.pkl")
+                df.to_pickle(path + ".tmp")
+                os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning("snapshot save failed: %s", e)
+
+def save_score_snapshot(df):
+    # SQLite のときは stats_api.py が直接読むので書かない
+    if STORAGE_BACKEND != "sqlite":
+        save_snapshot({SHEET_SCORE: df})
+
+def load_snapshot():
+    snapshot = {}
+    for name in SNAPSHOT_SHEETS:
+        path = os.path.join(SNAPSHOT_DIR, f"{name}.pkl")
+        try:
+            snapshot[name] = pd.read_pickle(path)
+        except Exception:
+            continue
+    return snapshot
+
+@st.cache_resource(ttl=60)
+def fetch_sheets_cached(_conn):
+    # 読めなかったシートは例外のまま入る。覚えたままにしないよう、使う側で見つけたらすぐ捨てる
+    sheets = read_sheets(_conn, CACHED_SHEETS)
+    save_snapshot(sheets)
+    return sheets
+
+def drop_failed_sheets(sheets):
+    # 読めなかったシートがあればキャッシュごと捨てる（次の呼び出しで読み直す）
+    if any(isinstance(df, Exception) for df in sheets.values()):
+        fetch_sheets_cached.clear()
+
+@st.cache_resource
+def start_warm_up():
+    # サーバー起動後に一度だけ実行：スナップショットを読み込み、裏でシートの取得を始める
+    t0 = time.perf_counter()
+    state = {"snapshot": load_snapshot(), "done": threading.Event()}
+    conn = get_conn()
+
+    def warm():
+        try:
+            drop_failed_sheets(fetch_sheets_cached(conn))
+        except Exception as e:
+            logger.warning("warm-up fetch failed: %s", e)
+        finally:
+            state["done"].set()
+            logger.info("warm-up finished in %.0f ms", (time.perf_counter() - t0) * 1000)
+
+    threading.Thread(target=warm, daemon=True).start()
+    return state
+
+def fetch_data_cached(conn, sheet_name):
+    # 起動直後の取得が終わるまでは、前回のスナップショットで先に表示する
+    warm = start_warm_up()
+    if not warm["done"].is_set() and sheet_name in warm["snapshot"]:
+        return warm["snapshot"][sheet_name].copy()
+
+    # 全画面で共有しているキャッシュを壊さないよう、取り出すたびにコピーを返す
+    sheets = fetch_sheets_cached(conn)
+    data = sheets.get(sheet_name)
+    if data is None:
+        return conn.read(worksheet=sheet_name, ttl=0)
+    if isinstance(data, Exception):
+        drop_failed_sheets(sheets)
+        raise data
+    return data.copy()
 
 def fetch_data_fresh(conn, sheet_name):
+    store = get_local_store()
+    if store is not None:
+        return store.read(sheet_name)
     max_retries = 3
     for i in range(max_retries):
         try:
@@ -169,56 +391,182 @@ def fetch_data_fresh(conn, sheet_name):
             else:
                 raise
 
+# --- 成績シートの分割 ---
+@st.cache_resource
+def get_partition_cache():
+    # {"names": (取得時刻, 成績シート名の一覧, 全シート名), "sheets": {シート名: (取得時刻, 生データ)}}
+    # 書き込んだシートの分だけを捨てる
+    return {"names": None, "sheets": {}}
+
+def list_score_partitions(conn, fresh=False):
+    if SCORE_PARTITION == "none":
+        return partition_names()
+    # 分割しているときはシートの一覧からも探す。一覧もシートと同じ間隔で覚えておく
+    cache = get_partition_cache()
+    now = time.time()
+    if fresh or cache["names"] is None or now - cache["names"][0] > PARTITION_TTL:
+        titles = worksheet_titles(conn)
+        if titles is None and SCORE_PARTITION == "table_month":
+            # 一覧が取れないと既存のシートを見落として上書きしかねないので止める
+            raise RuntimeError("卓・月ごとの分割にはサービスアカウント接続が必要です")
+        cache["names"] = (now, partition_names(titles), titles)
+    return list(cache["names"][1])
+
+def existing_score_partitions(conn):
+    # 成績シートのうち、実際にスプレッドシートにあるもの（一覧が取れなければ全部）
+    names = list_score_partitions(conn)
+    titles = get_partition_cache()["names"][2] if SCORE_PARTITION != "none" else None
+    return [n for n in names if titles is None or n in titles]
+
+def invalidate_partitions(names, listing=False):
+    cache = get_partition_cache()
+    for name in names:
+        cache["sheets"].pop(name, None)
+    if listing:
+        cache["names"] = None
+
+def fetch_score_raw(conn, fresh=False):
+    # 成績の生データ。分割しているときは古くなったシートだけをまとめて読み直し、
+    # シート名・シート行をつけてつなぐ
+    if SCORE_PARTITION == "none":
+        if not fresh:
+            return fetch_data_cached(conn, SHEET_SCORE)
+        df = fetch_data_fresh(conn, SHEET_SCORE)
+        save_score_snapshot(df)
+        return df
+
+    names = list_score_partitions(conn, fresh)
+    cache = get_partition_cache()["sheets"]
+    now = time.time()
+    stale = [n for n in names if fresh or n not in cache or now - cache[n][0] > PARTITION_TTL]
+    if stale:
+        for name, df in read_sheets(conn, stale).items():
+            cache[name] = (now, _partition_or_empty(df))
+
+    frames = {name: cache[name][1] for name in names}
+    if fresh:
+        # 保存するときに「この実行で読んだ内容」と比べて、変えたシートだけを書くための控え
+        st.session_state["score_read_base"] = {name: _partition_signature(live_rows(df)) for name, df in frames.items()}
+    df_raw = join_partitions(frames)
+    if stale:
+        save_score_snapshot(df_raw)
+    return df_raw
+
+def _partition_or_empty(df):
+    # まだ1局も入っていない卓のシートは空として扱う
+    if isinstance(df, Exception):
+        if type(df).__name__ != "WorksheetNotFound":
+            raise df
+        return pd.DataFrame()
+    return df
+
+def join_partitions(frames):
+    # {シート名: 生データ} にシート名・シート行をつけてつなぐ
+    parts = []
+    for name, df in frames.items():
+        df = df.copy()
+        if df.empty:
+            continue
+        df.columns = df.columns.astype(str).str.strip()
+        df["シート行"] = df.index + 2
+        df["シート名"] = name
+        parts.append(df)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+def _partition_signature(df):
+    # シートから読んだ文字列と保存前の数値を同じ形にそろえて比べる
+    d = df.rename(columns=lambda c: str(c).strip()).reindex(columns=EXPECTED_COLS).fillna("")
+    for col in ["GameNo", "TableNo", "SetNo", "A着順", "B着順", "C着順"]:
+        d[col] = pd.to_numeric(d[col], errors="coerce").fillna(0).astype(int)
+    d["日時"] = pd.to_datetime(d["日時"], errors="coerce").astype(str)
+    return len(d), int(pd.util.hash_pandas_object(d.astype(str), index=False).sum())
+
+def write_score_partition(conn, name, df):
+    try:
+        conn.update(worksheet=name, data=df)
+    except Exception as e:
+        if type(e).__name__ != "WorksheetNotFound":
+            raise
+        conn.create(worksheet=name, data=df)
+
+def save_score_partitions(conn, df):
+    # 卓 (・月) ごとに分け、この実行で読んだときから内容が変わったシートだけを並行して書き直す
+    # （他の人が書いた直後でキャッシュにないシートを、手元の古い内容で上書きしないように）
+    base = st.session_state.pop("score_read_base", None)
+    if base is None:
+        fetch_score_raw(conn, fresh=True)
+        base = st.session_state.pop("score_read_base")
+    groups = split_partitions(df)
+    tasks = {}
+    for name in set(base) | set(groups):
+        part = groups.get(name, pd.DataFrame(columns=EXPECTED_COLS))[EXPECTED_COLS]
+        if _partition_signature(part) == base.get(name, _partition_signature(part.iloc[:0])):
+            continue
+        tasks[name] = (write_score_partition, conn, name, part)
+
+    results = run_parallel(tasks)
+    # 新しいシートを作ったときはシートの一覧も読み直す
+    invalidate_partitions(tasks, listing=any(name not in base for name in tasks))
+    errors = [f"{name}: {err}" for name, (_, err) in results.items() if err is not None]
+    if errors:
+        raise RuntimeError("一部のシートに保存できませんでした (" + "; ".join(errors) + ")")
+
+def migrate_score_to_partitions():
+    # 分割を有効にする前の score シートの対局を卓 (・月) ごとのシートへ写す（一度だけ実行する）
+    # 分割後のシートに同じ GameNo があるものは写さない。元の score シートはそのまま残す
+    conn = get_conn()
+    try:
+        df_legacy = conn.read(worksheet=SHEET_SCORE, ttl=0)
+    except Exception as e:
+        if type(e).__name__ == "WorksheetNotFound":
+            return 0
+        raise
+    if df_legacy.empty:
+        return 0
+    df_legacy.columns = df_legacy.columns.astype(str).str.strip()
+
+    df_raw = fetch_score_raw(conn, fresh=True)
+    st.session_state.pop("score_read_base", None)
+    existing = {name: part for name, part in df_raw.groupby("シート名")} if not df_raw.empty else {}
+    merged = merge_into_partitions(df_legacy, existing)
+    if not merged:
+        return 0
+
+    results = run_parallel({name: (write_score_partition, conn, name, rows) for name, rows in merged.items()})
+    invalidate_partitions(merged, listing=True)
+    errors = [f"{name}: {err}" for name, (_, err) in results.items() if err is not None]
+    if errors:
+        raise RuntimeError("一部のシートに保存できませんでした (" + "; ".join(errors) + ")")
+    return sum(len(rows) - len(live_rows(existing.get(name, pd.DataFrame()))) for name, rows in merged.items())
+
 # --- 【修正版】安全なデータ処理ロジック ---
 def process_score_df(df):
     # 1. データが空の場合
     if df.empty:
-        return pd.DataFrame(columns=EXPECTED_COLS)
-
-    # 2. 列名の空白除去（"TableNo "などを"TableNo"に自動修正）
-    # これにより、見えない空白によるエラーは撲滅されます。
-    df.columns = df.columns.astype(str).str.strip()
+        return shape_score_df(df)
 
-    # 3. それでも必須列が足りない場合（列名変更などの致命的な状態）
+    # 2. 必須列が足りない場合（列名変更などの致命的な状態）
     # 勝手に0埋めせず、空のDataFrameを返して呼び出し元でエラー停止させる
-    missing_cols = [c for c in EXPECTED_COLS if c not in df.columns]
+    # （列名の前後の空白は無視するので、"TableNo " などは問題なし）
+    missing_cols = missing_score_cols(df)
     if missing_cols:
         st.error(f"⚠️ スプレッドシートの形式が正しくありません。以下の列が見つかりません: {missing_cols}")
         st.error("スプレッドシートの1行目を変更していませんか？確認してください。")
         # 安全のため、処理を中断できる空データを返す（保存処理側でブロックされる）
         return pd.DataFrame(columns=EXPECTED_COLS)
 
-    # 4. 数値変換
-    numeric_cols = ["GameNo", "TableNo", "SetNo", "A着順", "B着順", "C着順"]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-
-    df = df.fillna("")
-
-    # 5. 日付計算
-    if "日時" in df.columns:
-        df["日時Obj"] = pd.to_datetime(df["日時"], errors='coerce')
-        df["日時Obj"] = df["日時Obj"].fillna(pd.Timestamp("1900-01-01"))
-        df["論理日付"] = (df["日時Obj"] - timedelta(hours=9)).dt.date
-        df = df.sort_values(["論理日付", "TableNo", "日時Obj"])
-        
-        if not df.empty:
-            df["DailyNo"] = df.groupby(["論理日付", "TableNo"]).cumcount() + 1
-        else:
-            df["DailyNo"] = []
-    else:
-        df["DailyNo"] = []
-        
-    return df
+    # 3. シート行の控え・論理削除の除外・数値変換・論理日付 (score_data.py と共通)
+    return shape_score_df(df)
 
 def load_score_data():
     conn = get_conn()
     try:
-        df = fetch_data_cached(conn, SHEET_SCORE)
+        df = fetch_score_raw(conn)
         # キャッシュが古くて列がない場合のリトライ処理
         if not df.empty and "TableNo" not in df.columns.astype(str).str.strip():
-            fetch_data_cached.clear()
-            df = fetch_data_cached(conn, SHEET_SCORE)
+            fetch_sheets_cached.clear()
+            get_partition_cache.clear()
+            df = fetch_score_raw(conn)
     except:
         return pd.DataFrame(columns=EXPECTED_COLS)
     
@@ -227,7 +575,7 @@ def load_score_data():
 def load_score_data_fresh():
     conn = get_conn()
     try:
-        df = fetch_data_fresh(conn, SHEET_SCORE)
+        df = fetch_score_raw(conn, fresh=True)
     except Exception as e:
         st.error(f"データの読み込みに失敗しました: {e}")
         st.stop()
@@ -249,39 +597,522 @@ def save_score_data(df):
         df_to_save["GameNo"] = pd.to_numeric(df_to_save["GameNo"], errors='coerce').fillna(0)
         df_to_save = df_to_save.sort_values("GameNo")
     
-    conn.update(worksheet=SHEET_SCORE, data=df_to_save)
+    if SCORE_PARTITION != "none":
+        save_score_partitions(conn, df_to_save)
+    else:
+        write_sheet(conn, SHEET_SCORE, df_to_save)
+    save_score_snapshot(df_to_save)
     time.sleep(1)
-    fetch_data_cached.clear()
+    fetch_sheets_cached.clear()
+
+# --- 行単位の更新・論理削除 ---
+def _to_cell(val):
+    # numpy の数値はそのままだと gspread で送れないので Python の値に直す
+    return val.item() if hasattr(val, "item") else val
+
+def get_worksheet(conn, sheet_name):
+    # サービスアカウント接続のときだけ gspread の Worksheet を直接扱える（SQLite のときは使わない）
+    if conn is None or get_local_store() is not None:
+        return None
+    client = conn.client
+    if not hasattr(client, "_select_worksheet"):
+        return None
+    return client._select_worksheet(worksheet=sheet_name)
+
+def locate_score_row(ws, header, game_no, hint_row=None):
+    # まずキャッシュ上の行番号を1行だけ読んで確かめ、ずれていれば GameNo 列だけを検索する
+    # 戻り値は (シート行, その行の値)。見つからない・削除済みなら (None, None)
+    game_col = header.index("GameNo")
+    tomb_col = header.index(TOMBSTONE_COL) if TOMBSTONE_COL in header else None
+
+    def is_live(values):
+        try:
+            same_game = int(float(values[game_col])) == int(game_no)
+        except (ValueError, IndexError):
+            return False
+        deleted = tomb_col is not None and len(values) > tomb_col and str(values[tomb_col]).strip() != ""
+        return same_game and not deleted
+
+    if hint_row and hint_row >= 2:
+        values = ws.row_values(int(hint_row))
+        if is_live(values):
+            return int(hint_row), values
+
+    for i, val in enumerate(ws.col_values(game_col + 1)[1:], start=2):
+        try:
+            if int(float(val)) != int(game_no):
+                continue
+        except ValueError:
+            continue
+        values = ws.row_values(i)
+        if is_live(values):
+            return i, values
+    return None, None
+
+def read_score_row(game_no, hint_row=None, sheet_name=None):
+    # 書き換える直前の1行を読み直す（変更履歴・精算台帳には、キャッシュではなくこの内容を変更前として渡す）
+    # 見つからない・削除済みなら None
+    store = get_local_store()
+    if store is not None:
+        df = store.read(
+            SHEET_SCORE, "WHERE _row = (SELECT row_id FROM score_games WHERE game_no = ? ORDER BY row_id LIMIT 1)",
+            [int(game_no)],
+        )
+        return df.iloc[0].to_dict() if not df.empty else None
+
+    conn = get_conn()
+    ws = get_worksheet(conn, sheet_name or SHEET_SCORE)
+    if ws is None:
+        df_latest = load_score_data_fresh()
+        match = df_latest[df_latest["GameNo"] == game_no]
+        return match.iloc[0].to_dict() if not match.empty else None
+
+    header = [str(h).strip() for h in ws.row_values(1)]
+    _, values = locate_score_row(ws, header, game_no, hint_row)
+    if values is None:
+        return None
+    values = values + [""] * (len(header) - len(values))
+    return dict(zip(header, values))
+
+def update_score_row(game_no, new_data, hint_row=None, sheet_name=None):
+    # 対象の1行だけを書き換える。見つからなければ False
+    store = get_local_store()
+    if store is not None:
+        updated = store.update_score_row(game_no, new_data)
+        if updated:
+            replicate_sheet(SHEET_SCORE)
+            fetch_sheets_cached.clear()
+        return updated
+
+    conn = get_conn()
+    sheet_name = sheet_name or partition_of(new_data.get("TableNo"), new_data.get("日時"))
+    ws = get_worksheet(conn, sheet_name)
+    if ws is None:
+        # 行単位で書き込めない接続では従来どおり全体を書き直す
+        fetch_sheets_cached.clear()
+        df_latest = load_score_data_fresh()
+        if game_no not in df_latest["GameNo"].values:
+            return False
+        idx = df_latest[df_latest["GameNo"] == game_no].index[0]
+        df_latest.loc[idx, list(new_data.keys())] = list(new_data.values())
+        save_score_data(df_latest)
+        return True
+
+    from gspread.utils import rowcol_to_a1
+
+    header = [str(h).strip() for h in ws.row_values(1)]
+    sheet_row, current = locate_score_row(ws, header, game_no, hint_row)
+    if sheet_row is None:
+        return False
+
+    if any(col not in header for col in EXPECTED_COLS):
+        st.error("スプレッドシートの形式が正しくありません。処理を中止しました。")
+        st.stop()
+
+    # シートの列順に並べ、知らない列は今の値のまま残す
+    width = max(header.index(col) for col in EXPECTED_COLS) + 1
+    current = current + [""] * (width - len(current))
+    values = []
+    for i, col in enumerate(header[:width]):
+        val = new_data[col] if col in new_data else current[i]
+        values.append(_to_cell(val))
+
+    cell_range = f"{rowcol_to_a1(sheet_row, 1)}:{rowcol_to_a1(sheet_row, width)}"
+    ws.update(range_name=cell_range, values=[values], value_input_option="USER_ENTERED")
+    invalidate_partitions([sheet_name])
+    fetch_sheets_cached.clear()
+    return True
+
+def soft_delete_score_row(game_no, hint_row=None, sheet_name=None):
+    # 行は消さずに削除日時を記録する（読み込み時に除外され、整理時にまとめて消える）
+    store = get_local_store()
+    if store is not None:
+        jst_now = datetime.now(timezone(timedelta(hours=9), 'JST')).strftime("%Y-%m-%d %H:%M:%S")
+        deleted = store.soft_delete_score_row(game_no, jst_now)
+        if deleted:
+            replicate_sheet(SHEET_SCORE)
+            fetch_sheets_cached.clear()
+        return deleted
+
+    conn = get_conn()
+    if sheet_name is None:
+        if SCORE_PARTITION == "none":
+            sheet_name = SHEET_SCORE
+        else:
+            # どのシートにある対局かを読み込み済みのデータから調べる
+            df = load_score_data()
+            match = df[df["GameNo"] == game_no]
+            sheet_name = match["シート名"].iloc[0] if not match.empty else SHEET_SCORE
+    ws = get_worksheet(conn, sheet_name)
+    if ws is None:
+        fetch_sheets_cached.clear()
+        df_latest = load_score_data_fresh()
+        if game_no not in df_latest["GameNo"].values:
+            return False
+        save_score_data(df_latest[df_latest["GameNo"] != game_no])
+        return True
+
+    header = [str(h).strip() for h in ws.row_values(1)]
+    sheet_row, _ = locate_score_row(ws, header, game_no, hint_row)
+    if sheet_row is None:
+        return False
+
+    if TOMBSTONE_COL not in header:
+        header.append(TOMBSTONE_COL)
+        if ws.col_count < len(header):
+            ws.add_cols(len(header) - ws.col_count)
+        ws.update_cell(1, len(header), TOMBSTONE_COL)
+
+    jst_now = datetime.now(timezone(timedelta(hours=9), 'JST')).strftime("%Y-%m-%d %H:%M:%S")
+    ws.update_cell(sheet_row, header.index(TOMBSTONE_COL) + 1, jst_now)
+    invalidate_partitions([sheet_name])
+    fetch_sheets_cached.clear()
+    return True
+
+def compact_score_data():
+    # 論理削除された行を実際に取り除く（全体の書き直しで削除日時の列ごと消える）
+    conn = get_conn()
+    df_raw = fetch_score_raw(conn, fresh=True)
+    df_raw.columns = df_raw.columns.astype(str).str.strip()
+    if TOMBSTONE_COL not in df_raw.columns:
+        return 0
+    tombstoned = df_raw[TOMBSTONE_COL].fillna("").astype(str).str.strip() != ""
+    deleted = int(tombstoned.sum())
+    df_live = process_score_df(df_raw.copy())
+    if df_live.empty and len(df_raw) > deleted:
+        st.error("🚨 データの整形に失敗したため整理を中止しました。")
+        st.stop()
+    if SCORE_PARTITION == "none":
+        save_score_data(df_live)
+        return deleted
+
+    # 分割しているときは削除済みの行があるシートだけを書き直す
+    names = list(df_raw.loc[tombstoned, "シート名"].unique())
+    results = run_parallel({
+        name: (write_score_partition, conn, name, df_live[df_live["シート名"] == name].sort_values("GameNo")[EXPECTED_COLS])
+        for name in names
+    })
+    invalidate_partitions(names)
+    fetch_sheets_cached.clear()
+    errors = [f"{name}: {err}" for name, (_, err) in results.items() if err is not None]
+    if errors:
+        raise RuntimeError("一部のシートを整理できませんでした (" + "; ".join(errors) + ")")
+    return deleted
+
+# --- モニター用の差分読み込み ---
+MONITOR_REFRESH_SEC = 30
+MONITOR_RESYNC_SEC = 300  # 念のため一定時間ごとに全体を読み直す
+
+def _game_no_of(val):
+    try:
+        return int(float(val))
+    except (TypeError, ValueError):
+        return 0
+
+def monitor_sheet_names(conn, today):
+    # 今日の行が入りうる成績シート（卓・月ごとのときは今月のシートだけ）
+    if SCORE_PARTITION == "none":
+        return [SHEET_SCORE]
+    names = existing_score_partitions(conn)
+    if SCORE_PARTITION == "table_month":
+        names = [n for n in names if n.endswith(f"_{today.strftime('%Y-%m')}")]
+    return names
+
+def _monitor_sheet(df_raw, today):
+    # 1枚分の今日の行 (生データ) と末尾の位置
+    df_raw.columns = df_raw.columns.astype(str).str.strip()
+    processed = process_score_df(df_raw.copy())
+    today_idx = processed.index[processed["論理日付"] == today] if not processed.empty else []
+    return {
+        "raw": df_raw.loc[today_idx],
+        "last_row": len(df_raw) + 1,
+        "last_game_no": _game_no_of(df_raw["GameNo"].iloc[-1]) if not df_raw.empty else 0,
+    }
+
+def load_monitor_full(conn, today):
+    # 今日の行が入りうるシートを全体まで読み、今日の行 (生データ) と末尾の位置だけを控える
+    names = monitor_sheet_names(conn, today)
+    if SCORE_PARTITION == "none":
+        frames = {SHEET_SCORE: fetch_data_fresh(conn, SHEET_SCORE)}
+    else:
+        frames = {name: _partition_or_empty(df) for name, df in read_sheets(conn, names).items()}
+    return {
+        "date": today,
+        "sheets": {name: _monitor_sheet(df, today) for name, df in frames.items()},
+        "synced_at": time.time(),
+    }
+
+def _refresh_monitor_sheet(sheet, start, header_values, values, today):
+    # start 行目から後ろ (values) で今日の行を作り直す。前回の最後の行が変わっていたら None
+    header = [str(h).strip() for h in (header_values[0] if header_values else [])]
+    if "GameNo" not in header:
+        return None
+    game_col = header.index("GameNo")
+    last = sheet["last_row"] - start
+    if (len(values) <= last or len(values[last]) <= game_col
+            or _game_no_of(values[last][game_col]) != sheet["last_game_no"]):
+        return None
+
+    df_window = _values_to_df([header] + values)
+    df_window.index = df_window.index + start - 2  # シート行 = index + 2
+    if any(_game_no_of(g) <= sheet["last_game_no"] for g in df_window["GameNo"].iloc[last + 1:]):
+        return None
+
+    processed = process_score_df(df_window.copy())
+    keep_idx = processed.index[processed["論理日付"] == today] if not processed.empty else []
+    return {
+        "raw": df_window.loc[keep_idx],
+        "last_row": start + len(df_window) - 1,
+        "last_game_no": _game_no_of(df_window["GameNo"].iloc[-1]),
+    }
+
+def refresh_monitor_state(state):
+    # 今日の行が入りうるシートだけを、今日の最初の行から後ろだけ1回の通信でまとめて取得し、今日の行を作り直す
+    # （追加だけでなく、今日の対局の修正・論理削除もすぐに反映される）
+    # 前回の最後の行が変わっていたり、シートが増えていたら（全体の書き直し等）読み直す
+    conn = get_conn()
+    today = logical_today()
+    client = conn.client if conn is not None and get_local_store() is None else None
+    if (client is None or not hasattr(client, "_open_spreadsheet") or state is None or state["date"] != today
+            or time.time() - state["synced_at"] > MONITOR_RESYNC_SEC):
+        return load_monitor_full(conn, today)
+    names = monitor_sheet_names(conn, today)
+    if set(names) != set(state["sheets"]):
+        return load_monitor_full(conn, today)
+
+    starts, ranges = {}, []
+    for name in names:
+        sheet = state["sheets"][name]
+        start = int(sheet["raw"].index.min()) + 2 if not sheet["raw"].empty else sheet["last_row"]
+        starts[name] = min(start, sheet["last_row"])
+        # 見出しも毎回読む（削除で「削除日時」の列が足されることがある）
+        ranges += [f"'{name}'!1:1", f"'{name}'!A{starts[name]}:ZZ"]
+    res = client._open_spreadsheet().values_batch_get(ranges).get("valueRanges", [])
+
+    sheets = {}
+    for i, name in enumerate(names):
+        header_values, values = (res[2 * i + k].get("values", []) for k in (0, 1))
+        sheet = _refresh_monitor_sheet(state["sheets"][name], starts[name], header_values, values, today)
+        if sheet is None:
+            return load_monitor_full(conn, today)
+        sheets[name] = sheet
+    return {**state, "sheets": sheets}
 
 def save_action_log(action, game_no, detail=""):
+    save_action_logs([(action, game_no, detail)])
+
+def append_sheet_records(sheet_name, cols, records):
+    # 追記だけのシート (ログ・変更履歴) に行を足す。書ける接続なら全体を読み直さず末尾に足す
     conn = get_conn()
     try:
-        df_log = fetch_data_fresh(conn, SHEET_LOG)
+        ws = get_worksheet(conn, sheet_name)
+    except Exception as e:
+        if type(e).__name__ != "WorksheetNotFound":
+            raise
+        # 初めて書くときは見出し (cols) つきでシートを作る
+        conn.create(worksheet=sheet_name, data=pd.DataFrame(records, columns=cols))
+        return
+    if ws is not None:
+        header = [str(h).strip() for h in ws.row_values(1)]
+        if all(col in header for col in cols):
+            rows = [[_to_cell(record.get(col, "")) for col in header] for record in records]
+            ws.append_rows(rows, value_input_option="USER_ENTERED")
+            return
+
+    new_rows = pd.DataFrame(records, columns=cols)
+    store = get_local_store()
+    if store is not None:
+        store.append(sheet_name, new_rows)
+        replicate_sheet(sheet_name)
+        return
+
+    try:
+        df_old = fetch_data_fresh(conn, sheet_name)
     except:
-        df_log = pd.DataFrame(columns=["日時", "操作", "GameNo", "詳細"])
-    
+        df_old = pd.DataFrame(columns=cols)
+    try:
+        conn.update(worksheet=sheet_name, data=pd.concat([df_old, new_rows], ignore_index=True))
+    except Exception as e:
+        if type(e).__name__ != "WorksheetNotFound":
+            raise
+        conn.create(worksheet=sheet_name, data=new_rows)
+
+def save_action_logs(entries):
+    # 複数件のログを1回の書き込みでまとめて保存する
     jst_now = datetime.now(timezone(timedelta(hours=9), 'JST')).strftime("%Y-%m-%d %H:%M:%S")
-    new_log = pd.DataFrame([{
-        "日時": jst_now,
-        "操作": action,
-        "GameNo": game_no,
-        "詳細": detail
-    }])
-    
-    df_log = pd.concat([df_log, new_log], ignore_index=True)
-    conn.update(worksheet=SHEET_LOG, data=df_log)
-    fetch_data_cached.clear()
+    records = [{"日時": jst_now, "操作": action, "GameNo": game_no, "詳細": detail} for action, game_no, detail in entries]
+    append_sheet_records(SHEET_LOG, LOG_COLS, records)
+    fetch_sheets_cached.clear()
 
-def load_log_data():
+def save_score_events(events):
+    # 変更履歴 (変更前後の行つき) を追記する
+    if events:
+        append_sheet_records(SHEET_EVENTS, EVENT_COLS, events)
+
+def score_event(op, game_no, before=None, after=None):
+    jst_now = datetime.now(timezone(timedelta(hours=9), 'JST')).strftime("%Y-%m-%d %H:%M:%S")
+    return make_event(jst_now, op, game_no, before=before, after=after, cols=EXPECTED_COLS)
+
+def save_score_and_logs(df, log_entries, events=()):
+    # スコアとログの書き込みを並行して行い、それぞれの失敗 (例外 or None) を返す
+    # 変更履歴はスコアの保存が成功してから書く（保存されなかった変更を履歴に残さない）
+    results = run_parallel({
+        "score": (save_score_data, df),
+        "log": (save_action_logs, log_entries),
+    })
+    score_error, log_error = results["score"][1], results["log"][1]
+    if score_error is None:
+        apply_ledger_events(events)
+        try:
+            save_score_events(list(events))
+        except Exception as e:
+            log_error = log_error or e
+    return score_error, log_error
+
+def apply_ledger_events(events):
+    # 成績を書いたその場で、変わった対局の分だけ精算台帳を足し引きする
+    changes = []
+    for event in events:
+        parsed = parse_event_row(tuple(event[c] for c in EVENT_COLS))
+        if parsed is not None:
+            changes.append((parsed[2], parsed[3]))
+    if changes:
+        get_settlement_ledger().apply(changes)
+
+def record_score_change(log_entries, events):
+    # 1行単位の変更のあとに、操作ログと変更履歴を並行して書く（失敗しても変更自体は取り消さない）
+    apply_ledger_events(events)
+    results = run_parallel({
+        "log": (save_action_logs, log_entries),
+        "events": (save_score_events, events),
+    })
+    errors = [str(err) for _, err in results.values() if err is not None]
+    if errors:
+        st.session_state["warning_msg"] = f"⚠️ 変更は保存しましたが、ログの書き込みに失敗しました ({'; '.join(errors)})"
+
+def report_write_failure(score_error, log_error, game_no):
+    # 並行書き込みのどちらかが失敗したときの後始末と表示
+    if score_error is not None:
+        if log_error is None:
+            # ログだけ残ってしまった場合は取り消しの記録を追加しておく
+            try:
+                save_action_log("登録失敗", game_no, f"スコアの保存に失敗したため無効: {score_error}")
+            except Exception:
+                pass
+        st.error(f"🚨 スコアの保存に失敗しました。もう一度ボタンを押してください。({score_error})")
+        st.stop()
+    if log_error is not None:
+        st.session_state["warning_msg"] = f"⚠️ 記録は保存しましたが、操作ログの書き込みに失敗しました ({log_error})"
+
+LOG_SYNC_SEC = 30
+LOG_PAGE_SIZE = 100
+
+@st.cache_resource
+def get_log_store():
+    store = LogStore()
+    store.synced_at = 0.0
+    store.source_version = None
+    return store
+
+def sync_log_store(force=False):
+    # 手元のログを最新にする。前回取り込んだ最後の行から先だけを読み、食い違えば全体を取り込み直す
+    store = get_log_store()
+    if not force and time.time() - store.synced_at < LOG_SYNC_SEC:
+        return store
     conn = get_conn()
+    ws = get_worksheet(conn, SHEET_LOG)
+    if ws is not None:
+        last_row, last_values = store.last_row()
+        header_values, tail = ws.batch_get(["1:1", f"{last_row}:{max(ws.row_count, last_row)}"])
+        header = [str(h).strip() for h in (header_values[0] if header_values else [])]
+        if all(col in header for col in LOG_COLS):
+            positions = [header.index(c) for c in LOG_COLS]
+            rows = [[str(r[i]).strip() if i < len(r) else "" for i in positions] for r in tail]
+            if last_values is None:
+                store.append(2, rows[1:])
+            elif rows and rows[0] == last_values:
+                store.append(last_row + 1, rows[1:])
+            else:
+                store.replace(_values_to_df(ws.get_all_values()))
+            store.synced_at = time.time()
+            return store
+
+    # 行単位で読めない接続では、共有キャッシュのログが変わったときだけ作り直す
+    df = fetch_data_cached(conn, SHEET_LOG)
+    version = f"{len(df)}-{int(pd.util.hash_pandas_object(df.astype(str), index=False).sum()) & 0xFFFFFFFFFFFF:x}"
+    if version != store.source_version:
+        store.replace(df)
+        store.source_version = version
+    store.synced_at = time.time()
+    return store
+
+@st.cache_resource
+def get_event_history():
+    # 前回のスナップショットから再開する
+    return EventHistory.load()
+
+def read_event_rows(conn, start):
+    # 変更履歴シートの start 行目 (見出しを除いて 0 始まり) から後ろだけを読む -> (行, 実際に読み始めた行)
+    # 途中から読めない接続では全体を読む。シートがまだなければ空
     try:
-        df = fetch_data_cached(conn, SHEET_LOG)
-    except:
-        return pd.DataFrame()
-    if df.empty: return pd.DataFrame(columns=["日時", "操作", "GameNo", "詳細"])
-    if "日時" in df.columns:
-        df = df.sort_values("日時", ascending=False)
-    return df
+        store = get_local_store()
+        if store is not None:
+            return store.read(SHEET_EVENTS, "WHERE _row >= ?", [start + 2]), start
+        ws = get_worksheet(conn, SHEET_EVENTS)
+        if ws is None or start == 0:
+            return fetch_data_fresh(conn, SHEET_EVENTS), 0
+        if start + 2 > ws.row_count:
+            # シートが縮んでいる（書き換えられている）
+            return pd.DataFrame(columns=EVENT_COLS), start
+        header, body = ws.batch_get(["1:1", f"{start + 2}:{ws.row_count}"])
+        header = [str(h).strip() for h in (header[0] if header else [])]
+        rows = [list(r) + [""] * (len(header) - len(r)) for r in body]
+        return pd.DataFrame([r[:len(header)] for r in rows], columns=header), start
+    except Exception as e:
+        if type(e).__name__ != "WorksheetNotFound":
+            raise
+        return pd.DataFrame(columns=EVENT_COLS), 0
+
+def sync_event_history():
+    # 変更履歴シートの前回読んだところから後ろだけを読み、増えたイベントをスナップショットの先に反映する
+    conn = get_conn()
+    history = get_event_history()
+    df = load_score_data()
+    current_rows = df[EXPECTED_COLS].to_dict("records")
+    df_events, start = read_event_rows(conn, history.cursor)
+    if history.sync(df_events, current_rows, start) is None:
+        # 前に読んだ所が書き換えられていたら全体から読み直す
+        df_events, start = read_event_rows(conn, 0)
+        history.sync(df_events, current_rows, start)
+    return history
+
+def undo_score_event(event):
+    # 直前の変更の逆を成績表に反映する。その後に同じ対局が変わっていれば取り消さない
+    op, game_no, before, after, _ = event
+    fetch_sheets_cached.clear()
+    df_latest = load_score_data_fresh()
+    live = df_latest[df_latest["GameNo"] == game_no]
+    current = live.iloc[0] if not live.empty else None
+    expected = None if op == EVENT_DELETE else after
+    if (current is None) != (expected is None):
+        return False
+    if current is not None:
+        # 日時はシート側で書式が変わることがあるので時刻として比べる
+        same_time = pd.to_datetime(current["日時"], errors="coerce") == pd.to_datetime(expected.get("日時"), errors="coerce")
+        if not same_time or any(str(current[c]) != str(expected.get(c, "")) for c in EXPECTED_COLS if c != "日時"):
+            return False
+
+    if op == EVENT_INSERT:
+        ok = soft_delete_score_row(game_no, current["シート行"], current.get("シート名"))
+    elif op == EVENT_UPDATE:
+        ok = update_score_row(game_no, {c: before.get(c, "") for c in EXPECTED_COLS}, current["シート行"], current.get("シート名"))
+    else:
+        save_score_data(pd.concat([df_latest[EXPECTED_COLS], pd.DataFrame([before])[EXPECTED_COLS]], ignore_index=True))
+        ok = True
+    if ok:
+        jst_now = datetime.now(timezone(timedelta(hours=9), 'JST')).strftime("%Y-%m-%d %H:%M:%S")
+        record_score_change([("取消", game_no, f"{op}を取り消し")], [inverse_event(event, jst_now)])
+    return ok
 
 def load_member_data():
     conn = get_conn()
@@ -294,164 +1125,357 @@ def load_member_data():
 
 def save_member_data(df):
     conn = get_conn()
-    conn.update(worksheet=SHEET_MEMBER, data=df)
-    fetch_data_cached.clear()
+    write_sheet(conn, SHEET_MEMBER, df)
+    # 成績データは変わっていないので、共有キャッシュのメンバー表だけを差し替える
+    cached = fetch_sheets_cached(conn)
+    if isinstance(cached.get(SHEET_MEMBER), pd.DataFrame):
+        cached[SHEET_MEMBER] = df.copy()
+    else:
+        fetch_sheets_cached.clear()
+
+def empty_member_changes():
+    return {"add": [], "delete": [], "rename": {}}
+
+def apply_member_changes(df_mem, changes):
+    # 追加・削除・名前変更をまとめて反映した表を返す。問題があればエラー文のリストを返す
+    errors = []
+    names = df_mem["名前"].astype(str).tolist()
+    deletes = set(changes["delete"])
+    renames = {old: new for old, new in changes["rename"].items() if old not in deletes}
+
+    for old, new in renames.items():
+        if not new:
+            errors.append(f"「{old}」の新しい名前が空です")
+        elif new in names and new not in renames:
+            errors.append(f"「{new}」は既に登録されています（{old} からの変更）")
+    new_names = list(renames.values())
+    for name in set(n for n in new_names if new_names.count(n) > 1):
+        errors.append(f"「{name}」に複数のメンバーを変更しようとしています")
+    for name in changes["add"]:
+        if name in names or name in new_names:
+            errors.append(f"「{name}」は既に登録されています")
+    # 全角・半角やかなの違いだけの名前は同じ人の二重登録になりやすい
+    kept = [renames.get(n, n) for n in names if n not in deletes]
+    seen = {}
+    for name in kept + [n for n in changes["add"] if n not in kept]:
+        key = normalize_name(name)
+        if key in seen and seen[key] != name:
+            errors.append(f"「{name}」は「{seen[key]}」と表記が違うだけの名前です")
+        seen.setdefault(key, name)
+    if errors:
+        return None, errors
+
+    df_new = df_mem[~df_mem["名前"].isin(deletes)].copy()
+    df_new["名前"] = df_new["名前"].replace(renames)
+    if changes["add"]:
+        added = pd.DataFrame({"名前": changes["add"], "登録日": date.today()})
+        df_new = pd.concat([df_new, added], ignore_index=True)
+    return df_new, []
+
+def rename_players_in_scores(df, renames):
+    # A〜Cさんの列をまとめて置き換える
+    df = df.copy()
+    cols = ["Aさん", "Bさん", "Cさん"]
+    df[cols] = df[cols].replace(renames)
+    return df
+
+def filter_score_games(df, start=None, end=None, player=None):
+    # 期間・プレイヤーで対局を絞る。SQLite のときは索引から GameNo だけを引く（DailyNo などの列はそのまま）
+    store = get_local_store()
+    if store is not None:
+        return df[df["GameNo"].isin(store.game_numbers(start=start, end=end, player=player))].copy()
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df["論理日付"] >= start
+    if end is not None:
+        mask &= df["論理日付"] <= end
+    if player:
+        mask &= (df["Aさん"] == player) | (df["Bさん"] == player) | (df["Cさん"] == player)
+    return df[mask].copy()
 
 def get_all_member_names():
+    # 最近打った人ほど先頭。打ったことのない登録メンバーは後ろ
     df_mem = load_member_data()
-    all_members = df_mem["名前"].tolist() if not df_mem.empty else []
+    all_members = df_mem["名前"].astype(str).tolist() if not df_mem.empty else []
     df_score = load_score_data()
     if df_score.empty:
         return sorted(list(set(all_members)))
 
-    last_played = {}
-    for _, row in df_score.iterrows():
-        dt = row["日時Obj"]
-        for seat in ["A", "B", "C"]:
-            name = row[f"{seat}さん"]
-            if name:
-                if name not in last_played or dt > last_played[name]:
-                    last_played[name] = dt
-    
-    formatted_list = []
-    for m in all_members:
-        last_dt = last_played.get(m, pd.Timestamp("1900-01-01"))
-        formatted_list.append({"name": m, "last_dt": last_dt})
-    
-    for m in last_played.keys():
-        if m not in all_members:
-            formatted_list.append({"name": m, "last_dt": last_played[m]})
+    seats = pd.concat(
+        [df_score[[f"{seat}さん", "日時Obj"]].set_axis(["name", "dt"], axis=1) for seat in ["A", "B", "C"]],
+        ignore_index=True,
+    )
+    seats = seats[seats["name"].notna() & (seats["name"].astype(str) != "")]
+    last_played = seats.groupby(seats["name"].astype(str))["dt"].max()
+
+    names = pd.Index(all_members).append(last_played.index).drop_duplicates()
+    last_dt = last_played.reindex(names).fillna(pd.Timestamp("1900-01-01"))
+    return last_dt.sort_values(ascending=False, kind="stable").index.tolist()
+
+@st.cache_resource(max_entries=4)
+def get_name_index(names):
+    # 名前の並びが同じ間は索引を作り直さない
+    return NameIndex(names)
+
+def search_names(member_list, query, keep=None, limit=NAME_SUGGEST_LIMIT):
+    # 絞り込み文字に合う候補（keep は候補になくても残す）
+    if not query:
+        return member_list
+    options = get_name_index(tuple(member_list)).search(query, limit)
+    if keep and keep not in options:
+        options = [keep] + options
+    return options
+
+BATCH_COLS = [
+    "時刻",
+    "Aさん", "Aタイプ", "A着順",
+    "Bさん", "Bタイプ", "B着順",
+    "Cさん", "Cタイプ", "C着順",
+    "備考"
+]
 
-    sorted_data = sorted(formatted_list, key=lambda x: x["last_dt"], reverse=True)
-    return [x["name"] for x in sorted_data]
+def is_rank_permutation(df_rows):
+    # 1〜3の値で合計6・積6になるのは {1,2,3} の並べ替えだけ
+    ranks = df_rows[["A着順", "B着順", "C着順"]].apply(pd.to_numeric, errors="coerce").fillna(0).astype(int)
+    return ranks.isin([1, 2, 3]).all(axis=1) & (ranks.sum(axis=1) == 6) & (ranks.prod(axis=1) == 6)
+
+def validate_batch_rows(df_rows):
+    # 全行をまとめて検証し、行ごとのエラー内容を返す（空文字ならOK）
+    errors = pd.Series("", index=df_rows.index)
+
+    names = df_rows[["Aさん", "Bさん", "Cさん"]].fillna("").astype(str)
+    missing_name = names.apply(lambda s: s.str.strip() == "").any(axis=1)
+    errors[missing_name] += "名前が未入力 / "
+
+    types = df_rows[["Aタイプ", "Bタイプ", "Cタイプ"]]
+    bad_type = ~types.isin(["A客", "B客", "AS", "BS"]).all(axis=1)
+    errors[bad_type] += "タイプが未選択 / "
+
+    errors[~is_rank_permutation(df_rows)] += "着順が1〜3になっていません / "
+
+    times = pd.to_datetime(df_rows["時刻"].fillna("").astype(str).str.strip(), format="%H:%M", errors="coerce")
+    errors[times.isna()] += "時刻は HH:MM 形式で入力してください / "
+
+    return errors.str.rstrip(" /")
+
+def build_batch_rows(df_rows, table_no, set_no, input_date, first_game_no):
+    # 検証済みの行に GameNo・日時 をまとめて割り当てる
+    times = pd.to_datetime(df_rows["時刻"].astype(str).str.strip(), format="%H:%M")
+    # 深夜(0:00〜8:59)の対局は論理日付の翌日の日時として保存する
+    day_offset = pd.to_timedelta((times.dt.hour < 9).astype(int), unit="D")
+    save_dates = pd.Timestamp(input_date) + day_offset
+
+    df_new = pd.DataFrame({
+        "GameNo": range(first_game_no, first_game_no + len(df_rows)),
+        "TableNo": table_no,
+        "SetNo": set_no,
+        "日時": save_dates.dt.strftime("%Y-%m-%d").values + " " + times.dt.strftime("%H:%M").values,
+        "備考": df_rows["備考"].fillna("").replace("なし", "").values,
+    })
+    for seat in ["A", "B", "C"]:
+        df_new[f"{seat}さん"] = df_rows[f"{seat}さん"].astype(str).str.strip().values
+        df_new[f"{seat}タイプ"] = df_rows[f"{seat}タイプ"].values
+        df_new[f"{seat}着順"] = pd.to_numeric(df_rows[f"{seat}着順"]).astype(int).values
+    return df_new[EXPECTED_COLS]
+
+IMPORT_CHUNK_ROWS = 5000
+
+def iter_import_chunks(uploaded_file, encoding="utf-8-sig", chunk_size=IMPORT_CHUNK_ROWS):
+    # 大きなファイルでも一度に全部を読み込まないよう、一定行数ずつ取り出す
+    if uploaded_file.name.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else "" for c in next(rows, [])]
+        width = len(header)
+        buf = []
+        for r in rows:
+            buf.append(list(r[:width]) + [None] * (width - len(r)))
+            if len(buf) >= chunk_size:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+        wb.close()
+    else:
+        yield from pd.read_csv(uploaded_file, chunksize=chunk_size, dtype=str, encoding=encoding)
+
+def validate_import_chunk(chunk, known_members, allow_unknown=False):
+    # チャンク単位でまとめて検証し、(整形済みデータ, 行ごとの却下理由) を返す
+    chunk = chunk.copy()
+    chunk.columns = chunk.columns.astype(str).str.strip()
+    reasons = pd.Series("", index=chunk.index)
+
+    for col in ["GameNo", "TableNo", "SetNo", "A着順", "B着順", "C着順"]:
+        chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+    for col in ["備考", "Aさん", "Aタイプ", "Bさん", "Bタイプ", "Cさん", "Cタイプ"]:
+        chunk[col] = chunk[col].fillna("").astype(str).str.strip()
+
+    dt = pd.to_datetime(chunk["日時"], errors="coerce", format="mixed")
+    reasons[dt.isna()] += "日時が不正 / "
+    chunk["日時"] = dt.dt.strftime("%Y-%m-%d %H:%M")
+
+    bad_no = chunk[["TableNo", "SetNo"]].isna().any(axis=1) | (chunk[["TableNo", "SetNo"]].fillna(0) < 1).any(axis=1)
+    reasons[bad_no] += "卓・セット番号が不正 / "
+    reasons[~is_rank_permutation(chunk)] += "着順が1〜3になっていません / "
+
+    names = chunk[["Aさん", "Bさん", "Cさん"]]
+    reasons[(names == "").any(axis=1)] += "名前が空欄 / "
+    if not allow_unknown:
+        unknown = ~names.isin(known_members).all(axis=1) & (names != "").all(axis=1)
+        reasons[unknown] += "未登録のメンバー / "
+
+    bad_type = ~chunk[["Aタイプ", "Bタイプ", "Cタイプ"]].isin(["A客", "B客", "AS", "BS"]).all(axis=1)
+    reasons[bad_type] += "タイプが不正 / "
+
+    return chunk, reasons.str.rstrip(" /")
+
+IMPORT_KEY_COLS = ["日時", "TableNo", "Aさん", "Bさん", "Cさん"]
+
+def _game_keys(df):
+    keys = df[IMPORT_KEY_COLS].copy()
+    keys["日時"] = pd.to_datetime(keys["日時"], errors="coerce", format="mixed").dt.strftime("%Y-%m-%d %H:%M")
+    keys["TableNo"] = pd.to_numeric(keys["TableNo"], errors="coerce").fillna(0).astype(int)
+    return pd.MultiIndex.from_frame(keys.fillna("").astype(str))
+
+def find_duplicate_games(df_import, df_existing):
+    # 既存データ・ファイル内で同じ対局 (日時・卓・3人) が重複している行を検出する
+    key_import = _game_keys(df_import)
+    if df_existing.empty:
+        in_existing = pd.Series(False, index=df_import.index)
+    else:
+        in_existing = pd.Series(key_import.isin(_game_keys(df_existing)), index=df_import.index)
+    in_file = pd.Series(key_import.duplicated(), index=df_import.index)
+    return in_existing, in_file
+
+def remap_import_game_no(df_import, start_game_no):
+    # 元の GameNo (同値は日時) の順序を保ったまま、既存データの後ろに連番を振り直す
+    order = df_import.assign(_orig=df_import["GameNo"].fillna(0)).sort_values(["_orig", "日時"], kind="stable").index
+    df_import = df_import.loc[order].copy()
+    df_import["元GameNo"] = df_import["GameNo"]
+    df_import["GameNo"] = range(start_game_no, start_game_no + len(df_import))
+    return df_import
+
+# ログイン画面を表示している間に、裏でデータの読み込みを始めておく
+start_warm_up()
+
+if not check_password():
+    log_first_render("login")
+    st.stop()
 
 # ==========================================
 # 4. 集計 & レンダリングロジック
 # ==========================================
 
-def calculate_set_summary(subset_df):
-    target_types = ["A客", "B客", "AS", "BS"]
-    type_stats = {t: 0 for t in target_types}
-    FEE_MAP = {"A客": 3, "B客": 5, "AS": 1, "BS": 1}
-    total_fee = 0
-    
-    for _, row in subset_df.iterrows():
-        w_type = None
-        try:
-            r_a = int(float(row["A着順"]))
-            r_b = int(float(row["B着順"]))
-            r_c = int(float(row["C着順"]))
-        except:
-            r_a, r_b, r_c = 0, 0, 0
-
-        if r_a == 1: w_type = row["Aタイプ"]
-        elif r_b == 1: w_type = row["Bタイプ"]
-        elif r_c == 1: w_type = row["Cタイプ"]
-        
-        if w_type in target_types:
-            type_stats[w_type] += 1
-            if w_type in FEE_MAP: total_fee += FEE_MAP[w_type]
-        
-        note = str(row["備考"])
-        if note == "東１終了": total_fee -= 1
-        elif note == "２人飛ばし": total_fee -= 2
-        elif note == "５連勝〜": total_fee -= 5
-
-    return total_fee, type_stats
-
 def render_paper_sheet(df):
     if df.empty:
         st.info("データがありません")
         return
 
-    groups = df.groupby(["TableNo", "SetNo"])
-    sorted_keys = sorted(groups.groups.keys())
-
-    for key in sorted_keys:
-        table_no, set_no = key
-        subset = groups.get_group(key).sort_values("DailyNo")
-        if subset.empty: continue
-        
-        fee, stats = calculate_set_summary(subset)
-        
-        html = f'''
-        <table class="score-sheet">
-            <thead>
-                <tr class="set-header"><td colspan="6">📄 第 {int(set_no)} セット (卓: {int(table_no)})</td></tr>
-                <tr>
-                    <th style="width:5%">No</th>
-                    <th style="width:10%">時刻</th>
-                    <th style="width:23%">A席</th>
-                    <th style="width:23%">B席</th>
-                    <th style="width:23%">C席</th>
-                    <th style="width:16%">備考</th>
-                </tr>
-            </thead>
-            <tbody>'''
-        
-        last_names = {"A": None, "B": None, "C": None}
-        
-        for _, row in subset.iterrows():
-            ranks_html_list = []
-            try:
-                dt_obj = pd.to_datetime(row["日時"])
-                time_str = dt_obj.strftime("%H:%M")
-            except: time_str = ""
-
-            for p_char in ["A", "B", "C"]:
-                try:
-                    r_float = float(row[f"{p_char}着順"])
-                    rank_val = str(int(r_float))
-                except: rank_val = "0"
-
-                is_1st = (rank_val == "1")
-                SPECIAL_NOTES = ["東１終了", "２人飛ばし", "５連勝〜"]
-                is_special = (row["備考"] in SPECIAL_NOTES) and is_1st
-                
-                td_class = ' class="cell-top"' if is_1st else ""
-                
-                if is_special:
-                    rank_span = f'<span class="rank-num rank-special">❶</span>'
-                else:
-                    char_map = {"1":"①", "2":"②", "3":"③"}
-                    d_char = char_map.get(rank_val, rank_val)
-                    color_style = "color:#000;"
-                    rank_span = f'<span class="rank-num" style="{color_style}">{d_char}</span>'
-                
-                p_name = row[f"{p_char}さん"]
-                p_type = row[f"{p_char}タイプ"] 
-                
-                if p_name == last_names[p_char]:
-                    display_text = ""
-                else:
-                    display_text = f"{p_name}<span style='font-size:11px; color:#555; margin-left:3px;'>({p_type})</span>"
-                    last_names[p_char] = p_name
-                
-                cell_content = f'<div style="display:flex; justify-content:space-between; align-items:center; padding:0 5px;"><span>{display_text}</span>{rank_span}</div>'
-                ranks_html_list.append(f'<td{td_class}>{cell_content}</td>')
-
-            note_txt = row["備考"] if row["備考"] else ""
-            html += f'<tr><td>{row["DailyNo"]}</td><td>{time_str}</td>{ranks_html_list[0]}{ranks_html_list[1]}{ranks_html_list[2]}<td style="color:red; font-size:12px;">{note_txt}</td></tr>'
-
-        html += f'<tr class="summary-row"><td colspan="2" style="text-align:right;">合計</td><td>ゲーム代: <span style="font-size:16px; color:#d9534f;">{fee}</span> 枚</td><td colspan="3" style="font-size:12px; text-align:left;">A客:{stats["A客"]} / B客:{stats["B客"]} / AS:{stats["AS"]} / BS:{stats["BS"]}</td></tr></tbody></table>'
-        
-        st.markdown(html, unsafe_allow_html=True)
+    for table_no, set_no, subset in iter_sheet_sets(df):
+        st.markdown(set_sheet_html(table_no, set_no, subset), unsafe_allow_html=True)
+
+@st.cache_resource(ttl=60)
+def fetch_shop_scores(shop):
+    # 他店舗の成績 (店舗ごとにキャッシュ)。自店舗は通常の読み込みを使う
+    # 分割のきまりは自店舗と同じなので、同じシート名の一覧から読む
+    conn = get_shop_conn(SHOPS[shop])
+    if SCORE_PARTITION == "none":
+        return process_score_df(_read_sheet(conn, SHEET_SCORE))
+    titles = worksheet_titles(conn)
+    if titles is None and SCORE_PARTITION == "table_month":
+        raise RuntimeError(f"{shop}: 卓・月ごとの分割にはサービスアカウント接続が必要です")
+    sheets = read_sheets(conn, partition_names(titles), local=False)
+    return process_score_df(join_partitions({name: _partition_or_empty(df) for name, df in sheets.items()}))
+
+def load_shop_scores(shop):
+    return load_score_data() if shop == HOME_SHOP else fetch_shop_scores(shop)
+
+def load_all_shops():
+    # 全店舗をスレッドで同時に読み込む。戻り値は ({店舗: DataFrame}, {店舗: 例外})
+    results = run_parallel({shop: (load_shop_scores, shop) for shop in SHOPS})
+    frames = {shop: df for shop, (df, err) in results.items() if err is None}
+    errors = {shop: err for shop, (_, err) in results.items() if err is not None}
+    return frames, errors
+
+@st.cache_resource(max_entries=32)
+def get_shop_rollup(_df, shop, version, view, today):
+    # 店舗・データの版・期間ごとに一度だけ集計する
+    return player_rollup(filter_period(_df, view, today) if not _df.empty else _df)
+
+@st.cache_resource
+def get_stats_cube_store():
+    return StatsCube()
+
+@st.cache_resource(max_entries=4)
+def get_stats_cube(_df, version):
+    # データの版ごとに一度だけ差分を反映し、その時点の写しを全セッションで共有する
+    cube = get_stats_cube_store()
+    cube.sync(_df)
+    return cube.snapshot()
+
+@st.cache_data(max_entries=64)
+def get_player_trend(_df, version, name, window, method):
+    # 系列の計算と間引きはサーバー側で済ませ、グラフには最大 TREND_MAX_POINTS 点だけを渡す
+    return downsample_trend(player_trend(_df, name, window), TREND_MAX_POINTS, method)
+
+@st.cache_resource
+def get_settlement_ledger():
+    # 前回保存した台帳から再開する
+    return SettlementLedger.load()
+
+@st.cache_resource(max_entries=4)
+def get_ledger(_df, version):
+    # アプリからの書き込みは apply_ledger_events で反映済み。版が変わったときは (日付, 卓, セット) ごとの内容を突き合わせる
+    ledger = get_settlement_ledger()
+    ledger.reconcile(_df)
+    return ledger
+
+@st.cache_resource
+def get_streak_tracker():
+    return StreakTracker()
+
+@st.cache_resource(max_entries=4)
+def get_streaks(_df, version):
+    # 新しい対局が足されただけならその分だけを反映する。渡すのはその時点の写し
+    tracker = get_streak_tracker()
+    tracker.sync(_df)
+    return tracker.snapshot()
+
+@st.cache_resource(max_entries=2)
+def get_head_to_head(_df, version):
+    # データの版ごとに一度だけ行列を作り、全セッションで共有する
+    return HeadToHead.build(_df)
 
 # ==========================================
 # 5. 各ページ画面
 # ==========================================
 
-def player_input_row_dynamic(label, member_list, def_n, def_t, def_r, available_ranks, key_suffix=""):
+def player_search(label, key):
+    return st.text_input(
+        f"{label}を検索", key=f"{key}_q", placeholder="🔍 名前の一部（ひらがな可）", label_visibility="collapsed",
+    )
+
+def player_select(label, member_list, default, key, query=None):
+    # 絞り込み文字で候補をサーバー側で絞ってから選ばせる（かな・全角半角の違いは無視）
+    # フォームの中では検索欄を置けない（Enter で送信される・送信まで絞り込まれない）ので、外で受けた query を渡す
+    if query is None:
+        query = player_search(label, key)
+    options = search_names(member_list, query, keep=default)
+    if query and not options:
+        st.caption("該当する名前がありません")
+    idx = options.index(default) if default in options else None
+    return st.selectbox(label, options, index=idx, key=key)
+
+def player_input_row_dynamic(label, member_list, def_n, def_t, def_r, available_ranks, key_suffix="", query=""):
     st.markdown(f"**▼ {label}**")
     TYPE_OPTS = ["A客", "B客", "AS", "BS"]
     
-    def get_idx_in_list(lst, val): return lst.index(val) if val in lst else None
     def get_idx_in_opts(opts, val): return opts.index(val) if val in opts else 0
 
     c1, c2 = st.columns([1, 2])
     with c1:
-        idx_val = get_idx_in_list(member_list, def_n) if def_n else None
-        name = st.selectbox("名前", member_list, index=idx_val, key=f"n_{label}{key_suffix}")
+        name = player_select("名前", member_list, def_n, f"n_{label}{key_suffix}", query=query)
     with c2:
         final_idx = 0
         if def_r in available_ranks:
@@ -485,44 +1509,162 @@ def page_home():
             st.session_state["page"] = "members"
             st.rerun()
     
+    st.write("")
+    if st.button("⚔️ 対戦成績", use_container_width=True):
+        st.session_state["page"] = "versus"
+        st.rerun()
+
+    st.write("")
+    if st.button("🧊 詳細集計 (席・タイプ・月別)", use_container_width=True):
+        st.session_state["page"] = "cube"
+        st.rerun()
+
+    st.write("")
+    if st.button("📺 全卓モニター", use_container_width=True):
+        st.session_state["page"] = "monitor"
+        st.rerun()
+
+    st.write("")
+    if st.button("🗂 まとめて入力 (紙の転記)", use_container_width=True):
+        st.session_state["page"] = "batch"
+        st.rerun()
+
+    st.write("")
+    if st.button("📥 過去データ取込 (CSV/Excel)", use_container_width=True):
+        st.session_state["page"] = "import"
+        st.rerun()
+
+    if len(SHOPS) > 1:
+        st.write("")
+        if st.button("🏬 店舗横断ランキング", use_container_width=True):
+            st.session_state["page"] = "shops"
+            st.rerun()
+
     st.write("")
     if st.button("📜 操作ログ", use_container_width=True):
         st.session_state["page"] = "logs"
         st.rerun()
 
 # --- メンバー管理画面 ---
+MEMBER_PAGE_SIZE = 50
+
 def page_members():
     st.title("👥 メンバー管理")
     if st.button("🏠 ホームに戻る"):
         st.session_state["page"] = "home"
         st.rerun()
     st.info("同姓同名の場合は「田中（A）」「田中（B）」のように区別して登録してください。")
+    if st.session_state.get("member_msg"):
+        st.success(st.session_state["member_msg"])
+        st.session_state["member_msg"] = None
     df_mem = load_member_data()
-    with st.form("add_member_form"):
-        new_name = st.text_input("新しいメンバーの名前を入力")
-        submitted = st.form_submit_button("追加する")
-        if submitted and new_name:
-            if new_name in df_mem["名前"].values:
-                st.error(f"「{new_name}」は既に登録されています")
-            else:
-                new_row = {"名前": new_name, "登録日": date.today()}
-                df_mem = pd.concat([df_mem, pd.DataFrame([new_row])], ignore_index=True)
-                save_member_data(df_mem)
-                st.success(f"「{new_name}」を追加しました")
-                st.rerun()
+    changes = st.session_state.setdefault("member_changes", empty_member_changes())
+
+    # --- 追加 (複数可) ---
+    with st.form("add_member_form", clear_on_submit=True):
+        new_names_text = st.text_area("新しいメンバーの名前を入力（1行に1人、まとめて入力できます）")
+        submitted = st.form_submit_button("変更予定に追加")
+        if submitted and new_names_text.strip():
+            for name in [n.strip() for n in new_names_text.splitlines() if n.strip()]:
+                if name not in changes["add"]:
+                    changes["add"].append(name)
+            st.rerun()
+
     st.divider()
     st.markdown("### 登録済みメンバー一覧")
-    if not df_mem.empty:
-        for i, row in df_mem.iterrows():
-            c1, c2 = st.columns([4, 1])
-            c1.write(f"👤 **{row['名前']}**")
-            if c2.button("削除", key=f"del_{i}"):
-                df_mem = df_mem.drop(i)
-                save_member_data(df_mem)
-                st.warning(f"「{row['名前']}」を削除しました")
-                st.rerun()
-    else:
+    if df_mem.empty:
         st.write("登録メンバーはいません")
+    else:
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            query = st.text_input("🔍 名前で検索", key="member_query")
+        df_view = df_mem[df_mem["名前"].astype(str).str.contains(query, regex=False)] if query else df_mem
+        n_pages = max((len(df_view) - 1) // MEMBER_PAGE_SIZE + 1, 1)
+        with c2:
+            page_no = st.number_input(f"ページ (全{n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+        st.caption(f"{len(df_view)} 人中 {(page_no - 1) * MEMBER_PAGE_SIZE + 1}〜{min(page_no * MEMBER_PAGE_SIZE, len(df_view))} 人目")
+
+        df_page = df_view.iloc[(page_no - 1) * MEMBER_PAGE_SIZE: page_no * MEMBER_PAGE_SIZE]
+        df_edit = pd.DataFrame({
+            "名前": df_page["名前"].astype(str).values,
+            "新しい名前": [changes["rename"].get(n, "") for n in df_page["名前"].astype(str)],
+            "削除": [n in changes["delete"] for n in df_page["名前"].astype(str)],
+        })
+        with st.form(f"member_edit_form_{page_no}_{query}"):
+            edited = st.data_editor(
+                df_edit, hide_index=True, use_container_width=True, disabled=["名前"],
+                column_config={
+                    "新しい名前": st.column_config.TextColumn(help="名前を変更する場合だけ入力"),
+                    "削除": st.column_config.CheckboxColumn(),
+                },
+            )
+            if st.form_submit_button("このページの変更を変更予定に反映"):
+                for _, r in edited.iterrows():
+                    name, new = r["名前"], str(r["新しい名前"] or "").strip()
+                    changes["rename"].pop(name, None)
+                    if new and new != name:
+                        changes["rename"][name] = new
+                    if r["削除"] and name not in changes["delete"]:
+                        changes["delete"].append(name)
+                    elif not r["削除"] and name in changes["delete"]:
+                        changes["delete"].remove(name)
+                st.rerun()
+
+    # --- 変更予定の確認とまとめて保存 ---
+    n_changes = len(changes["add"]) + len(changes["delete"]) + len(changes["rename"])
+    if n_changes == 0:
+        return
+
+    st.divider()
+    st.markdown(f"### 📝 保存前の変更 ({n_changes} 件)")
+    for name in changes["add"]:
+        st.write(f"➕ 追加: **{name}**")
+    for old, new in changes["rename"].items():
+        st.write(f"✏️ 名前変更: **{old}** → **{new}**（過去の成績も変更されます）")
+    for name in changes["delete"]:
+        st.write(f"🗑 削除: **{name}**")
+
+    c_save, c_reset = st.columns(2)
+    with c_reset:
+        if st.button("変更を取り消す", use_container_width=True):
+            st.session_state["member_changes"] = empty_member_changes()
+            st.rerun()
+    with c_save:
+        if st.button("💾 まとめて保存", type="primary", use_container_width=True):
+            df_new, errors = apply_member_changes(df_mem, changes)
+            if errors:
+                for e in errors:
+                    st.error(e)
+                return
+            with st.spinner("サーバーに書き込み中..."):
+                if changes["rename"]:
+                    # 名前の変更は先に成績データへ一括で反映し、成功してからメンバー表を書く
+                    # （成績だけ古い名前のまま残らないように）
+                    fetch_sheets_cached.clear()
+                    df_latest = load_score_data_fresh()
+                    df_renamed = rename_players_in_scores(df_latest, changes["rename"])
+                    try:
+                        save_score_data(df_renamed)
+                    except Exception as e:
+                        st.error(f"成績データの名前変更を保存できませんでした。メンバー表も変更していません ({e})")
+                        return
+                    seat_cols = ["Aさん", "Bさん", "Cさん"]
+                    changed = (df_latest[seat_cols] != df_renamed[seat_cols]).any(axis=1)
+                    events = [
+                        score_event(EVENT_UPDATE, df_latest.at[i, "GameNo"], before=df_latest.loc[i], after=df_renamed.loc[i])
+                        for i in df_latest.index[changed]
+                    ]
+                    detail = ", ".join(f"{o}→{n}" for o, n in changes["rename"].items())
+                    record_score_change([("名前変更", "", detail)], events)
+                try:
+                    save_member_data(df_new)
+                except Exception as e:
+                    # 成績の名前変更は済んでいるので、もう一度保存すればメンバー表だけが書かれる
+                    st.error(f"メンバー表を保存できませんでした。成績データの名前変更は保存済みです。もう一度「まとめて保存」を押してください ({e})")
+                    return
+            st.session_state["member_changes"] = empty_member_changes()
+            st.session_state["member_msg"] = f"✅ {n_changes} 件の変更を保存しました"
+            st.rerun()
 
 # --- 編集専用画面 ---
 def page_edit():
@@ -551,10 +1693,18 @@ def page_edit():
     
     st.info(f"編集中: No.{row['DailyNo']} (卓: {row['TableNo']}, セット: {row['SetNo']})")
 
-    with st.form("edit_form"):
-        p1_n, p1_t, p1_r = player_input_row_dynamic("A席", member_list, row["Aさん"], row["Aタイプ"], int(float(row["A着順"])), [1, 2, 3], "_edit")
-        p2_n, p2_t, p2_r = player_input_row_dynamic("B席", member_list, row["Bさん"], row["Bタイプ"], int(float(row["B着順"])), [1, 2, 3], "_edit")
-        p3_n, p3_t, p3_r = player_input_row_dynamic("C席", member_list, row["Cさん"], row["Cタイプ"], int(float(row["C着順"])), [1, 2, 3], "_edit")
+    # 名前の検索欄はフォームの外に置き、入力するとすぐ候補が絞られるようにする
+    st.caption("🔍 名前の候補を絞る（ひらがな可）")
+    q_cols = st.columns(3)
+    queries = {}
+    for col, seat in zip(q_cols, ["A席", "B席", "C席"]):
+        with col:
+            queries[seat] = player_search(seat, f"n_{seat}_edit")
+
+    with st.form("edit_form", enter_to_submit=False):
+        p1_n, p1_t, p1_r = player_input_row_dynamic("A席", member_list, row["Aさん"], row["Aタイプ"], int(float(row["A着順"])), [1, 2, 3], "_edit", queries["A席"])
+        p2_n, p2_t, p2_r = player_input_row_dynamic("B席", member_list, row["Bさん"], row["Bタイプ"], int(float(row["B着順"])), [1, 2, 3], "_edit", queries["B席"])
+        p3_n, p3_t, p3_r = player_input_row_dynamic("C席", member_list, row["Cさん"], row["Cタイプ"], int(float(row["C着順"])), [1, 2, 3], "_edit", queries["C席"])
 
         st.markdown("**▼ 備考**")
         NOTE_OPTS = ["なし", "東１終了", "２人飛ばし", "５連勝〜"]
@@ -579,46 +1729,44 @@ def page_edit():
             st.rerun()
 
         if submit_update:
-            # 更新時は最新を取得
-            fetch_data_cached.clear()
-            df_latest = load_score_data_fresh()
-            
-            if edit_id not in df_latest["GameNo"].values:
-                st.error("データが他で削除された可能性があります")
+            if not p1_n or not p2_n or not p3_n:
+                st.error("名前を選択してください")
+            elif sorted([p1_r, p2_r, p3_r]) != [1, 2, 3]:
+                st.error("着順が重複しています")
             else:
-                if not p1_n or not p2_n or not p3_n:
-                    st.error("名前を選択してください")
-                elif sorted([p1_r, p2_r, p3_r]) != [1, 2, 3]:
-                    st.error("着順が重複しています")
+                new_data = {
+                    "GameNo": row["GameNo"], "TableNo": row["TableNo"], "SetNo": row["SetNo"],
+                    "日時": row["日時"], "備考": ("" if note == "なし" else note),
+                    "Aさん": p1_n, "Aタイプ": p1_t, "A着順": p1_r,
+                    "Bさん": p2_n, "Bタイプ": p2_t, "B着順": p2_r,
+                    "Cさん": p3_n, "Cタイプ": p3_t, "C着順": p3_r
+                }
+                
+                changes = []
+                compare_keys = [
+                    ("備考", "備考"),
+                    ("A名前", "Aさん"), ("A着順", "A着順"), ("Aタイプ", "Aタイプ"),
+                    ("B名前", "Bさん"), ("B着順", "B着順"), ("Bタイプ", "Bタイプ"),
+                    ("C名前", "Cさん"), ("C着順", "C着順"), ("Cタイプ", "Cタイプ"),
+                ]
+                for label, key in compare_keys:
+                    old_val = row[key]
+                    new_val = new_data[key]
+                    if str(old_val) != str(new_val):
+                        changes.append(f"{label}: {old_val}→{new_val}")
+                
+                diff_text = ", ".join(changes) if changes else "変更なし"
+                
+                # 対象の1行だけを書き換える（他の卓の入力を上書きしない）
+                # 変更前は画面を開いたときのキャッシュではなく、書き換える直前に読み直した内容を使う
+                before = read_score_row(edit_id, row.get("シート行"), row.get("シート名"))
+                if before is None or not update_score_row(edit_id, new_data, row.get("シート行"), row.get("シート名")):
+                    st.error("データが他で削除された可能性があります")
                 else:
-                    new_data = {
-                        "GameNo": row["GameNo"], "TableNo": row["TableNo"], "SetNo": row["SetNo"],
-                        "日時": row["日時"], "備考": ("" if note == "なし" else note),
-                        "Aさん": p1_n, "Aタイプ": p1_t, "A着順": p1_r,
-                        "Bさん": p2_n, "Bタイプ": p2_t, "B着順": p2_r,
-                        "Cさん": p3_n, "Cタイプ": p3_t, "C着順": p3_r
-                    }
-                    
-                    changes = []
-                    compare_keys = [
-                        ("備考", "備考"),
-                        ("A名前", "Aさん"), ("A着順", "A着順"), ("Aタイプ", "Aタイプ"),
-                        ("B名前", "Bさん"), ("B着順", "B着順"), ("Bタイプ", "Bタイプ"),
-                        ("C名前", "Cさん"), ("C着順", "C着順"), ("Cタイプ", "Cタイプ"),
-                    ]
-                    for label, key in compare_keys:
-                        old_val = row[key]
-                        new_val = new_data[key]
-                        if str(old_val) != str(new_val):
-                            changes.append(f"{label}: {old_val}→{new_val}")
-                    
-                    diff_text = ", ".join(changes) if changes else "変更なし"
-                    
-                    idx = df_latest[df_latest["GameNo"] == edit_id].index[0]
-                    df_latest.loc[idx, list(new_data.keys())] = list(new_data.values())
-                    save_score_data(df_latest)
-                    
-                    save_action_log("修正", row["DailyNo"], diff_text)
+                    record_score_change(
+                        [("修正", row["DailyNo"], diff_text)],
+                        [score_event(EVENT_UPDATE, edit_id, before=before, after=new_data)],
+                    )
                     
                     st.session_state["success_msg"] = "✅ 修正しました！"
                     st.session_state["page"] = "input"
@@ -626,15 +1774,11 @@ def page_edit():
                     st.rerun()
         
         if submit_delete:
-            fetch_data_cached.clear()
-            df_latest = load_score_data_fresh()
-            
-            if edit_id in df_latest["GameNo"].values:
-                df_latest = df_latest[df_latest["GameNo"] != edit_id]
-                save_score_data(df_latest)
-                
+            # 行は残して削除日時を付ける（読み込み時に除外される）
+            before = read_score_row(edit_id, row.get("シート行"), row.get("シート名"))
+            if before is not None and soft_delete_score_row(edit_id, row.get("シート行"), row.get("シート名")):
                 del_info = f"{row['日時']} {row['TableNo']}卓 Set{row['SetNo']} (A:{row['Aさん']}, B:{row['Bさん']}, C:{row['Cさん']})"
-                save_action_log("削除", row["DailyNo"], del_info)
+                record_score_change([("削除", row["DailyNo"], del_info)], [score_event(EVENT_DELETE, edit_id, before=before)])
                 
                 st.session_state["success_msg"] = "🗑 削除しました"
                 st.session_state["page"] = "input"
@@ -648,8 +1792,12 @@ def page_input():
     st.title("📝 成績入力")
     if "success_msg" in st.session_state and st.session_state.get("success_msg"):
         st.success(st.session_state["success_msg"])
+        import streamlit.components.v1 as components  # スクロール用のスクリプトを入れるときだけ読み込む
         components.html("""<script>try{var main=window.parent.document.querySelector('section.main');if(main){main.scrollTo(0,0);}window.parent.scrollTo(0,0);}catch(e){console.log(e);}</script>""", height=0)
         st.session_state["success_msg"] = None 
+    if st.session_state.get("warning_msg"):
+        st.warning(st.session_state["warning_msg"])
+        st.session_state["warning_msg"] = None
     if st.button("🏠 ホームに戻る"):
         st.session_state["page"] = "home"
         st.rerun()
@@ -660,7 +1808,7 @@ def page_input():
     
     c_top1, c_top2 = st.columns(2)
     with c_top1:
-        current_table = st.selectbox("入力する卓を選択してください", [1, 2, 3], index=0)
+        current_table = st.selectbox("入力する卓を選択してください", TABLE_NOS, index=0)
     with c_top2:
         current_dt = datetime.now(JST)
         default_date_obj = (current_dt - timedelta(hours=9)).date()
@@ -707,8 +1855,7 @@ def page_input():
     st.markdown(f"**▼ A席**")
     c1, c2 = st.columns([1, 2])
     with c1:
-        idx1 = member_list.index(last_n1) if last_n1 in member_list else None
-        n1 = st.selectbox("名前", member_list, index=idx1, key="p1_name_input")
+        n1 = player_select("名前", member_list, last_n1, "p1_name_input")
     with c2:
         r1 = st.radio("着順", [1, 2, 3], index=1, horizontal=True, key="p1_rank_input")
         TYPE_OPTS = ["A客", "B客", "AS", "BS"]
@@ -720,8 +1867,7 @@ def page_input():
     c1, c2 = st.columns([1, 2])
     ranks_for_2 = [x for x in [1, 2, 3] if x != r1]
     with c1:
-        idx2 = member_list.index(last_n2) if last_n2 in member_list else None
-        n2 = st.selectbox("名前", member_list, index=idx2, key="p2_name_input")
+        n2 = player_select("名前", member_list, last_n2, "p2_name_input")
     with c2:
         r2 = st.radio("着順", ranks_for_2, index=0, horizontal=True, key="p2_rank_input")
         t_idx2 = TYPE_OPTS.index(last_t2) if last_t2 in TYPE_OPTS else 1
@@ -732,17 +1878,25 @@ def page_input():
     c1, c2 = st.columns([1, 2])
     ranks_for_3 = [x for x in ranks_for_2 if x != r2]
     with c1:
-        idx3 = member_list.index(last_n3) if last_n3 in member_list else None
-        n3 = st.selectbox("名前", member_list, index=idx3, key="p3_name_input")
+        n3 = player_select("名前", member_list, last_n3, "p3_name_input")
     with c2:
         r3 = st.radio("着順", ranks_for_3, index=0, horizontal=True, key="p3_rank_input")
         t_idx3 = TYPE_OPTS.index(last_t3) if last_t3 in TYPE_OPTS else 2
         t3 = st.radio("タイプ", TYPE_OPTS, index=t_idx3, horizontal=True, key="p3_type_input")
     st.markdown("---")
 
+    # トップの人がこの卓で今日何連勝目になるか（「５連勝〜」の付け忘れ・付け間違いを防ぐ）
+    winner = {r1: n1, r2: n2, r3: n3}.get(1)
+    win_streak = session_top_streak(df_today, winner) + 1 if winner else 0
+
     st.markdown("**▼ 備考**")
     NOTE_OPTS = ["なし", "東１終了", "２人飛ばし", "５連勝〜"]
-    note = st.radio("内容を選択", NOTE_OPTS, index=0, horizontal=True)
+    note_idx = NOTE_OPTS.index(FIVE_WIN_NOTE) if win_streak >= FIVE_WIN_MIN else 0
+    note = st.radio("内容を選択", NOTE_OPTS, index=note_idx, horizontal=True)
+    if win_streak >= FIVE_WIN_MIN and note != FIVE_WIN_NOTE:
+        st.info(f"💡 {winner} さんはこの卓で {win_streak} 連勝目です（備考「{FIVE_WIN_NOTE}」の対象です）")
+    elif note == FIVE_WIN_NOTE and win_streak < FIVE_WIN_MIN:
+        st.warning(f"⚠️ {winner or 'トップの人'} さんはこの卓で {win_streak} 連勝目です。「{FIVE_WIN_NOTE}」は{FIVE_WIN_MIN}連勝目からです")
     st.write(f"**次の記録: No.{next_display_no}**")
     
     st.caption(f"【{current_table}卓】 第 {current_set_no} セット")
@@ -755,7 +1909,7 @@ def page_input():
             st.error("⚠️ 名前が選択されていません！")
         else:
             with st.spinner("サーバーに書き込み中..."):
-                fetch_data_cached.clear()
+                fetch_sheets_cached.clear()
                 
                 # 安全にロード
                 try:
@@ -807,10 +1961,14 @@ def page_input():
                 
                 # 最新データに対して結合
                 df_final = pd.concat([df_latest, pd.DataFrame([new_row])], ignore_index=True)
-                save_score_data(df_final)
                 
+                # スコアとログは並行して書き込む
                 log_detail = f"新規: {current_table}卓 No.{next_display_no}"
-                save_action_log("新規登録", next_internal_game_no, log_detail)
+                score_error, log_error = save_score_and_logs(
+                    df_final, [("新規登録", next_internal_game_no, log_detail)],
+                    [score_event(EVENT_INSERT, next_internal_game_no, after=new_row)],
+                )
+                report_write_failure(score_error, log_error, next_internal_game_no)
                 
             time_str = now_jst.strftime("%H:%M")
             st.session_state["success_msg"] = f"✅ 記録しました！ ({time_str} / No.{next_display_no})"
@@ -821,47 +1979,7 @@ def page_input():
     if not df_today.empty:
         st.markdown("### 📋 本日の履歴")
 
-        total_fee_today = 0
-        type_counts = {"A客": 0, "B客": 0, "AS": 0, "BS": 0}
-        total_back_a = 0
-        total_back_b = 0
-        FEE_MAP = {"A客": 3, "B客": 5, "AS": 1, "BS": 1}
-
-        for _, row in df_today.iterrows():
-            w_type = None
-            try:
-                r_a = int(float(row["A着順"]))
-                r_b = int(float(row["B着順"]))
-                r_c = int(float(row["C着順"]))
-            except:
-                r_a, r_b, r_c = 0, 0, 0
-
-            # トップ者のタイプ判定
-            winner_type = None
-            if r_a == 1: winner_type = row["Aタイプ"]
-            elif r_b == 1: winner_type = row["Bタイプ"]
-            elif r_c == 1: winner_type = row["Cタイプ"]
-
-            # 自分のタイプ判定
-            if r_a == 1: w_type = row["Aタイプ"]
-            elif r_b == 1: w_type = row["Bタイプ"]
-            elif r_c == 1: w_type = row["Cタイプ"]
-
-            if w_type in type_counts:
-                type_counts[w_type] += 1
-                total_fee_today += FEE_MAP[w_type]
-
-            note = str(row["備考"])
-            discount = 0
-            if note == "東１終了": discount = 1
-            elif note == "２人飛ばし": discount = 2
-            elif note == "５連勝〜": discount = 5
-            
-            total_fee_today -= discount
-            
-            if discount > 0 and winner_type:
-                if winner_type == "A客": total_back_a += discount
-                elif winner_type == "B客": total_back_b += discount
+        total_fee_today, total_back_a, total_back_b, type_counts = calculate_day_totals(df_today)
 
         st.info(f"💰 **本日の合計:** ゲーム代 **{total_fee_today}** 枚  \n"
                 f"🎁 **バック:** A客: **{total_back_a}** 枚 / B客: **{total_back_b}** 枚  \n"
@@ -899,6 +2017,232 @@ def page_input():
     else:
         st.info("今日のデータはまだありません")
 
+# --- 一括入力画面 (紙の集計表の転記用) ---
+def page_batch():
+    st.title("🗂 まとめて入力")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.rerun()
+    st.info("紙の集計表を1セット分まとめて転記します。全行をチェックしてから1回で保存します。")
+
+    df = load_score_data()
+    member_list = get_all_member_names()
+    JST = timezone(timedelta(hours=9), 'JST')
+
+    c_top1, c_top2, c_top3 = st.columns(3)
+    with c_top1:
+        batch_table = st.selectbox("卓", TABLE_NOS, index=0, key="batch_table")
+    with c_top2:
+        default_date_obj = (datetime.now(JST) - timedelta(hours=9)).date()
+        batch_date = st.date_input("日付 (朝9時切替)", value=default_date_obj, key="batch_date")
+
+    df_table = df[df["TableNo"] == batch_table]
+    df_day = df_table[df_table["論理日付"] == batch_date] if not df_table.empty else pd.DataFrame()
+    next_set_no = int(df_day["SetNo"].max()) + 1 if not df_day.empty else 1
+
+    with c_top3:
+        batch_set = st.number_input("セット", min_value=1, value=next_set_no, step=1, key="batch_set")
+
+    TYPE_OPTS = ["A客", "B客", "AS", "BS"]
+    NOTE_OPTS = ["なし", "東１終了", "２人飛ばし", "５連勝〜"]
+    column_config = {
+        "時刻": st.column_config.TextColumn("時刻", help="HH:MM (例 21:05)", required=True),
+        "備考": st.column_config.SelectboxColumn("備考", options=NOTE_OPTS, default="なし"),
+    }
+    for seat, def_type in zip(["A", "B", "C"], ["A客", "B客", "AS"]):
+        column_config[f"{seat}さん"] = st.column_config.SelectboxColumn(f"{seat}さん", options=member_list, required=True)
+        column_config[f"{seat}タイプ"] = st.column_config.SelectboxColumn(f"{seat}タイプ", options=TYPE_OPTS, default=def_type, required=True)
+        column_config[f"{seat}着順"] = st.column_config.SelectboxColumn(f"{seat}着順", options=[1, 2, 3], required=True)
+
+    with st.form("batch_form"):
+        df_edit = st.data_editor(
+            pd.DataFrame(columns=BATCH_COLS),
+            column_config=column_config,
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="batch_editor"
+        )
+        submitted = st.form_submit_button("📝 まとめて記録する", type="primary", use_container_width=True)
+
+    if not submitted:
+        return
+
+    # 何も入力されていない行は無視する
+    df_rows = df_edit.mask(df_edit == "").dropna(how="all").reset_index(drop=True)
+    if df_rows.empty:
+        st.warning("入力された行がありません")
+        return
+
+    errors = validate_batch_rows(df_rows)
+    if (errors != "").any():
+        st.error("⚠️ 入力に不備があります。以下の行を修正してください（何も保存していません）。")
+        df_err = df_rows[errors != ""].copy()
+        df_err.insert(0, "行", df_err.index + 1)
+        df_err.insert(1, "エラー", errors[errors != ""])
+        st.dataframe(df_err, hide_index=True, use_container_width=True)
+        return
+
+    with st.spinner("サーバーに書き込み中..."):
+        fetch_sheets_cached.clear()
+        df_latest = load_score_data_fresh()
+
+        # 【安全装置】
+        if not df.empty and df_latest.empty:
+            st.error("🚨 エラー：最新データの取得に失敗しました（データが0件です）。データ消失を防ぐため保存を中止しました。")
+            st.stop()
+
+        first_game_no = int(df_latest["GameNo"].max()) + 1 if not df_latest.empty else 1
+        df_new = build_batch_rows(df_rows, batch_table, int(batch_set), batch_date, first_game_no)
+
+        df_final = process_score_df(pd.concat([df_latest[EXPECTED_COLS], df_new], ignore_index=True))
+
+        # 表示用の DailyNo は全件を並べ直した結果から一括で取得する
+        new_rows = df_final[df_final["GameNo"].isin(df_new["GameNo"])].sort_values("GameNo")
+        log_entries = [
+            ("新規登録", r["GameNo"], f"一括: {batch_table}卓 No.{r['DailyNo']}")
+            for _, r in new_rows.iterrows()
+        ]
+        events = [score_event(EVENT_INSERT, r["GameNo"], after=r) for _, r in new_rows.iterrows()]
+        score_error, log_error = save_score_and_logs(df_final, log_entries, events)
+        report_write_failure(score_error, log_error, f"{first_game_no}〜{first_game_no + len(df_new) - 1}")
+
+    st.session_state["success_msg"] = f"✅ {len(df_new)} 件をまとめて記録しました！ ({batch_table}卓 第{int(batch_set)}セット)"
+    st.session_state["page"] = "input"
+    st.rerun()
+
+# --- 過去データ取込画面 ---
+def page_import():
+    st.title("📥 過去データの取込")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.rerun()
+    st.info("score シートと同じ列 (GameNo, TableNo, SetNo, 日時, 備考, A〜Cさん/タイプ/着順) の CSV・Excel を取り込みます。"
+            "GameNo は既存データと重ならないよう振り直します。")
+
+    with st.form("import_form"):
+        uploaded = st.file_uploader("ファイルを選択", type=["csv", "xlsx", "xlsm"])
+        c1, c2 = st.columns(2)
+        with c1:
+            enc_label = st.selectbox("CSVの文字コード", ["UTF-8", "Shift_JIS (Excel保存)"])
+        with c2:
+            allow_unknown = st.checkbox("未登録メンバーを含む行も取り込む")
+        submitted = st.form_submit_button("🔍 チェックして取り込む", type="primary", use_container_width=True)
+
+    if not submitted or uploaded is None:
+        return
+
+    encoding = "utf-8-sig" if enc_label == "UTF-8" else "cp932"
+    known_members = load_member_data()["名前"].tolist()
+
+    accepted, rejected = [], []
+    line_offset = 0
+    status = st.empty()
+    try:
+        for chunk in iter_import_chunks(uploaded, encoding=encoding):
+            chunk.index = range(line_offset + 2, line_offset + 2 + len(chunk))  # ファイル上の行番号
+            line_offset += len(chunk)
+
+            chunk.columns = chunk.columns.astype(str).str.strip()
+            missing_cols = [c for c in EXPECTED_COLS if c not in chunk.columns]
+            if missing_cols:
+                st.error(f"⚠️ ファイルの形式が正しくありません。以下の列が見つかりません: {missing_cols}")
+                return
+
+            chunk = chunk[EXPECTED_COLS].dropna(how="all")
+            chunk, reasons = validate_import_chunk(chunk, known_members, allow_unknown)
+            accepted.append(chunk[reasons == ""])
+            rejected.append(chunk[reasons != ""].assign(理由=reasons[reasons != ""]))
+            status.caption(f"{line_offset} 行をチェックしました...")
+    except (UnicodeDecodeError, ValueError) as e:
+        st.error(f"ファイルを読み込めませんでした（文字コード・形式を確認してください）: {e}")
+        return
+
+    df_import = pd.concat(accepted) if accepted else pd.DataFrame(columns=EXPECTED_COLS)
+    df_rejected = pd.concat(rejected) if rejected else pd.DataFrame()
+
+    with st.spinner("サーバーに書き込み中..."):
+        fetch_sheets_cached.clear()
+        df_latest = load_score_data_fresh()
+
+        if not df_import.empty:
+            in_existing, in_file = find_duplicate_games(df_import, df_latest)
+            dup = in_existing | in_file
+            dup_reason = pd.Series("登録済みの対局", index=df_import.index).where(in_existing, "ファイル内で重複")
+            df_rejected = pd.concat([df_rejected, df_import[dup].assign(理由=dup_reason[dup])])
+            df_import = df_import[~dup]
+
+        if not df_import.empty:
+            start_no = int(df_latest["GameNo"].max()) + 1 if not df_latest.empty else 1
+            df_import = remap_import_game_no(df_import, start_no)
+            for col in ["TableNo", "SetNo", "A着順", "B着順", "C着順"]:
+                df_import[col] = df_import[col].astype(int)
+
+            # 既存データとまとめて1回で保存する
+            save_score_data(pd.concat([df_latest[EXPECTED_COLS], df_import[EXPECTED_COLS]], ignore_index=True))
+            record_score_change(
+                [(
+                    "一括取込", f"{df_import['GameNo'].min()}〜{df_import['GameNo'].max()}",
+                    f"{uploaded.name}: {len(df_import)} 件取込 / {len(df_rejected)} 件除外"
+                )],
+                [score_event(EVENT_INSERT, r["GameNo"], after=r) for _, r in df_import.iterrows()],
+            )
+    status.empty()
+
+    if df_import.empty:
+        st.warning("取り込める行がありませんでした")
+    else:
+        st.success(f"✅ {len(df_import)} 件を取り込みました (GameNo {df_import['GameNo'].min()}〜{df_import['GameNo'].max()})")
+
+    if not df_rejected.empty:
+        st.warning(f"⚠️ {len(df_rejected)} 件は取り込みませんでした")
+        df_rejected = df_rejected.rename_axis("行").reset_index()
+        st.dataframe(df_rejected[["行", "理由"] + EXPECTED_COLS], hide_index=True, use_container_width=True)
+        st.download_button(
+            "除外した行をCSVでダウンロード",
+            df_rejected.to_csv(index=False).encode("utf-8-sig"),
+            file_name="import_rejected.csv",
+            mime="text/csv"
+        )
+
+# --- 全卓モニター画面 ---
+@st.fragment(run_every=MONITOR_REFRESH_SEC)
+def monitor_board():
+    state = refresh_monitor_state(st.session_state.get("monitor_state"))
+    st.session_state["monitor_state"] = state
+
+    df_raw = join_partitions({name: sheet["raw"] for name, sheet in state["sheets"].items()})
+    df_today = process_score_df(df_raw) if not df_raw.empty else pd.DataFrame()
+    st.caption(f"最終更新: {datetime.now(timezone(timedelta(hours=9), 'JST')).strftime('%H:%M:%S')} "
+               f"/ {state['date']} / {MONITOR_REFRESH_SEC}秒ごとに今日の対局だけを取得")
+
+    cols = st.columns(len(TABLE_NOS))
+    for col, table_no in zip(cols, TABLE_NOS):
+        with col:
+            st.markdown(f"### 🀄 {table_no}卓")
+            df_table = df_today[df_today["TableNo"] == table_no] if not df_today.empty else pd.DataFrame()
+            if df_table.empty:
+                st.info("本日の対局はまだありません")
+                continue
+
+            fee, back_a, back_b, type_counts = calculate_day_totals(df_table)
+            m1, m2, m3 = st.columns(3)
+            m1.metric("ゲーム数", f"{len(df_table)}")
+            m2.metric("ゲーム代", f"{fee} 枚")
+            m3.metric("バック A/B", f"{back_a} / {back_b}")
+
+            # 進行中のセット (最新のセット) だけを紙の形式で表示
+            current_set = df_table["SetNo"].max()
+            render_paper_sheet(df_table[df_table["SetNo"] == current_set])
+
+def page_monitor():
+    st.title("📺 全卓モニター")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.session_state["monitor_state"] = None
+        st.rerun()
+    monitor_board()
+
 # --- 履歴画面 ---
 def page_history():
     st.title("📊 過去データ参照")
@@ -911,38 +2255,16 @@ def page_history():
         st.info("データがありません")
         return
 
-    # 全期間統計
+    # 全期間統計（対局を1つずつ見ずに、日付・卓・セットごとの台帳を足し合わせる）
     st.markdown("### 📈 全期間の統計")
-    total_games = len(df)
-    unique_days = df["論理日付"].nunique()
+    ledger = get_ledger(df, data_version(df))
+    totals = ledger.totals()
+    total_games = totals["ゲーム数"]
+    unique_days = totals["日数"]
     avg_games_day = total_games / unique_days if unique_days > 0 else 0
 
-    total_back_a = 0
-    total_back_b = 0
-    
-    for _, row in df.iterrows():
-        note = str(row["備考"])
-        discount = 0
-        if note == "東１終了": discount = 1
-        elif note == "２人飛ばし": discount = 2
-        elif note == "５連勝〜": discount = 5
-
-        if discount > 0:
-            winner_type = None
-            try:
-                r_a = int(float(row["A着順"]))
-                r_b = int(float(row["B着順"]))
-                r_c = int(float(row["C着順"]))
-            except:
-                r_a, r_b, r_c = 0, 0, 0
-                
-            if r_a == 1: winner_type = row["Aタイプ"]
-            elif r_b == 1: winner_type = row["Bタイプ"]
-            elif r_c == 1: winner_type = row["Cタイプ"]
-            
-            if winner_type == "A客": total_back_a += discount
-            elif winner_type == "B客": total_back_b += discount
-
+    total_back_a = totals["バックA"]
+    total_back_b = totals["バックB"]
     avg_back_a = total_back_a / unique_days if unique_days > 0 else 0
     avg_back_b = total_back_b / unique_days if unique_days > 0 else 0
 
@@ -952,6 +2274,14 @@ def page_history():
     c3.metric("総バック (A)", f"{total_back_a} 枚", f"平均 {avg_back_a:.1f} 枚/日")
     c4.metric("総バック (B)", f"{total_back_b} 枚", f"平均 {avg_back_b:.1f} 枚/日")
 
+    with st.expander("📅 月ごとの集計"):
+        rows = ledger.table()
+        monthly = rows.groupby(pd.to_datetime(rows["論理日付"]).dt.strftime("%Y-%m")).agg(
+            日数=("論理日付", "nunique"), ゲーム数=("ゲーム数", "sum"), ゲーム代=("ゲーム代", "sum"),
+            バックA=("バックA", "sum"), バックB=("バックB", "sum"),
+        ).sort_index(ascending=False)
+        st.dataframe(monthly.rename_axis("月"), use_container_width=True)
+
     st.divider()
 
     if "論理日付" in df.columns:
@@ -963,6 +2293,8 @@ def page_history():
     all_players = get_all_member_names()
 
     st.markdown("### 🔍 日付と人物で絞り込み")
+    player_query = st.text_input("プレイヤー名で候補を絞る", key="history_player_q", placeholder="名前の一部（ひらがな可）")
+    all_players = search_names(all_players, player_query)
     with st.form("history_search_form"):
         c1, c2 = st.columns(2)
         with c1: 
@@ -978,15 +2310,9 @@ def page_history():
             st.warning("⚠️ 日付またはプレイヤーを選択して「絞り込み表示」ボタンを押してください")
             return
 
-        df_filtered = df.copy()
-        if sel_date != "(指定なし)":
-            df_filtered = df_filtered[df_filtered["論理日付"] == sel_date]
-        if sel_player != "(指定なし)":
-            df_filtered = df_filtered[
-                (df_filtered["Aさん"] == sel_player) | 
-                (df_filtered["Bさん"] == sel_player) | 
-                (df_filtered["Cさん"] == sel_player)
-            ]
+        day = sel_date if sel_date != "(指定なし)" else None
+        player = sel_player if sel_player != "(指定なし)" else None
+        df_filtered = filter_score_games(df, start=day, end=day, player=player)
 
         if df_filtered.empty:
             st.warning("条件に一致するデータが見つかりませんでした")
@@ -1021,10 +2347,24 @@ def page_history():
                     <tbody><tr><td>{games} 回</td><td>{avg:.2f}</td><td>{c1} 回<span class="stats-sub">({r1_rate:.1f}%)</span></td><td>{c2_cnt} 回<span class="stats-sub">({r2_rate:.1f}%)</span></td><td>{c3} 回<span class="stats-sub">({r3_rate:.1f}%)</span></td></tr></tbody></table>
                     """
                     st.markdown(stats_html, unsafe_allow_html=True)
+
+                    # 連続記録は絞り込みに関係なく全期間で数える
+                    st.markdown("##### 🔥 連続記録 (全期間)")
+                    streak = get_streaks(df, data_version(df)).get(sel_player)
+                    long = ordered_ranks(filter_score_games(df, player=sel_player))
+                    sessions = streak_table(long[long["name"] == sel_player], by=("name", "論理日付", "TableNo"))
+                    best_session = int(sessions["top_longest"].max()) if not sessions.empty else 0
+                    s1, s2, s3, s4, s5 = st.columns(5)
+                    s1.metric("最長連続トップ", f"{streak['top'][0]} 連続")
+                    s2.metric("現在の連続トップ", f"{streak['top'][1]} 連続")
+                    s3.metric("最長連続ラス", f"{streak['last'][0]} 連続")
+                    s4.metric("現在の連続ラス", f"{streak['last'][1]} 連続")
+                    s5.metric("1日1卓での最長連勝", f"{best_session} 連勝")
                     st.divider()
                     c_graph, c_dates = st.columns([2, 1])
                     with c_graph:
                         st.markdown("##### 📊 着順分布")
+                        import altair as alt  # グラフを描くときだけ読み込む
                         source = pd.DataFrame({
                             "着順": ["1着", "2着", "3着"],
                             "回数": [c1, c2_cnt, c3]
@@ -1043,6 +2383,27 @@ def page_history():
                         st.markdown("##### 📅 稼働日リスト")
                         date_list = sorted(list(played_dates), reverse=True)
                         st.dataframe(pd.DataFrame(date_list, columns=["日付"]), hide_index=True, use_container_width=True)
+
+                    st.markdown("##### 📈 成績の推移 (移動平均)")
+                    c_win, c_method = st.columns(2)
+                    with c_win:
+                        window = st.select_slider("直近何局で平均するか", TREND_WINDOWS, value=20, key="trend_window")
+                    with c_method:
+                        method_label = st.radio("表示する点", list(TREND_METHODS.values()), horizontal=True, key="trend_method")
+                    method = next(k for k, v in TREND_METHODS.items() if v == method_label)
+                    trend = get_player_trend(df_filtered, data_version(df_filtered), sel_player, window, method)
+                    if len(trend) >= 2:
+                        x_enc = alt.X("対局数:Q", title="対局数")
+                        tooltip = ["対局数", alt.Tooltip("論理日付:T", title="日付"),
+                                   alt.Tooltip("平均着順:Q", format=".2f"), alt.Tooltip("トップ率:Q", format=".1f")]
+                        avg_line = alt.Chart(trend).mark_line(color="#1f77b4").encode(
+                            x=x_enc, y=alt.Y("平均着順:Q", scale=alt.Scale(domain=[1, 3], reverse=True)), tooltip=tooltip,
+                        )
+                        top_line = alt.Chart(trend).mark_line(color="#d62728", strokeDash=[4, 2]).encode(
+                            x=x_enc, y=alt.Y("トップ率:Q", title="トップ率 (%)", scale=alt.Scale(domain=[0, 100])), tooltip=tooltip,
+                        )
+                        st.altair_chart(alt.layer(avg_line, top_line).resolve_scale(y="independent"), use_container_width=True)
+                        st.caption(f"青: 平均着順 (上ほど良い) / 赤の点線: トップ率 ・ {games} 局を {len(trend)} 点で表示")
             else:
                 st.markdown(f"#### 📝 集計表")
                 render_paper_sheet(df_filtered)
@@ -1064,112 +2425,202 @@ def page_ranking():
         st.info("データがありません")
         return
 
-    # 日付範囲フィルター
-    valid_dates = pd.to_datetime(df["論理日付"]).dropna()
-    if not valid_dates.empty:
-        min_date = valid_dates.min().date()
-        max_date = valid_dates.max().date()
-    else:
-        min_date = date.today()
-        max_date = date.today()
+    today = logical_today()
+    version = data_version(df)
 
     c1, c2 = st.columns(2)
     with c1:
-        date_range = st.date_input(
-            "📅 集計期間",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date
-        )
-    
-    if len(date_range) == 2:
-        start_d, end_d = date_range
-        mask = (df["論理日付"] >= start_d) & (df["論理日付"] <= end_d)
-        df_filtered = df[mask]
+        period = st.radio("📅 集計期間", list(RANKING_VIEWS.values()) + ["期間指定"], horizontal=True)
+
+    if period == "期間指定":
+        # 日付範囲フィルター
+        valid_dates = pd.to_datetime(df["論理日付"]).dropna()
+        if not valid_dates.empty:
+            min_date = valid_dates.min().date()
+            max_date = valid_dates.max().date()
+        else:
+            min_date = date.today()
+            max_date = date.today()
+
+        with c2:
+            date_range = st.date_input(
+                "期間",
+                value=(min_date, max_date),
+                min_value=min_date,
+                max_value=max_date
+            )
+        if len(date_range) == 2:
+            board = get_range_rankings(df, version, date_range[0], date_range[1], get_local_store())
+            range_key = ("range", date_range[0], date_range[1])
+        else:
+            board = get_ranking_snapshot(df, version, today)["all"]
+            range_key = period_key("all", today)
     else:
-        df_filtered = df
+        view = next(k for k, v in RANKING_VIEWS.items() if v == period)
+        board = get_ranking_snapshot(df, version, today)[view]
+        range_key = period_key(view, today)
 
-    if df_filtered.empty:
+    if board.player_count == 0:
         st.warning("指定された期間のデータはありません")
         return
 
-    records = []
-    for _, row in df_filtered.iterrows():
-        for seat in ["A", "B", "C"]:
-            name = row[f"{seat}さん"]
-            rank = row[f"{seat}着順"]
-            if name:
-                try: r = int(float(rank))
-                except: r = 0
-                if r > 0:
-                    records.append({"name": name, "rank": r})
+    min_games = st.slider("規定打数 (これ以下の人はランキングに表示しません)", 1, 500, 5)
+    by_bound = st.toggle(
+        "🎯 控えめな値で順位をつける", key="rank_by_bound",
+        help="平均着順は信頼区間の悪い側の端、トップ率は下限で並べます。打数が少なく結果がぶれやすい人ほど順位が下がります",
+    )
     
-    if not records:
-        st.warning("集計できるデータがありません")
+    if board.top("games", min_games, 1).empty:
+        st.warning(f"打数が {min_games} 回以上のプレイヤーがいません。")
         return
 
-    df_raw = pd.DataFrame(records)
-    
-    stats = df_raw.groupby("name")["rank"].agg(
-        games="count",
-        avg_rank="mean",
-        first_count=lambda x: (x==1).sum(),
-        third_count=lambda x: (x==3).sum()
-    ).reset_index()
-
-    stats["top_rate"] = (stats["first_count"] / stats["games"]) * 100
-    stats["last_avoid_rate"] = ((stats["games"] - stats["third_count"]) / stats["games"]) * 100
-    
-    min_games = st.slider("規定打数 (これ以下の人はランキングに表示しません)", 1, 500, 5)
-    
-    filtered_stats = stats[stats["games"] >= min_games].copy()
-    
-    if filtered_stats.empty:
+    st.write("---")
+    intervals = get_rank_intervals(board, version, range_key)
+    render_ranking_tabs(board, min_games, get_ratings(df, version), intervals, by_bound)
+
+# --- 店舗横断ランキング画面 ---
+def page_shops():
+    st.title("🏬 店舗横断ランキング")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.rerun()
+
+    with st.spinner("全店舗のデータを読み込んでいます..."):
+        frames, errors = load_all_shops()
+    for shop, err in errors.items():
+        st.warning(f"⚠️ {shop} のデータを読み込めませんでした ({err})")
+    if not frames:
+        st.info("データがありません")
+        return
+
+    today = logical_today()
+    period = st.radio("📅 集計期間", list(RANKING_VIEWS.values()), horizontal=True, key="shops_period")
+    view = next(k for k, v in RANKING_VIEWS.items() if v == period)
+
+    # 店舗ごとの集計 (打数・着順別回数) を足し合わせる。生データはつなげない
+    rollups = {shop: get_shop_rollup(df, shop, data_version(df), view, today) for shop, df in frames.items()}
+    merged = merge_rollups(rollups)
+    if merged.empty:
+        st.warning("指定された期間のデータはありません")
+        return
+    st.caption(" / ".join(f"{shop}: {int(r['games'].sum()) // 3 if not r.empty else 0} 局" for shop, r in rollups.items()))
+
+    min_games = st.slider("規定打数 (これ以下の人はランキングに表示しません)", 1, 500, 5, key="shops_min_games")
+    board = Leaderboard.from_totals(rollup_totals(merged))
+    if board.top("games", min_games, 1).empty:
         st.warning(f"打数が {min_games} 回以上のプレイヤーがいません。")
         return
 
     st.write("---")
-    
-    t1, t2, t3, t4 = st.tabs(["📊 打数", "🥇 平均着順", "👑 トップ率", "🛡 ラス回避率"])
-    
-    with t1:
-        st.subheader("📊 打数ランキング (Top 5)")
-        res = filtered_stats.sort_values("games", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        st.dataframe(
-            res[["順位", "name", "games"]].rename(columns={"name":"名前", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
+    render_ranking_tabs(board, min_games, None)
+
+    st.markdown("### 👥 メンバー別 (全店舗合計)")
+    shop_cols = [c for c in merged.columns if c.startswith("打数_")]
+    df_members = merged[merged["games"] >= min_games].sort_values("games", ascending=False)
+    table = pd.DataFrame({
+        "名前": df_members.index,
+        "来店店舗数": df_members["shops"].values,
+        "打数": df_members["games"].values,
+        "平均着順": (df_members["rank_sum"] / df_members["games"]).map("{:.2f}".format).values,
+        "トップ率": (df_members["first_count"] / df_members["games"] * 100).map("{:.1f}%".format).values,
+        "ラス回避率": ((df_members["games"] - df_members["third_count"]) / df_members["games"] * 100).map("{:.1f}%".format).values,
+        "最終日": df_members["last_date"].values,
+    })
+    for col in shop_cols:
+        table[col] = df_members[col].values
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+# --- 詳細集計画面 (キューブ) ---
+def page_cube():
+    st.title("🧊 詳細集計")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.rerun()
+    st.caption("プレイヤー・席・タイプ・備考・月の組み合わせで成績を絞り込みます（例: 〇〇さんの今月のB客・C席のトップ率）")
 
-    with t2:
-        st.subheader("🥇 平均着順ランキング (Top 5)")
-        res = filtered_stats.sort_values("avg_rank", ascending=True).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["avg_rank"] = res["avg_rank"].map('{:.2f}'.format)
-        st.dataframe(
-            res[["順位", "name", "avg_rank", "games"]].rename(columns={"name":"名前", "avg_rank":"平均着順", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
+    df = load_score_data()
+    if df.empty:
+        st.info("データがありません")
+        return
+    cube = get_stats_cube(df, data_version(df))
 
-    with t3:
-        st.subheader("👑 トップ率ランキング (Top 5)")
-        res = filtered_stats.sort_values("top_rate", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["top_rate"] = res["top_rate"].map('{:.1f}%'.format)
-        st.dataframe(
-            res[["順位", "name", "top_rate", "first_count", "games"]].rename(columns={"name":"名前", "top_rate":"トップ率", "first_count":"トップ回数", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
+    with st.form("cube_form"):
+        filters = {}
+        c1, c2 = st.columns(2)
+        with c1:
+            filters["name"] = st.multiselect("👤 プレイヤー", cube.dim_values("name"))
+            filters["type"] = st.multiselect("🏷 タイプ", cube.dim_values("type"))
+            filters["month"] = st.multiselect("📅 月", cube.dim_values("month")[::-1])
+        with c2:
+            filters["seat"] = st.multiselect("💺 席", cube.dim_values("seat"))
+            filters["note"] = st.multiselect("📝 備考", cube.dim_values("note"))
+            group_by = st.multiselect(
+                "集計の単位", CUBE_DIMS, default=["name"], format_func=lambda d: CUBE_DIM_LABELS[d]
+            )
+        st.form_submit_button("🔍 集計する", type="primary", use_container_width=True)
+
+    res = cube.query(filters, group_by)
+    if res.empty:
+        st.warning("条件に一致するデータがありません")
+        return
 
-    with t4:
-        st.subheader("🛡 ラス回避率ランキング (Top 5)")
-        res = filtered_stats.sort_values("last_avoid_rate", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["last_avoid_rate"] = res["last_avoid_rate"].map('{:.1f}%'.format)
-        st.dataframe(
-            res[["順位", "name", "last_avoid_rate", "games"]].rename(columns={"name":"名前", "last_avoid_rate":"ラス回避率", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
+    res = res.reset_index() if group_by else res
+    res = res.sort_values("games", ascending=False)
+    show_cols = list(group_by) + ["games", "avg_rank", "top_rate", "last_avoid_rate", "first_count", "second_count", "third_count"]
+    labels = {**CUBE_DIM_LABELS, "games": "打数", "avg_rank": "平均着順", "top_rate": "トップ率",
+              "last_avoid_rate": "ラス回避率", "first_count": "1着", "second_count": "2着", "third_count": "3着"}
+    st.dataframe(
+        res[show_cols].rename(columns=labels),
+        hide_index=True, use_container_width=True,
+        column_config={
+            "平均着順": st.column_config.NumberColumn(format="%.2f"),
+            "トップ率": st.column_config.NumberColumn(format="%.1f%%"),
+            "ラス回避率": st.column_config.NumberColumn(format="%.1f%%"),
+        }
+    )
+
+# --- 対戦成績画面 ---
+def page_versus():
+    st.title("⚔️ 対戦成績")
+    if st.button("🏠 ホームに戻る"):
+        st.session_state["page"] = "home"
+        st.rerun()
+    st.caption("同じ卓で打った回数と、どちらが上の着順だったかを表示します")
+
+    df = load_score_data()
+    if df.empty:
+        st.info("データがありません")
+        return
+    h2h = get_head_to_head(df, data_version(df))
+    member_list = get_all_member_names()
+
+    c1, c2 = st.columns(2)
+    with c1:
+        player = player_select("👤 プレイヤー", member_list, None, "vs_player")
+    with c2:
+        opponent = player_select("🆚 相手 (任意)", member_list, None, "vs_opponent")
+
+    if not player:
+        st.info("☝️ プレイヤーを選択してください")
+        return
+
+    if opponent and opponent != player:
+        shared, wins, losses = h2h.pair(player, opponent)
+        m1, m2, m3 = st.columns(3)
+        m1.metric("同卓数", f"{shared} 回")
+        m2.metric(f"{player} が上", f"{wins} 回", f"{wins / shared * 100:.1f}%" if shared else None)
+        m3.metric(f"{opponent} が上", f"{losses} 回")
+        st.divider()
+
+    st.markdown(f"#### 👤 {player} さんの対戦相手一覧")
+    res = h2h.row(player)
+    if res.empty:
+        st.info("対戦データがありません")
+        return
+    st.dataframe(
+        res, hide_index=True, use_container_width=True,
+        column_config={"勝率": st.column_config.NumberColumn(format="%.1f%%")}
+    )
 
 # --- ログ閲覧画面 ---
 def page_logs():
@@ -1178,20 +2629,107 @@ def page_logs():
         st.session_state["page"] = "home"
         st.rerun()
     
-    df_logs = load_log_data()
-    
-    if not df_logs.empty and "操作" in df_logs.columns:
-        target_actions = ["修正", "削除"]
-        df_logs = df_logs[df_logs["操作"].isin(target_actions)]
-    
-    if not df_logs.empty and "GameNo" in df_logs.columns:
-        df_logs = df_logs.rename(columns={"GameNo": "DailyNo"})
+    c_sync, _ = st.columns([1, 3])
+    with c_sync:
+        force = st.button("🔄 最新のログを取り込む")
+    try:
+        store = sync_log_store(force=force)
+    except Exception as e:
+        st.error(f"ログの読み込みに失敗しました: {e}")
+        return
 
-    if df_logs.empty:
-        st.info("修正・削除の履歴はありません")
+    # 絞り込みは手元のログ (SQLite) で行い、表示するページ分だけを取り出す
+    today = logical_today()
+    c1, c2, c3 = st.columns([2, 2, 1])
+    with c1:
+        date_range = st.date_input("📅 期間 (朝9時切替)", value=(today - timedelta(days=7), today))
+    with c2:
+        action_opts = sorted(set(store.actions()) | {"修正", "削除"})
+        actions = st.multiselect("操作", action_opts, default=["修正", "削除"])
+    with c3:
+        game_no = st.number_input("No. (0 = 指定なし)", min_value=0, value=0, step=1)
+
+    start, end = (list(date_range) + [None, None])[:2] if isinstance(date_range, (list, tuple)) else (date_range, date_range)
+    filters = {"start": start, "end": end or start, "actions": actions, "game_no": game_no or None}
+    total = store.count(**filters)
+    if total == 0:
+        st.info("条件に合うログはありません")
     else:
+        n_pages = (total - 1) // LOG_PAGE_SIZE + 1
+        page_no = st.number_input(f"ページ (全{n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+        offset = (page_no - 1) * LOG_PAGE_SIZE
+        st.caption(f"{total} 件中 {offset + 1}〜{min(offset + LOG_PAGE_SIZE, total)} 件目")
+        df_logs = store.query(limit=LOG_PAGE_SIZE, offset=offset, **filters)
+        df_logs = df_logs.rename(columns={"GameNo": "DailyNo"})
         st.dataframe(df_logs, use_container_width=True, hide_index=True)
 
+    st.divider()
+    st.markdown("### ↩️ 変更履歴 (取り消し・時点の再現)")
+    st.caption("登録・修正・削除は変更前後の内容つきで「events」シートに記録されています")
+    if st.toggle("変更履歴を読み込む", key="load_event_history"):
+        try:
+            history = sync_event_history()
+        except Exception as e:
+            st.error(f"変更履歴の読み込みに失敗しました: {e}")
+            history = None
+
+        if history is not None:
+            last = history.last_event()
+            if last is None:
+                st.info("記録された変更はまだありません")
+            else:
+                op, game_no, _, _, ts = last
+                st.write(f"直前の操作: **{ts} {op}** (GameNo {game_no})")
+                if st.button("↩️ この操作を取り消す"):
+                    with st.spinner("サーバーに書き込み中..."):
+                        undone = undo_score_event(last)
+                    if undone:
+                        st.success("✅ 取り消しました")
+                    else:
+                        st.error("この対局はその後に変更されているため取り消せません")
+
+                st.markdown("#### 🕰 時点の再現")
+                point = st.slider(
+                    "何件目の変更まで反映した時点か", min_value=history.base, max_value=history.processed,
+                    value=history.processed,
+                ) if history.processed > history.base else history.processed
+                df_point = state_to_df(history.state_at(point), EXPECTED_COLS)
+                st.caption(f"{point} 件目の時点: {len(df_point)} 局（{history.base} 件目より前には戻れません）")
+                st.dataframe(df_point, use_container_width=True, hide_index=True)
+
+    st.divider()
+    st.markdown("### 🧹 削除済みデータの整理")
+    st.caption("削除した対局はシート上に「削除日時」付きで残っています。まとめてシートから取り除きます。")
+    if st.button("削除済みの行を整理する"):
+        with st.spinner("サーバーに書き込み中..."):
+            removed = compact_score_data()
+        if removed:
+            save_action_log("整理", "", f"削除済み {removed} 行を整理")
+            st.success(f"✅ 削除済みの {removed} 行を整理しました")
+        else:
+            st.info("整理する行はありません")
+
+    if SCORE_PARTITION != "none":
+        st.divider()
+        st.markdown("### 📦 分割前の成績シートの取り込み")
+        st.caption(
+            "成績を卓ごと (・月ごと) のシートに分けて保存しています。分割を有効にする前の「score」シートの対局を、"
+            "対応するシートへ写します。同じ GameNo がすでにある対局は写しません。元の score シートは残りますが、以後は読み込みません。"
+        )
+        if st.button("score シートから取り込む"):
+            with st.spinner("サーバーに書き込み中..."):
+                try:
+                    moved = migrate_score_to_partitions()
+                except Exception as e:
+                    st.error(f"取り込みに失敗しました: {e}")
+                    st.stop()
+            if moved:
+                fetch_sheets_cached.clear()
+                save_action_log("整理", "", f"score シートから {moved} 局を分割シートへ取り込み")
+                st.success(f"✅ {moved} 局を取り込みました")
+            else:
+                st.info("取り込む対局はありません")
+
 # ==========================================
 # 6. メインルーティング
 # ==========================================
@@ -1209,6 +2747,18 @@ else:
         page_members()
     elif st.session_state["page"] == "input":
         page_input()
+    elif st.session_state["page"] == "batch":
+        page_batch()
+    elif st.session_state["page"] == "import":
+        page_import()
+    elif st.session_state["page"] == "monitor":
+        page_monitor()
+    elif st.session_state["page"] == "cube":
+        page_cube()
+    elif st.session_state["page"] == "shops":
+        page_shops()
+    elif st.session_state["page"] == "versus":
+        page_versus()
     elif st.session_state["page"] == "history":
         page_history()
     elif st.session_state["page"] == "edit":
@@ -1217,3 +2767,5 @@ else:
         page_ranking()
     elif st.session_state["page"] == "logs":
         page_logs()
+
+log_first_render(st.session_state["page"] if user_role != "guest" else "ranking")
@@ -0,0 +1,64 @@
+import unicodedata
+
+# ==========================================
+# 名前検索用の索引
+# 全角・半角 (NFKC)、ひらがな・カタカナ、大文字・小文字、空白の違いを無視して探す
+# ==========================================
+PREFIX_LEN = 3
+
+def normalize_name(name):
+    s = unicodedata.normalize("NFKC", str(name)).casefold()
+    # カタカナ (ァ〜ヶ) をひらがなに寄せる
+    s = "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in s)
+    return "".join(s.split())
+
+def _grams(s, n):
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+class NameIndex:
+    # names は表示したい順（最近打った人が先頭）で渡す
+    def __init__(self, names):
+        self.names = list(names)
+        self.norm = [normalize_name(n) for n in self.names]
+        self.prefix = {}   # 先頭 1〜PREFIX_LEN 文字 -> id のリスト
+        self.unigrams = {}  # 1文字 -> id の集合
+        self.bigrams = {}   # 2文字 -> id の集合
+        for i, s in enumerate(self.norm):
+            for k in range(1, min(len(s), PREFIX_LEN) + 1):
+                self.prefix.setdefault(s[:k], []).append(i)
+            for g in _grams(s, 1):
+                self.unigrams.setdefault(g, set()).add(i)
+            for g in _grams(s, 2):
+                self.bigrams.setdefault(g, set()).add(i)
+
+    def search(self, query, limit=30):
+        # 完全一致 → 前方一致 → 部分一致 の順、同じ順位なら元の並び順
+        q = normalize_name(query)
+        if not q:
+            return self.names[:limit]
+
+        if len(q) <= PREFIX_LEN:
+            prefixed = self.prefix.get(q, [])
+        else:
+            prefixed = [i for i in self.prefix.get(q[:PREFIX_LEN], []) if self.norm[i].startswith(q)]
+
+        grams = _grams(q, 2) if len(q) >= 2 else _grams(q, 1)
+        table = self.bigrams if len(q) >= 2 else self.unigrams
+        candidates = None
+        for g in grams:
+            ids = table.get(g, set())
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        contained = [i for i in sorted(candidates or []) if q in self.norm[i]]
+
+        seen = set()
+        ranked = []
+        exact = [i for i in prefixed if self.norm[i] == q]
+        for i in exact + prefixed + contained:
+            if i not in seen:
+                seen.add(i)
+                ranked.append(i)
+                if len(ranked) >= limit:
+                    break
+        return [self.names[i] for i in ranked]
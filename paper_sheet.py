@@ -0,0 +1,134 @@
+import pandas as pd
+
+from settlement import calculate_set_summary
+
+# ==========================================
+# 紙の成績表 (セットごとの表) の HTML
+# 画面 (main.py) と日次レポート (daily_report.py) で同じ表を出す
+# ==========================================
+PAPER_SHEET_CSS = """
+    .score-sheet {
+        border-collapse: collapse;
+        width: 100%;
+        max_width: 1000px;
+        margin-bottom: 20px;
+        font-family: "Hiragino Kaku Gothic ProN", Meiryo, sans-serif;
+        color: #000;
+        background-color: #fff;
+    }
+    .score-sheet th, .score-sheet td {
+        border: 1px solid #333;
+        padding: 6px 4px;
+        text-align: center;
+        font-size: 14px;
+        vertical-align: middle;
+    }
+    .score-sheet th {
+        background-color: #f2f2f2;
+        font-weight: bold;
+    }
+    .score-sheet .set-header {
+        background-color: #d9edf7;
+        text-align: left;
+        padding-left: 10px;
+        font-weight: bold;
+        font-size: 15px;
+    }
+    .rank-num {
+        font-weight: bold;
+        font-size: 16px;
+        margin-left: 5px;
+        display: inline-block;
+        width: 20px;
+        text-align: center;
+    }
+    .cell-top {
+        background-color: #e6f7ff !important; 
+    }
+    .rank-special {
+        background-color: #333;
+        color: #fff;
+        border-radius: 50%;
+        width: 22px;
+        height: 22px;
+        line-height: 22px;
+        font-size: 13px;
+    }
+    .score-sheet .summary-row td {
+        background-color: #fffbe6;
+        font-weight: bold;
+        border-top: 2px double #333;
+    }
+"""
+
+def iter_sheet_sets(df):
+    # (卓, セット, その対局) を卓・セット順に
+    groups = df.groupby(["TableNo", "SetNo"])
+    for table_no, set_no in sorted(groups.groups.keys()):
+        subset = groups.get_group((table_no, set_no)).sort_values("DailyNo")
+        if subset.empty: continue
+        yield table_no, set_no, subset
+
+def set_sheet_html(table_no, set_no, subset):
+    fee, stats = calculate_set_summary(subset)
+    
+    html = f'''
+    <table class="score-sheet">
+        <thead>
+            <tr class="set-header"><td colspan="6">📄 第 {int(set_no)} セット (卓: {int(table_no)})</td></tr>
+            <tr>
+                <th style="width:5%">No</th>
+                <th style="width:10%">時刻</th>
+                <th style="width:23%">A席</th>
+                <th style="width:23%">B席</th>
+                <th style="width:23%">C席</th>
+                <th style="width:16%">備考</th>
+            </tr>
+        </thead>
+        <tbody>'''
+    
+    last_names = {"A": None, "B": None, "C": None}
+    
+    # 時刻はまとめて変換する（読めない日時は空欄）
+    times = pd.to_datetime(subset["日時"], errors="coerce", format="mixed").dt.strftime("%H:%M").fillna("")
+
+    for (_, row), time_str in zip(subset.iterrows(), times):
+        ranks_html_list = []
+
+        for p_char in ["A", "B", "C"]:
+            try:
+                r_float = float(row[f"{p_char}着順"])
+                rank_val = str(int(r_float))
+            except: rank_val = "0"
+
+            is_1st = (rank_val == "1")
+            SPECIAL_NOTES = ["東１終了", "２人飛ばし", "５連勝〜"]
+            is_special = (row["備考"] in SPECIAL_NOTES) and is_1st
+            
+            td_class = ' class="cell-top"' if is_1st else ""
+            
+            if is_special:
+                rank_span = f'<span class="rank-num rank-special">❶</span>'
+            else:
+                char_map = {"1":"①", "2":"②", "3":"③"}
+                d_char = char_map.get(rank_val, rank_val)
+                color_style = "color:#000;"
+                rank_span = f'<span class="rank-num" style="{color_style}">{d_char}</span>'
+            
+            p_name = row[f"{p_char}さん"]
+            p_type = row[f"{p_char}タイプ"] 
+            
+            if p_name == last_names[p_char]:
+                display_text = ""
+            else:
+                display_text = f"{p_name}<span style='font-size:11px; color:#555; margin-left:3px;'>({p_type})</span>"
+                last_names[p_char] = p_name
+            
+            cell_content = f'<div style="display:flex; justify-content:space-between; align-items:center; padding:0 5px;"><span>{display_text}</span>{rank_span}</div>'
+            ranks_html_list.append(f'<td{td_class}>{cell_content}</td>')
+
+        note_txt = row["備考"] if row["備考"] else ""
+        html += f'<tr><td>{row["DailyNo"]}</td><td>{time_str}</td>{ranks_html_list[0]}{ranks_html_list[1]}{ranks_html_list[2]}<td style="color:red; font-size:12px;">{note_txt}</td></tr>'
+
+    html += f'<tr class="summary-row"><td colspan="2" style="text-align:right;">合計</td><td>ゲーム代: <span style="font-size:16px; color:#d9534f;">{fee}</span> 枚</td><td colspan="3" style="font-size:12px; text-align:left;">A客:{stats["A客"]} / B客:{stats["B客"]} / AS:{stats["AS"]} / BS:{stats["BS"]}</td></tr></tbody></table>'
+    return html
@@ -0,0 +1,109 @@
+import streamlit as st
+from confidence import CONFIDENCE_LEVEL, bootstrap_intervals, interval_label, top_by_bound
+from rating import RatingEngine
+from score_stats import Leaderboard, build_leaderboard, sync_leaderboards
+
+# ==========================================
+# ランキングの集計キャッシュと表示
+# main.py のランキング画面と ranking_view.py (閲覧専用) の両方から使う
+# ==========================================
+@st.cache_resource
+def get_leaderboard_store():
+    # 全期間・今月・今日のランキングをプロセス内で1つずつ持ち、データが変わるたびに差分で更新する
+    return {}
+
+@st.cache_resource(max_entries=4)
+def get_ranking_snapshot(_df, version, today):
+    # データの版ごとに一度だけ同期し、全セッションで読み取り専用として共有する
+    return sync_leaderboards(get_leaderboard_store(), _df, today)
+
+@st.cache_resource
+def get_rating_engine():
+    # 前回のチェックポイントから再開する
+    return RatingEngine.load()
+
+@st.cache_resource(max_entries=4)
+def get_ratings(_df, version):
+    # 同期した時点の写しを返す（共有のエンジンは次の版で進む）
+    engine = get_rating_engine()
+    engine.sync(_df)
+    return engine.snapshot()
+
+@st.cache_resource(max_entries=32)
+def get_range_rankings(_df, version, start_d, end_d, _store=None):
+    # SQLite のときは期間の集計を SQL に任せる（手元の保存先は画面ごとに持っているので呼び出し側から渡す）
+    if _store is not None:
+        return Leaderboard.from_totals(_store.player_totals(start=start_d, end=end_d))
+    mask = (_df["論理日付"] >= start_d) & (_df["論理日付"] <= end_d)
+    return build_leaderboard(_df[mask])
+
+@st.cache_data(max_entries=32)
+def get_rank_intervals(_board, version, range_key):
+    # 数千回の引き直しはデータの版と集計期間ごとに1回だけ行う
+    return bootstrap_intervals(dict(_board.totals))
+
+def ranking_rows(board, metric, min_games, intervals, by_bound):
+    # 区間の下限で並べるときは信頼区間の表から、それ以外はいつものランキングから取る
+    if intervals is not None and by_bound:
+        return top_by_bound(intervals, metric, min_games)
+    return board.top(metric, min_games)
+
+def render_ranking_tabs(board, min_games, ratings, intervals=None, by_bound=False):
+    ci_label = f"{CONFIDENCE_LEVEL:.0%}区間"
+    t1, t2, t3, t4, t5 = st.tabs(["📊 打数", "🥇 平均着順", "👑 トップ率", "🛡 ラス回避率", "📈 レーティング"])
+    
+    with t1:
+        st.subheader("📊 打数ランキング (Top 5)")
+        res = board.top("games", min_games)
+        st.dataframe(
+            res[["順位", "name", "games"]].rename(columns={"name":"名前", "games":"打数"}),
+            hide_index=True, use_container_width=True
+        )
+
+    with t2:
+        st.subheader("🥇 平均着順ランキング (Top 5)")
+        res = ranking_rows(board, "avg_rank", min_games, intervals, by_bound)
+        res["avg_rank"] = res["avg_rank"].map('{:.2f}'.format)
+        cols = ["順位", "name", "avg_rank", "games"]
+        if intervals is not None:
+            res[ci_label] = res["name"].map(interval_label(intervals, "avg_rank", "{:.2f}"))
+            cols.insert(3, ci_label)
+        st.dataframe(
+            res[cols].rename(columns={"name":"名前", "avg_rank":"平均着順", "games":"打数"}),
+            hide_index=True, use_container_width=True
+        )
+
+    with t3:
+        st.subheader("👑 トップ率ランキング (Top 5)")
+        res = ranking_rows(board, "top_rate", min_games, intervals, by_bound)
+        res["top_rate"] = res["top_rate"].map('{:.1f}%'.format)
+        cols = ["順位", "name", "top_rate", "first_count", "games"]
+        if intervals is not None:
+            res[ci_label] = res["name"].map(interval_label(intervals, "top_rate", "{:.1f}%"))
+            cols.insert(3, ci_label)
+        st.dataframe(
+            res[cols].rename(columns={"name":"名前", "top_rate":"トップ率", "first_count":"トップ回数", "games":"打数"}),
+            hide_index=True, use_container_width=True
+        )
+
+    with t4:
+        st.subheader("🛡 ラス回避率ランキング (Top 5)")
+        res = board.top("last_avoid_rate", min_games)
+        res["last_avoid_rate"] = res["last_avoid_rate"].map('{:.1f}%'.format)
+        st.dataframe(
+            res[["順位", "name", "last_avoid_rate", "games"]].rename(columns={"name":"名前", "last_avoid_rate":"ラス回避率", "games":"打数"}),
+            hide_index=True, use_container_width=True
+        )
+
+    with t5:
+        st.subheader("📈 レーティングランキング (Top 5)")
+        if ratings is None:
+            st.info("レーティングは店舗ごとに計算しています")
+            return
+        st.caption("全期間の対局を順に反映した Elo 方式のレーティングです（初期値 1500・集計期間の指定には影響されません）")
+        res = ratings.table(min_games).head(5)
+        res["rating"] = res["rating"].map('{:.0f}'.format)
+        st.dataframe(
+            res[["順位", "name", "rating", "games"]].rename(columns={"name":"名前", "rating":"レート", "games":"打数"}),
+            hide_index=True, use_container_width=True
+        )
@@ -1,8 +1,22 @@
+import time
+_SCRIPT_START = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import altair as alt
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+from streamlit.logger import get_logger
 from streamlit_gsheets import GSheetsConnection
+from ranking_board import (
+    get_rank_intervals, get_range_rankings, get_ranking_snapshot, get_ratings, render_ranking_tabs,
+)
+from score_data import (
+    EXPECTED_COLS, HOME_SHOP, SCORE_PARTITION, SHEET_SCORE, SHOPS, STORAGE_BACKEND, missing_score_cols,
+    partition_names, shape_score_df, worksheet_titles,
+)
+from score_stats import RANKING_VIEWS, data_version, logical_today, period_key
+from storage import SqliteStore
+
+logger = get_logger(__name__)
 
 # ==========================================
 # 1. ページ設定 (閲覧専用)
@@ -46,55 +60,53 @@ st.markdown(hide_style, unsafe_allow_html=True)
 # ==========================================
 # 2. データ読み込み (読み取り専用)
 # ==========================================
-SHEET_SCORE = "score"
-
-EXPECTED_COLS = [
-    "GameNo", "TableNo", "SetNo", "日時", "備考",
-    "Aさん", "Aタイプ", "A着順",
-    "Bさん", "Bタイプ", "B着順",
-    "Cさん", "Cタイプ", "C着順"
-]
-
+# 保存先・シートの分割・店舗は main.py と同じ設定を使う（sqlite のときは手元の SQLite を読む）
+@st.cache_resource
 def get_conn():
-    return st.connection("gsheets", type=GSheetsConnection)
+    if STORAGE_BACKEND == "sqlite":
+        return None
+    return st.connection(SHOPS[HOME_SHOP], type=GSheetsConnection)
+
+@st.cache_resource
+def get_local_store():
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    return SqliteStore()
 
 @st.cache_data(ttl=600)
-def fetch_data_cached(_conn, sheet_name):
-    return _conn.read(worksheet=sheet_name, ttl=0)
+def fetch_score_cached(_conn):
+    # 成績シート (分割しているときは卓・月ごとのシートすべて) をつないで返す。シートの一覧も一緒に覚えておく
+    store = get_local_store()
+    if store is not None:
+        return store.read(SHEET_SCORE)
+    titles = worksheet_titles(_conn) if SCORE_PARTITION != "none" else None
+    parts = []
+    for name in partition_names(titles):
+        try:
+            df = _conn.read(worksheet=name, ttl=0)
+        except Exception as e:
+            # まだ1局も入っていない卓のシートは飛ばす
+            if SCORE_PARTITION != "none" and type(e).__name__ == "WorksheetNotFound":
+                continue
+            raise
+        df.columns = df.columns.astype(str).str.strip()
+        parts.append(df)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
 
 def process_score_df(df):
-    if df.empty:
-        return pd.DataFrame(columns=EXPECTED_COLS)
-
-    df.columns = df.columns.astype(str).str.strip()
-
-    missing_cols = [c for c in EXPECTED_COLS if c not in df.columns]
-    if missing_cols:
+    # 整形は main.py と共通。列が足りなければ None（呼び出し側で読み直す）
+    if not df.empty and missing_score_cols(df):
         return None
-
-    numeric_cols = ["GameNo", "TableNo", "SetNo", "A着順", "B着順", "C着順"]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-
-    df = df.fillna("")
-
-    if "日時" in df.columns:
-        df["日時Obj"] = pd.to_datetime(df["日時"], errors='coerce')
-        df["日時Obj"] = df["日時Obj"].fillna(pd.Timestamp("1900-01-01"))
-        df["論理日付"] = (df["日時Obj"] - timedelta(hours=9)).dt.date
-    else:
-        df["論理日付"] = []
-        
-    return df
+    return shape_score_df(df)
 
 def load_score_data():
     conn = get_conn()
     try:
-        df = fetch_data_cached(conn, SHEET_SCORE)
+        df = fetch_score_cached(conn)
         processed_df = process_score_df(df)
         if processed_df is None:
-            fetch_data_cached.clear()
-            df = fetch_data_cached(conn, SHEET_SCORE)
+            fetch_score_cached.clear()
+            df = fetch_score_cached(conn)
             processed_df = process_score_df(df)
         
         if processed_df is None:
@@ -106,7 +118,7 @@ def load_score_data():
         return pd.DataFrame(columns=EXPECTED_COLS)
 
 # ==========================================
-# 3. ランキング表示ロジック
+# 3. ランキング表示 (集計と表は main.py と共通の ranking_board を使う)
 # ==========================================
 def main():
     st.title("🏆 成績ランキング")
@@ -120,111 +132,66 @@ def main():
         st.info("データがまだありません。")
         return
 
-    valid_dates = pd.to_datetime(df["論理日付"]).dropna()
-    if not valid_dates.empty:
-        min_date = valid_dates.min().date()
-        max_date = valid_dates.max().date()
-    else:
-        min_date = date.today()
-        max_date = date.today()
+    today = logical_today()
+    version = data_version(df)
 
     c1, c2 = st.columns([1, 2])
     with c1:
-        date_range = st.date_input(
-            "📅 集計期間",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date
-        )
-    
-    if len(date_range) == 2:
-        start_d, end_d = date_range
-        mask = (df["論理日付"] >= start_d) & (df["論理日付"] <= end_d)
-        df_filtered = df[mask]
+        period = st.radio("📅 集計期間", list(RANKING_VIEWS.values()) + ["期間指定"], horizontal=True)
+
+    if period == "期間指定":
+        valid_dates = pd.to_datetime(df["論理日付"]).dropna()
+        if not valid_dates.empty:
+            min_date = valid_dates.min().date()
+            max_date = valid_dates.max().date()
+        else:
+            min_date = date.today()
+            max_date = date.today()
+
+        with c2:
+            date_range = st.date_input(
+                "期間",
+                value=(min_date, max_date),
+                min_value=min_date,
+                max_value=max_date
+            )
+        if len(date_range) == 2:
+            board = get_range_rankings(df, version, date_range[0], date_range[1], get_local_store())
+            range_key = ("range", date_range[0], date_range[1])
+        else:
+            board = get_ranking_snapshot(df, version, today)["all"]
+            range_key = period_key("all", today)
     else:
-        df_filtered = df
+        view = next(k for k, v in RANKING_VIEWS.items() if v == period)
+        board = get_ranking_snapshot(df, version, today)[view]
+        range_key = period_key(view, today)
 
-    if df_filtered.empty:
+    if board.player_count == 0:
         st.warning("指定された期間のデータはありません")
         return
 
-    records = []
-    for _, row in df_filtered.iterrows():
-        for seat in ["A", "B", "C"]:
-            name = row[f"{seat}さん"]
-            rank = row[f"{seat}着順"]
-            if name:
-                try: r = int(float(rank))
-                except: r = 0
-                if r > 0:
-                    records.append({"name": name, "rank": r})
-    
-    if not records:
-        st.warning("集計できるデータがありません")
-        return
-
-    df_raw = pd.DataFrame(records)
-    
-    stats = df_raw.groupby("name")["rank"].agg(
-        games="count",
-        avg_rank="mean",
-        first_count=lambda x: (x==1).sum(),
-        third_count=lambda x: (x==3).sum()
-    ).reset_index()
-
-    stats["top_rate"] = (stats["first_count"] / stats["games"]) * 100
-    stats["last_avoid_rate"] = ((stats["games"] - stats["third_count"]) / stats["games"]) * 100
-    
     min_games = st.slider("規定打数 (これ以下の人はランキングに表示しません)", 1, 50, 5)
+    by_bound = st.toggle(
+        "🎯 控えめな値で順位をつける",
+        help="平均着順は信頼区間の悪い側の端、トップ率は下限で並べます。打数が少なく結果がぶれやすい人ほど順位が下がります",
+    )
     
-    filtered_stats = stats[stats["games"] >= min_games].copy()
-    
-    if filtered_stats.empty:
+    if board.top("games", min_games, 1).empty:
         st.warning(f"打数が {min_games} 回以上のプレイヤーがいません。")
         return
 
+    intervals = get_rank_intervals(board, version, range_key)
+
     st.write("---")
-    
-    t1, t2, t3, t4 = st.tabs(["📊 打数", "🥇 平均着順", "👑 トップ率", "🛡 ラス回避率"])
-    
-    with t1:
-        st.subheader("📊 打数ランキング (Top 5)")
-        res = filtered_stats.sort_values("games", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        st.dataframe(
-            res[["順位", "name", "games"]].rename(columns={"name":"名前", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
-
-    with t2:
-        st.subheader("🥇 平均着順ランキング (Top 5)")
-        res = filtered_stats.sort_values("avg_rank", ascending=True).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["avg_rank"] = res["avg_rank"].map('{:.2f}'.format)
-        st.dataframe(
-            res[["順位", "name", "avg_rank", "games"]].rename(columns={"name":"名前", "avg_rank":"平均着順", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
-
-    with t3:
-        st.subheader("👑 トップ率ランキング (Top 5)")
-        res = filtered_stats.sort_values("top_rate", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["top_rate"] = res["top_rate"].map('{:.1f}%'.format)
-        st.dataframe(
-            res[["順位", "name", "top_rate", "first_count", "games"]].rename(columns={"name":"名前", "top_rate":"トップ率", "first_count":"トップ回数", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
-
-    with t4:
-        st.subheader("🛡 ラス回避率ランキング (Top 5)")
-        res = filtered_stats.sort_values("last_avoid_rate", ascending=False).reset_index(drop=True).head(5)
-        res["順位"] = res.index + 1
-        res["last_avoid_rate"] = res["last_avoid_rate"].map('{:.1f}%'.format)
-        st.dataframe(
-            res[["順位", "name", "last_avoid_rate", "games"]].rename(columns={"name":"名前", "last_avoid_rate":"ラス回避率", "games":"打数"}),
-            hide_index=True, use_container_width=True
-        )
+    render_ranking_tabs(board, min_games, get_ratings(df, version), intervals, by_bound)
+
+def log_first_render():
+    # セッションの初回描画までの時間をログに残す
+    if st.session_state.get("ttfr_logged"):
+        return
+    st.session_state["ttfr_logged"] = True
+    logger.info("time-to-first-render [ranking_view] %.0f ms", (time.perf_counter() - _SCRIPT_START) * 1000)
 
 if __name__ == '__main__':
     main()
+    log_first_render()
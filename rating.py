@@ -0,0 +1,139 @@
+import os
+import pickle
+import threading
+import pandas as pd
+
+from score_stats import SEATS, game_seats, game_signatures
+
+# ==========================================
+# レーティング (3人打ち用 Elo)
+# GameNo 順に1局ずつ反映し、一定局数ごとにチェックポイントを残す
+# ==========================================
+INITIAL_RATING = 1500.0
+K_FACTOR = 24.0
+CHECKPOINT_EVERY = 500
+RATING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", "ratings.pkl")
+
+def rate_game(ratings, seats):
+    # 3人の総当たり (3組) で Elo の期待値との差を計算し、まとめて反映する
+    deltas = {name: 0.0 for name, _ in seats}
+    for i, (name_i, rank_i) in enumerate(seats):
+        for name_j, rank_j in seats[i + 1:]:
+            r_i = ratings.get(name_i, INITIAL_RATING)
+            r_j = ratings.get(name_j, INITIAL_RATING)
+            expected_i = 1.0 / (1.0 + 10 ** ((r_j - r_i) / 400.0))
+            score_i = 1.0 if rank_i < rank_j else 0.0
+            change = K_FACTOR * (score_i - expected_i) / (len(seats) - 1)
+            deltas[name_i] += change
+            deltas[name_j] -= change
+    for name, delta in deltas.items():
+        ratings[name] = ratings.get(name, INITIAL_RATING) + delta
+
+class RatingEngine:
+    SIGNATURE_COLS = [f"{seat}{c}" for seat in SEATS for c in ["さん", "着順"]]
+
+    def __init__(self, path=RATING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.ratings = {}
+        self.played = {}
+        self.last_game_no = 0
+        self.processed = 0
+        self.signatures = pd.Series(dtype="uint64")
+        self.checkpoints = []  # [(GameNo, 処理済み局数, ratings, played)] GameNo の昇順
+
+    # --- 保存・読み込み ---
+    @classmethod
+    def load(cls, path=RATING_PATH):
+        engine = cls(path)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            engine.ratings = state["ratings"]
+            engine.played = state["played"]
+            engine.last_game_no = state["last_game_no"]
+            engine.processed = state["processed"]
+            engine.signatures = state["signatures"]
+            engine.checkpoints = state["checkpoints"]
+        except Exception:
+            pass
+        return engine
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            state = {
+                "ratings": self.ratings, "played": self.played, "last_game_no": self.last_game_no,
+                "processed": self.processed, "signatures": self.signatures, "checkpoints": self.checkpoints,
+            }
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump(state, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            pass
+
+    # --- 計算 ---
+    def _restore(self, before_game_no):
+        # before_game_no より前の最も新しいチェックポイントに戻す（なければ最初から）
+        while self.checkpoints and self.checkpoints[-1][0] >= before_game_no:
+            self.checkpoints.pop()
+        if self.checkpoints:
+            game_no, processed, ratings, played = self.checkpoints[-1]
+            self.ratings, self.played = dict(ratings), dict(played)
+            self.last_game_no, self.processed = game_no, processed
+        else:
+            self.ratings, self.played = {}, {}
+            self.last_game_no, self.processed = 0, 0
+
+    def _replay(self, df):
+        # last_game_no より後の対局を GameNo 順に反映する
+        seats_by_game = game_seats(df[df["GameNo"] > self.last_game_no])
+        for game_no in sorted(seats_by_game):
+            seats = seats_by_game[game_no]
+            rate_game(self.ratings, seats)
+            for name, _ in seats:
+                self.played[name] = self.played.get(name, 0) + 1
+            self.last_game_no = game_no
+            self.processed += 1
+            if self.processed % CHECKPOINT_EVERY == 0:
+                self.checkpoints.append((game_no, self.processed, dict(self.ratings), dict(self.played)))
+
+    def sync(self, df):
+        # 新しい対局はそのまま追加し、修正・削除があればその直前のチェックポイントからやり直す
+        sigs = game_signatures(df, self.SIGNATURE_COLS)
+        with self._lock:
+            prev = self.signatures
+            common = sigs.index.intersection(prev.index)
+            changed = common[sigs.loc[common].values != prev.loc[common].values]
+            removed = prev.index.difference(sigs.index)
+            added = sigs.index.difference(prev.index)
+            if len(changed) == 0 and len(removed) == 0 and len(added) == 0:
+                return False
+
+            affected = changed.union(removed).union(added[added <= self.last_game_no])
+            if len(affected) > 0:
+                self._restore(int(affected.min()))
+            self._replay(df)
+            self.signatures = sigs
+            self.save()
+            return True
+
+    def snapshot(self):
+        # 今のレーティングを写した表示専用のもの（次の sync で書き換わらない）
+        with self._lock:
+            engine = RatingEngine(self.path)
+            engine.ratings = dict(self.ratings)
+            engine.played = dict(self.played)
+            engine.last_game_no, engine.processed = self.last_game_no, self.processed
+        return engine
+
+    def table(self, min_games=1):
+        with self._lock:
+            res = pd.DataFrame({
+                "name": list(self.ratings.keys()),
+                "rating": list(self.ratings.values()),
+                "games": [self.played.get(n, 0) for n in self.ratings],
+            })
+        res = res[res["games"] >= min_games].sort_values(["rating", "name"], ascending=[False, True]).reset_index(drop=True)
+        res["順位"] = res.index + 1
+        return res
@@ -0,0 +1,124 @@
+import os
+import re
+import pandas as pd
+from datetime import timedelta
+
+# ==========================================
+# 成績シートの定義・分割・読み込み後の整形 (main.py / ranking_view.py / stats_api.py 共用)
+# Streamlit に依存しない、シート名・列・分割のきまりだけを置く
+# ==========================================
+SHEET_SCORE = "score"
+
+# 期待する列定義
+EXPECTED_COLS = [
+    "GameNo", "TableNo", "SetNo", "日時", "備考",
+    "Aさん", "Aタイプ", "A着順",
+    "Bさん", "Bタイプ", "B着順",
+    "Cさん", "Cタイプ", "C着順"
+]
+
+# 論理削除の印（空欄以外なら削除済み）。列がないシートでもそのまま動く
+TOMBSTONE_COL = "削除日時"
+
+# 卓番号（卓数は SCORE_TABLE_COUNT で変えられる）
+TABLE_NOS = list(range(1, int(os.environ.get("SCORE_TABLE_COUNT", "3")) + 1))
+
+# 保存先: "gsheets" (スプレッドシートのみ) / "sqlite" (手元の SQLite を正とし、シートへは書き写すだけ)
+STORAGE_BACKEND = os.environ.get("SCORE_STORAGE", "gsheets")
+
+# 成績シートの分割: "none" (score 1枚) / "table" (卓ごと score_t1 …) / "table_month" (卓・月ごと score_t1_2024-05 …)
+# SQLite のときは索引で必要な行だけを扱えるので分割しない
+SCORE_PARTITION = os.environ.get("SCORE_PARTITION", "none") if STORAGE_BACKEND != "sqlite" else "none"
+
+# 店舗: "店名=接続名" をカンマ区切りで指定（接続名は secrets の [connections.<接続名>]）
+# 先頭の店舗が通常の画面 (main.py / ranking_view.py) で使う店舗。1店舗だけなら従来どおり
+SHOPS = dict(
+    item.strip().split("=", 1) for item in os.environ.get("SCORE_SHOPS", "本店=gsheets").split(",") if "=" in item
+) or {"本店": "gsheets"}
+HOME_SHOP = next(iter(SHOPS))
+
+def partition_name(table_no, month=None):
+    name = f"{SHEET_SCORE}_t{int(table_no)}"
+    return f"{name}_{month}" if month else name
+
+def partition_of(table_no, dt):
+    # 行が入るシート名（月は朝9時切替の論理日付で決める）
+    if SCORE_PARTITION == "none":
+        return SHEET_SCORE
+    if SCORE_PARTITION == "table_month":
+        ts = pd.to_datetime(dt, errors="coerce")
+        month = (ts - timedelta(hours=9)).strftime("%Y-%m") if pd.notnull(ts) else "unknown"
+        return partition_name(table_no, month)
+    return partition_name(table_no)
+
+def partition_names(titles=None):
+    # 読むべき成績シートの一覧。スプレッドシートのシート名 (titles) が分かればそこからも探す
+    # （卓ごとのときは TABLE_NOS より大きい卓のシートや、卓数を減らす前のシートも読む）
+    if SCORE_PARTITION == "none":
+        return [SHEET_SCORE]
+    if SCORE_PARTITION == "table":
+        found = [t for t in (titles or []) if re.fullmatch(rf"{SHEET_SCORE}_t\d+", t)]
+        names = set(found) | {partition_name(t) for t in TABLE_NOS}
+        return sorted(names, key=lambda n: int(n.rsplit("_t", 1)[1]))
+    return sorted(t for t in (titles or []) if t.startswith(f"{SHEET_SCORE}_t"))
+
+def worksheet_titles(conn):
+    # スプレッドシートのシート名の一覧（サービスアカウント接続のときだけ取れる。取れなければ None）
+    client = getattr(conn, "client", None)
+    if client is None or not hasattr(client, "_open_spreadsheet"):
+        return None
+    return [ws.title for ws in client._open_spreadsheet().worksheets()]
+
+def live_rows(df):
+    # 論理削除されていない行だけ
+    df = df.rename(columns=lambda c: str(c).strip())
+    if TOMBSTONE_COL in df.columns:
+        df = df[df[TOMBSTONE_COL].fillna("").astype(str).str.strip() == ""]
+    return df
+
+def missing_score_cols(df):
+    return [c for c in EXPECTED_COLS if c not in df.columns.astype(str).str.strip()]
+
+def shape_score_df(df):
+    # 読んだ成績を集計用に整える（列不足の扱いは呼び出し側で決める。列名は df のまま書き換える）
+    # シート行を控え、論理削除の行を除き、数値化・論理日付 (朝9時切替)・その日その卓の何局目 (DailyNo) をつける
+    if df.empty:
+        return pd.DataFrame(columns=EXPECTED_COLS + ["論理日付", "DailyNo"])
+    df.columns = df.columns.astype(str).str.strip()
+    if "シート行" not in df.columns:
+        df["シート行"] = df.index + 2
+    if TOMBSTONE_COL in df.columns:
+        df = df[df[TOMBSTONE_COL].fillna("").astype(str).str.strip() == ""]
+        df = df.drop(columns=[TOMBSTONE_COL])
+
+    for col in ["GameNo", "TableNo", "SetNo", "A着順", "B着順", "C着順"]:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    df = df.fillna("")
+
+    df["日時Obj"] = pd.to_datetime(df["日時"], errors='coerce').fillna(pd.Timestamp("1900-01-01"))
+    df["論理日付"] = (df["日時Obj"] - timedelta(hours=9)).dt.date
+    df = df.sort_values(["論理日付", "TableNo", "日時Obj"])
+    df["DailyNo"] = df.groupby(["論理日付", "TableNo"]).cumcount() + 1
+    return df
+
+def split_partitions(df):
+    # {シート名: その行} に分ける（GameNo 順）
+    if df.empty:
+        return {}
+    keys = pd.Series([partition_of(t, d) for t, d in zip(df["TableNo"], df["日時"])], index=df.index, dtype=object)
+    return {name: part for name, part in df.groupby(keys, sort=False)}
+
+def merge_into_partitions(df_legacy, existing):
+    # 分割前の score の行を、分割後のシート (existing: {シート名: 今の行}) に足し込んだ結果を返す
+    # 分割後のシートに同じ GameNo があればそちらを残す
+    merged = {}
+    for name, part in split_partitions(live_rows(df_legacy)).items():
+        current = live_rows(existing.get(name, pd.DataFrame(columns=EXPECTED_COLS))).reindex(columns=EXPECTED_COLS)
+        known = pd.to_numeric(current["GameNo"], errors="coerce").dropna().astype(int)
+        new = part[~pd.to_numeric(part["GameNo"], errors="coerce").isin(known)]
+        if new.empty:
+            continue
+        rows = pd.concat([current, new.reindex(columns=EXPECTED_COLS)], ignore_index=True)
+        order = pd.to_numeric(rows["GameNo"], errors="coerce").fillna(0)
+        merged[name] = rows.loc[order.sort_values(kind="stable").index].reset_index(drop=True)
+    return merged
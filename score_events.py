@@ -0,0 +1,190 @@
+import json
+import os
+import pickle
+import threading
+import pandas as pd
+
+# ==========================================
+# 成績の変更履歴 (イベント)
+# 登録・修正・削除を変更前後の行つきで記録し、スナップショット + その後のイベントの再生で
+# 任意の時点の成績表を作り直す。取り消しは直前のイベントの逆を記録して反映する
+# ==========================================
+EVENT_COLS = ["日時", "操作", "GameNo", "変更前", "変更後"]
+EVENT_INSERT = "登録"
+EVENT_UPDATE = "修正"
+EVENT_DELETE = "削除"
+SNAPSHOT_EVERY = 200   # このイベント数ごとにスナップショットを取る
+KEEP_SNAPSHOTS = 5     # 整理後に残すスナップショット数（それより古い時点には戻れない）
+EVENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", "events.pkl")
+
+def _plain(val):
+    if val is None or (not isinstance(val, str) and pd.isna(val)):
+        return ""
+    if hasattr(val, "item"):
+        val = val.item()
+    return val if isinstance(val, (int, float, str)) else str(val)
+
+def row_to_json(row, cols):
+    return json.dumps({c: _plain(row.get(c)) for c in cols}, ensure_ascii=False)
+
+def make_event(ts, op, game_no, before=None, after=None, cols=None):
+    # before / after は行 (dict や Series)。cols があればその列だけを残す
+    def dump(row):
+        if row is None:
+            return ""
+        return row_to_json(row, cols or list(row.keys()))
+    return {"日時": ts, "操作": op, "GameNo": int(game_no), "変更前": dump(before), "変更後": dump(after)}
+
+def event_rows(df):
+    # シートの行を文字列のタプルにそろえる（全体を読んだときと途中から読んだときで同じ形になるように）
+    if df is None or df.empty:
+        return []
+    def cell(val):
+        val = _plain(val)
+        return str(int(val)) if isinstance(val, float) and val.is_integer() else str(val)
+    return [tuple(cell(v) for v in r) for r in df.reindex(columns=EVENT_COLS).itertuples(index=False)]
+
+def parse_event_row(row):
+    # シートの1行 -> (操作, GameNo, 変更前 dict/None, 変更後 dict/None, 日時)。GameNo が読めない行は None
+    ts, op, game_no, before, after = row
+    try:
+        game_no = int(float(game_no))
+    except ValueError:
+        return None
+    return (
+        str(op), game_no,
+        json.loads(before) if str(before).strip() else None,
+        json.loads(after) if str(after).strip() else None,
+        str(ts),
+    )
+
+def apply_event(state, event):
+    op, game_no, _, after, _ = event
+    if op == EVENT_DELETE:
+        state.pop(game_no, None)
+    elif after is not None:
+        state[game_no] = after
+
+def inverse_event(event, ts):
+    # 取り消し用の逆向きのイベント
+    op, game_no, before, after, _ = event
+    inverse_op = {EVENT_INSERT: EVENT_DELETE, EVENT_DELETE: EVENT_INSERT}.get(op, EVENT_UPDATE)
+    return make_event(ts, inverse_op, game_no, before=after, after=before)
+
+def state_to_df(state, cols):
+    if not state:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(list(state.values())).reindex(columns=cols)
+    return df.sort_values("GameNo").reset_index(drop=True) if "GameNo" in df.columns else df
+
+class EventHistory:
+    def __init__(self, path=EVENTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.snapshots = []   # [(イベント番号, {GameNo: 行})] 番号の昇順。最初のものが基準点
+        self.events = []      # 最初のスナップショット以降のイベント
+        self.processed = 0    # 反映済みのイベント数（シート全体での通し番号）
+        self.rows = 0         # 読み終えたシートの行数（見出しを除く。読めない行も数える）
+        self.last_row = None  # 最後に読んだ行（次に読むときに、書き換えられていないかを確かめる）
+        self.state = {}
+
+    # --- 保存・読み込み ---
+    @classmethod
+    def load(cls, path=EVENTS_PATH):
+        history = cls(path)
+        try:
+            with open(path, "rb") as f:
+                saved = pickle.load(f)
+            history.rows = saved["rows"]
+            history.last_row = saved["last_row"]
+            history.snapshots = saved["snapshots"]
+            history.events = saved["events"]
+            history.processed = saved["processed"]
+            history.state = saved["state"]
+        except Exception:
+            pass
+        return history
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            saved = {"snapshots": self.snapshots, "events": self.events, "processed": self.processed,
+                     "rows": self.rows, "last_row": self.last_row, "state": self.state}
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump(saved, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            pass
+
+    # --- 同期 ---
+    @property
+    def base(self):
+        return self.snapshots[0][0] if self.snapshots else self.processed
+
+    @property
+    def cursor(self):
+        # 次に読み始めるシートの行（最後に読んだ行から読み直して、書き換えられていないかを確かめる）
+        return max(self.rows - 1, 0)
+
+    def sync(self, df, current_rows, start=0):
+        # df はシートの start 行目 (見出しを除いて 0 始まり) から後ろ。増えた分だけを反映する
+        # 初回や履歴が書き換えられていた場合は、今の成績表をその時点の基準にする
+        # 途中から読んだ分だけでは確かめられないときは None を返す（全体を読み直して start=0 で呼び直す）
+        rows = event_rows(df)
+        with self._lock:
+            n_rows = start + len(rows)
+            consistent = (
+                self.snapshots and start <= self.rows <= n_rows
+                and (self.rows == start or rows[self.rows - 1 - start] == self.last_row)
+            )
+            if not consistent:
+                if start > 0:
+                    return None
+                events = [e for e in map(parse_event_row, rows) if e is not None]
+                self.state = {int(r["GameNo"]): r for r in current_rows}
+                self.snapshots = [(len(events), dict(self.state))]
+                self.events = []
+                self.processed = len(events)
+                self.rows, self.last_row = n_rows, (rows[-1] if rows else None)
+                self.save()
+                return True
+            if n_rows == self.rows:
+                return False
+
+            for row in rows[self.rows - start:]:
+                event = parse_event_row(row)
+                if event is None:
+                    continue
+                apply_event(self.state, event)
+                self.events.append(event)
+                self.processed += 1
+                if (self.processed - self.base) % SNAPSHOT_EVERY == 0:
+                    self.snapshots.append((self.processed, dict(self.state)))
+            self.rows, self.last_row = n_rows, rows[-1]
+            self._compact()
+            self.save()
+            return True
+
+    def _compact(self):
+        # 古いスナップショットとそれ以前のイベントを捨て、再生する量を一定に保つ
+        if len(self.snapshots) <= KEEP_SNAPSHOTS:
+            return
+        self.snapshots = self.snapshots[-KEEP_SNAPSHOTS:]
+        drop = len(self.events) - (self.processed - self.snapshots[0][0])
+        self.events = self.events[drop:]
+
+    # --- 参照 ---
+    def state_at(self, n):
+        # イベント n 件目まで反映した時点の {GameNo: 行}（基準点より前は作れない）
+        with self._lock:
+            n = max(min(n, self.processed), self.base)
+            start, state = max((s for s in self.snapshots if s[0] <= n), key=lambda s: s[0])
+            state = dict(state)
+            offset = self.processed - len(self.events)
+            for event in self.events[start - offset:n - offset]:
+                apply_event(state, event)
+            return state
+
+    def last_event(self):
+        with self._lock:
+            return self.events[-1] if self.events else None
@@ -0,0 +1,432 @@
+import bisect
+import threading
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+
+# ==========================================
+# 成績集計の共通ロジック (main.py / ranking_view.py 共用)
+# Streamlit に依存しない純粋な pandas 処理だけを置く
+# ==========================================
+SEATS = ["A", "B", "C"]
+JST = timezone(timedelta(hours=9), 'JST')
+
+# ランキングの種類: (並べ替える列, 昇順か)
+RANK_METRICS = {
+    "games": ("games", False),
+    "avg_rank": ("avg_rank", True),
+    "top_rate": ("top_rate", False),
+    "last_avoid_rate": ("last_avoid_rate", False),
+}
+
+# あらかじめ計算しておく集計期間
+RANKING_VIEWS = {"all": "全期間", "month": "今月", "today": "今日"}
+
+def logical_today(now=None):
+    # 朝9時切替の「今日」
+    now = now or datetime.now(JST)
+    return (now - timedelta(hours=9)).date()
+
+def data_version(df):
+    # 内容が変われば必ず変わる値（キャッシュのキーに使う）
+    if df.empty:
+        return "empty"
+    # 卓・セットで分ける集計 (精算・台帳) もあるので TableNo / SetNo (・半荘数があればそれも) を含める
+    cols = [c for c in ["GameNo", "TableNo", "SetNo", "半荘数", "日時", "備考", "Aさん", "A着順", "Bさん", "B着順", "Cさん", "C着順", "Aタイプ", "Bタイプ", "Cタイプ"] if c in df.columns]
+    return f"{len(df)}-{int(pd.util.hash_pandas_object(df[cols], index=False).sum()) & 0xFFFFFFFFFFFF:x}"
+
+def to_player_ranks(df):
+    # 1局3人分を縦持ち (name, rank, 論理日付, GameNo) にまとめる
+    if df.empty:
+        return pd.DataFrame(columns=["name", "rank", "論理日付", "GameNo"])
+    parts = []
+    for seat in SEATS:
+        parts.append(pd.DataFrame({
+            "name": df[f"{seat}さん"].astype(str),
+            "rank": pd.to_numeric(df[f"{seat}着順"], errors="coerce").fillna(0).astype(int),
+            "論理日付": df["論理日付"],
+            "GameNo": df["GameNo"],
+        }))
+    long = pd.concat(parts, ignore_index=True)
+    return long[(long["name"] != "") & (long["rank"] > 0)]
+
+def build_player_stats(df):
+    # プレイヤーごとの打数・平均着順・トップ率・ラス回避率
+    long = to_player_ranks(df)
+    if long.empty:
+        return pd.DataFrame(columns=["name", "games", "avg_rank", "first_count", "third_count", "top_rate", "last_avoid_rate"])
+
+    stats = long.assign(
+        is_first=long["rank"].eq(1),
+        is_third=long["rank"].eq(3),
+    ).groupby("name").agg(
+        games=("rank", "count"),
+        avg_rank=("rank", "mean"),
+        first_count=("is_first", "sum"),
+        third_count=("is_third", "sum"),
+    ).reset_index()
+
+    stats["top_rate"] = (stats["first_count"] / stats["games"]) * 100
+    stats["last_avoid_rate"] = ((stats["games"] - stats["third_count"]) / stats["games"]) * 100
+    return stats
+
+def filter_period(df, view, today):
+    if view == "today":
+        return df[df["論理日付"] == today]
+    if view == "month":
+        month_start = today.replace(day=1)
+        return df[(df["論理日付"] >= month_start) & (df["論理日付"] <= today)]
+    return df
+
+class Leaderboard:
+    # 指標ごと・規定打数の段階ごとに並べ替え済みのリストを持つランキング
+    # 1局の追加・修正・削除では関係する3人の位置だけを二分探索で入れ替える
+    TIERS = (1, 5, 10, 20, 30, 50, 100, 200, 500)
+    REBUILD_RATIO = 0.2  # 変更がこれ以上の割合なら作り直した方が速い
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {}     # name -> [打数, 着順合計, 1着回数, 3着回数]
+        self.games = {}      # GameNo -> ((name, rank), ...)
+        self.signatures = pd.Series(dtype="uint64")  # GameNo -> 行の内容のハッシュ
+        self._keys = {}      # name -> {metric: 並べ替えキー}
+        self._lists = {(metric, tier): [] for metric in RANK_METRICS for tier in self.TIERS}
+
+    # --- 並べ替えキー ---
+    def _sort_keys(self, name):
+        games, rank_sum, first, third = self.totals[name]
+        values = {
+            "games": games,
+            "avg_rank": rank_sum / games,
+            "top_rate": first / games * 100,
+            "last_avoid_rate": (games - third) / games * 100,
+        }
+        keys = {}
+        for metric, (col, asc) in RANK_METRICS.items():
+            keys[metric] = (values[col] if asc else -values[col], name)
+        return keys
+
+    def _unindex(self, name):
+        keys = self._keys.pop(name, None)
+        if keys is None:
+            return
+        games = self.totals[name][0]
+        for metric, key in keys.items():
+            for tier in self.TIERS:
+                if tier > games:
+                    break
+                lst = self._lists[(metric, tier)]
+                i = bisect.bisect_left(lst, key)
+                if i < len(lst) and lst[i] == key:
+                    del lst[i]
+
+    def _index(self, name):
+        keys = self._sort_keys(name)
+        self._keys[name] = keys
+        games = self.totals[name][0]
+        for metric, key in keys.items():
+            for tier in self.TIERS:
+                if tier > games:
+                    break
+                bisect.insort(self._lists[(metric, tier)], key)
+
+    def _apply(self, seats, sign):
+        for name, rank in seats:
+            self._unindex(name)
+            t = self.totals.setdefault(name, [0, 0, 0, 0])
+            t[0] += sign
+            t[1] += sign * rank
+            t[2] += sign * (rank == 1)
+            t[3] += sign * (rank == 3)
+            if t[0] <= 0:
+                del self.totals[name]
+            else:
+                self._index(name)
+
+    # --- 1局単位の更新 ---
+    def _remove(self, game_no):
+        seats = self.games.pop(game_no, None)
+        if seats:
+            self._apply(seats, -1)
+
+    # --- データ全体との同期 ---
+    def sync(self, df):
+        # 前回との差分 (追加・修正・削除された対局) だけを反映する
+        sigs = game_signatures(df)
+        with self._lock:
+            prev = self.signatures
+            removed = prev.index.difference(sigs.index)
+            common = sigs.index.intersection(prev.index)
+            changed = common[sigs.loc[common].values != prev.loc[common].values]
+            added = sigs.index.difference(prev.index)
+
+            n_changes = len(removed) + len(changed) + len(added)
+            if n_changes == 0:
+                return
+            if not self.games or n_changes > max(len(sigs), 1) * self.REBUILD_RATIO:
+                self._rebuild(df)
+            else:
+                for game_no in removed.union(changed):
+                    self._remove(game_no)
+                touched = df[df["GameNo"].isin(changed.union(added))]
+                for game_no, seats in game_seats(touched).items():
+                    self.games[game_no] = seats
+                    self._apply(seats, +1)
+            self.signatures = sigs
+
+    def _rebuild(self, df):
+        # まとめて集計し、リストは指標ごとに一度だけ並べ替える
+        self.games = game_seats(df)
+        stats = build_player_stats(df)
+        self.totals = {
+            r.name: [int(r.games), int(round(r.avg_rank * r.games)), int(r.first_count), int(r.third_count)]
+            for r in stats.itertuples(index=False)
+        }
+        self._build_lists()
+
+    def _build_lists(self):
+        self._keys = {name: self._sort_keys(name) for name in self.totals}
+        for (metric, tier) in self._lists:
+            self._lists[(metric, tier)] = sorted(
+                keys[metric] for name, keys in self._keys.items() if self.totals[name][0] >= tier
+            )
+
+    @classmethod
+    def from_totals(cls, totals):
+        # 集計済みの {name: [打数, 着順合計, 1着回数, 3着回数]} から作る（表示専用、1局単位の更新はできない）
+        board = cls()
+        board.totals = {name: list(t) for name, t in totals.items() if t[0] > 0}
+        board._build_lists()
+        return board
+
+    def snapshot(self):
+        # 今の順位を写した表示専用のランキング（次の sync で書き換わらない）
+        with self._lock:
+            board = Leaderboard()
+            board.totals = {name: list(t) for name, t in self.totals.items()}
+            board._keys = {name: dict(keys) for name, keys in self._keys.items()}
+            board._lists = {k: list(lst) for k, lst in self._lists.items()}
+        return board
+
+    # --- 表示用 ---
+    @property
+    def player_count(self):
+        return len(self.totals)
+
+    def top(self, metric, min_games, n=5):
+        # 規定打数以上の上位 n 人（並べ替え済みリストの先頭から取り出すだけ）
+        tier = max([t for t in self.TIERS if t <= min_games] or [self.TIERS[0]])
+        rows = []
+        with self._lock:
+            for _, name in self._lists[(metric, tier)]:
+                games, rank_sum, first, third = self.totals[name]
+                if games < min_games:
+                    continue
+                rows.append({
+                    "name": name, "games": games, "avg_rank": rank_sum / games,
+                    "first_count": first, "third_count": third,
+                    "top_rate": first / games * 100,
+                    "last_avoid_rate": (games - third) / games * 100,
+                })
+                if len(rows) >= n:
+                    break
+        res = pd.DataFrame(rows, columns=["name", "games", "avg_rank", "first_count", "third_count", "top_rate", "last_avoid_rate"])
+        res["順位"] = res.index + 1
+        return res
+
+def game_signatures(df, cols=None):
+    # GameNo ごとの内容ハッシュ（指定列、既定では座席の名前・着順が変わると値が変わる）
+    if df.empty:
+        return pd.Series(dtype="uint64")
+    cols = cols or [f"{seat}{c}" for seat in SEATS for c in ["さん", "着順"]]
+    sigs = pd.util.hash_pandas_object(df[cols].astype(str), index=False)
+    sigs.index = df["GameNo"].astype(int).values
+    return sigs[~sigs.index.duplicated(keep="last")]
+
+def game_seats(df):
+    # GameNo -> ((name, rank), ...) （名前なし・着順0は除く）
+    long = to_player_ranks(df)
+    seats = {}
+    for game_no, name, rank in zip(long["GameNo"].astype(int), long["name"], long["rank"]):
+        seats.setdefault(game_no, []).append((name, int(rank)))
+    return {k: tuple(v) for k, v in seats.items()}
+
+def build_leaderboard(df):
+    board = Leaderboard()
+    board.sync(df)
+    return board
+
+# ==========================================
+# 店舗ごとの集計 (複数店舗を足し合わせる用)
+# ==========================================
+ROLLUP_COLS = ["games", "rank_sum", "first_count", "second_count", "third_count", "last_date"]
+
+def player_rollup(df):
+    # プレイヤーごとの打数・着順合計・着順別回数・最終日（店舗をまたいで足し合わせられる形）
+    long = to_player_ranks(df)
+    if long.empty:
+        return pd.DataFrame(columns=ROLLUP_COLS)
+    return long.assign(
+        is_first=long["rank"].eq(1), is_second=long["rank"].eq(2), is_third=long["rank"].eq(3),
+    ).groupby("name").agg(
+        games=("rank", "count"),
+        rank_sum=("rank", "sum"),
+        first_count=("is_first", "sum"),
+        second_count=("is_second", "sum"),
+        third_count=("is_third", "sum"),
+        last_date=("論理日付", "max"),
+    )
+
+def merge_rollups(rollups):
+    # {店舗名: player_rollup の結果} を1つにまとめる（店舗別の打数の列つき）
+    parts = [r.assign(shop=shop) for shop, r in rollups.items() if not r.empty]
+    if not parts:
+        return pd.DataFrame(columns=ROLLUP_COLS + ["shops"])
+    long = pd.concat(parts).rename_axis("name").reset_index()
+    merged = long.groupby("name").agg(
+        games=("games", "sum"),
+        rank_sum=("rank_sum", "sum"),
+        first_count=("first_count", "sum"),
+        second_count=("second_count", "sum"),
+        third_count=("third_count", "sum"),
+        last_date=("last_date", "max"),
+        shops=("shop", "nunique"),
+    )
+    per_shop = long.pivot_table(index="name", columns="shop", values="games", aggfunc="sum", fill_value=0)
+    return merged.join(per_shop.add_prefix("打数_"))
+
+def rollup_totals(rollup):
+    # Leaderboard.from_totals に渡す形
+    return {
+        name: [int(r.games), int(r.rank_sum), int(r.first_count), int(r.third_count)]
+        for name, r in rollup.iterrows()
+    }
+
+def period_key(view, today):
+    # 期間ごとのランキングを区別するキー（今日・今月は日付が変わると別物になる）
+    if view == "today":
+        return (view, today)
+    if view == "month":
+        return (view, today.replace(day=1))
+    return (view, None)
+
+def sync_leaderboards(boards, df, today):
+    # 全期間・今月・今日のランキングを差分で最新にする。期間が変わったものは作り直す
+    current = {}
+    for view in RANKING_VIEWS:
+        key = period_key(view, today)
+        board = boards.get(key) or Leaderboard()
+        board.sync(filter_period(df, view, today))
+        current[key] = board
+    boards.clear()
+    boards.update(current)
+    # 共有している Leaderboard は次の版で書き換わるので、呼び出し側には写しを渡す
+    return {key[0]: board.snapshot() for key, board in current.items()}
+
+# ==========================================
+# 集計キューブ (プレイヤー × 席 × タイプ × 備考 × 月)
+# ==========================================
+CUBE_DIMS = ["name", "seat", "type", "note", "month"]
+CUBE_DIM_LABELS = {"name": "プレイヤー", "seat": "席", "type": "タイプ", "note": "備考", "month": "月"}
+CUBE_MEASURES = ["games", "rank_sum", "first_count", "second_count", "third_count"]
+CUBE_SIGNATURE_COLS = ["日時", "備考"] + [f"{seat}{c}" for seat in SEATS for c in ["さん", "タイプ", "着順"]]
+
+def to_seat_records(df):
+    # 1局3人分を席・タイプ・備考・月つきの縦持ちにする
+    cols = ["GameNo", "name", "seat", "type", "note", "month", "rank"]
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    month = pd.to_datetime(df["論理日付"], errors="coerce").dt.strftime("%Y-%m").fillna("")
+    note = df["備考"].astype(str).replace("", "なし")
+    parts = []
+    for seat in SEATS:
+        parts.append(pd.DataFrame({
+            "GameNo": df["GameNo"].astype(int).values,
+            "name": df[f"{seat}さん"].astype(str).values,
+            "seat": seat,
+            "type": df[f"{seat}タイプ"].astype(str).values,
+            "note": note.values,
+            "month": month.values,
+            "rank": pd.to_numeric(df[f"{seat}着順"], errors="coerce").fillna(0).astype(int).values,
+        }))
+    long = pd.concat(parts, ignore_index=True)
+    return long[(long["name"] != "") & (long["rank"] > 0)][cols]
+
+def aggregate_cells(records):
+    # 縦持ちデータを次元ごとに集計して、キューブのセルにする
+    if records.empty:
+        return pd.DataFrame(columns=CUBE_MEASURES, index=pd.MultiIndex.from_tuples([], names=CUBE_DIMS))
+    return records.assign(
+        games=1,
+        rank_sum=records["rank"],
+        first_count=records["rank"].eq(1).astype(int),
+        second_count=records["rank"].eq(2).astype(int),
+        third_count=records["rank"].eq(3).astype(int),
+    ).groupby(CUBE_DIMS)[CUBE_MEASURES].sum()
+
+def cube_metrics(cells):
+    # 集計済みの値から平均着順・各率を計算する
+    res = cells.copy()
+    res["avg_rank"] = res["rank_sum"] / res["games"]
+    res["top_rate"] = res["first_count"] / res["games"] * 100
+    res["last_avoid_rate"] = (res["games"] - res["third_count"]) / res["games"] * 100
+    return res
+
+class StatsCube:
+    # 次元の組み合わせごとに打数・着順合計・各着順回数を持つ集計表
+    # 追加・修正・削除された対局の分だけを引き算・足し算して更新する
+    REBUILD_RATIO = 0.2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cells = aggregate_cells(to_seat_records(pd.DataFrame()))
+        self.signatures = pd.Series(dtype="uint64")
+        self.records = to_seat_records(pd.DataFrame())  # 差分の引き算用に各局の縦持ちを控える
+
+    def sync(self, df):
+        sigs = game_signatures(df, CUBE_SIGNATURE_COLS)
+        with self._lock:
+            prev = self.signatures
+            common = sigs.index.intersection(prev.index)
+            changed = common[sigs.loc[common].values != prev.loc[common].values]
+            removed = prev.index.difference(sigs.index).union(changed)
+            added = sigs.index.difference(prev.index).union(changed)
+            if len(removed) == 0 and len(added) == 0:
+                return
+
+            if prev.empty or len(removed) + len(added) > max(len(sigs), 1) * self.REBUILD_RATIO:
+                self.records = to_seat_records(df)
+                self.cells = aggregate_cells(self.records)
+            else:
+                old = self.records[self.records["GameNo"].isin(removed)]
+                new = to_seat_records(df[df["GameNo"].isin(added)])
+                delta = aggregate_cells(new).sub(aggregate_cells(old), fill_value=0)
+                cells = self.cells.add(delta, fill_value=0)
+                self.cells = cells[cells["games"] > 0].astype(int)
+                self.records = pd.concat([self.records[~self.records["GameNo"].isin(removed)], new], ignore_index=True)
+            self.signatures = sigs
+
+    def snapshot(self):
+        # 今の集計表を写した表示専用のもの（次の sync で書き換わらない）
+        with self._lock:
+            cube = StatsCube()
+            cube.cells = self.cells.copy()
+        return cube
+
+    def dim_values(self, dim):
+        return sorted(self.cells.index.get_level_values(dim).unique().tolist())
+
+    def query(self, filters=None, group_by=None):
+        # filters: {次元: [値, ...]}、group_by: 集計の単位にする次元のリスト
+        with self._lock:
+            cells = self.cells
+        mask = pd.Series(True, index=cells.index)
+        for dim, values in (filters or {}).items():
+            if values:
+                mask &= cells.index.get_level_values(dim).isin(values)
+        sliced = cells[mask.values]
+        if group_by:
+            res = sliced.groupby(level=group_by).sum()
+        else:
+            res = sliced.sum().to_frame().T
+        res = res[res["games"] > 0]
+        return cube_metrics(res)
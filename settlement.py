@@ -0,0 +1,165 @@
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+from score_data import shape_score_df
+from score_stats import SEATS
+
+# ==========================================
+# ゲーム代・バックの精算 (main.py / stats_api.py 共用)
+# トップの人のタイプでゲーム代が決まり、特殊な終わり方 (備考) の分だけ値引きしてトップの客にバックする
+# ==========================================
+TYPE_LIST = ["A客", "B客", "AS", "BS"]
+FEE_MAP = {"A客": 3, "B客": 5, "AS": 1, "BS": 1}
+NOTE_DISCOUNT = {"東１終了": 1, "２人飛ばし": 2, "５連勝〜": 5}
+SETTLEMENT_COLS = ["論理日付", "TableNo", "ゲーム数", "ゲーム代", "バックA", "バックB"] + TYPE_LIST
+
+def game_settlement(df):
+    # 1局ごとのゲーム代・バック・トップのタイプを列のまま計算する（日・セットの合計も台帳もすべてこれを足し合わせる）
+    ranks = pd.concat([pd.to_numeric(df[f"{seat}着順"], errors="coerce") for seat in SEATS], axis=1)
+    readable = ranks.notna().all(axis=1)
+    w_type = pd.Series(np.select(
+        [readable & ranks.iloc[:, i].eq(1) for i in range(len(SEATS))],
+        [df[f"{seat}タイプ"].astype(str) for seat in SEATS], default="",
+    ), index=df.index)
+    discount = df["備考"].astype(str).map(NOTE_DISCOUNT).fillna(0).astype(int)
+    res = pd.DataFrame({"ゲーム数": 1}, index=df.index)
+    res["ゲーム代"] = w_type.map(FEE_MAP).fillna(0).astype(int) - discount
+    res["バックA"] = discount.where(w_type.eq("A客"), 0)
+    res["バックB"] = discount.where(w_type.eq("B客"), 0)
+    for t in TYPE_LIST:
+        res[t] = w_type.eq(t).astype(int)
+    return res
+
+def calculate_day_totals(df_day):
+    # 1日分 (1卓) のゲーム代・バック・タイプ内訳
+    sums = game_settlement(df_day).sum()
+    return int(sums["ゲーム代"]), int(sums["バックA"]), int(sums["バックB"]), {t: int(sums[t]) for t in TYPE_LIST}
+
+def calculate_set_summary(subset_df):
+    fee, _, _, type_stats = calculate_day_totals(subset_df)
+    return fee, type_stats
+
+def daily_settlement(df):
+    # (論理日付, 卓) ごとの精算表。「本日の合計」と同じ数字を卓ごとに並べる
+    if df.empty:
+        return pd.DataFrame(columns=SETTLEMENT_COLS)
+    sums = game_settlement(df).groupby([df["論理日付"], df["TableNo"]], sort=True).sum()
+    res = sums.rename_axis(["論理日付", "TableNo"]).reset_index()
+    res["TableNo"] = res["TableNo"].astype(int)
+    return res[SETTLEMENT_COLS]
+
+# ==========================================
+# 精算台帳 (論理日付 × 卓 × セットごとの集計を保存しておく)
+# 成績を書いたその場で、変わった対局の分だけ該当の行を足し引きする (apply)。
+# 版が変わったときは (日付, 卓, セット) ごとの内容のハッシュを突き合わせ、変わった行を計算し直す (reconcile)
+# ==========================================
+LEDGER_KEYS = ["論理日付", "TableNo", "SetNo"]
+LEDGER_SUMS = ["ゲーム数", "ゲーム代", "バックA", "バックB"] + TYPE_LIST
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", "ledger.pkl")
+
+SIGNATURE_COLS = ["GameNo", "備考"] + [f"{seat}{c}" for seat in SEATS for c in ["タイプ", "着順"]]
+
+def _ledger_keys(df):
+    return [df["論理日付"], df["TableNo"].astype(int), df["SetNo"].astype(int)]
+
+def ledger_rows(df):
+    # (論理日付, 卓, セット) ごとの合計
+    if df.empty:
+        return pd.DataFrame(columns=LEDGER_SUMS, index=pd.MultiIndex.from_tuples([], names=LEDGER_KEYS), dtype=int)
+    return game_settlement(df).groupby(_ledger_keys(df)).sum().rename_axis(LEDGER_KEYS)
+
+def key_hashes(df):
+    # (論理日付, 卓, セット) ごとの内容のハッシュ（中の対局の 備考・タイプ・着順 が1つでも変われば変わる）
+    if df.empty:
+        return pd.Series(dtype="uint64", index=pd.MultiIndex.from_tuples([], names=LEDGER_KEYS))
+    sigs = pd.util.hash_pandas_object(df[SIGNATURE_COLS].astype(str), index=False)
+    return sigs.groupby(_ledger_keys(df)).sum().rename_axis(LEDGER_KEYS)
+
+class SettlementLedger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.rows = ledger_rows(pd.DataFrame())
+        self.hashes = key_hashes(pd.DataFrame())  # 台帳の行を計算したときの内容のハッシュ
+
+    # --- 保存・読み込み (台帳の行と、行ごとのハッシュだけを持つ) ---
+    @classmethod
+    def load(cls, path=LEDGER_PATH):
+        ledger = cls(path)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            ledger.rows = state["rows"]
+            ledger.hashes = state["hashes"]
+        except Exception:
+            pass
+        return ledger
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump({"rows": self.rows, "hashes": self.hashes}, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            pass
+
+    # --- 更新 ---
+    def apply(self, changes):
+        # changes は [(変更前の行, 変更後の行)]（登録は変更前が None、削除は変更後が None）
+        # 変更前の分を引き、変更後の分を足してすぐに表示へ反映する。
+        # 触った行のハッシュは捨て、次の reconcile でシートの内容から計算し直して確かめる
+        with self._lock:
+            touched = set()
+            try:
+                rows = self.rows
+                for before, after in changes:
+                    for row, sign in ((before, -1), (after, 1)):
+                        if row:
+                            delta = ledger_rows(shape_score_df(pd.DataFrame([row])))
+                            rows = rows.add(delta * sign, fill_value=0)
+                            touched.update(delta.index)
+                self.rows = rows[rows["ゲーム数"] > 0].astype(int).sort_index()
+                self.hashes = self.hashes[~self.hashes.index.isin(list(touched))]
+            except Exception:
+                # 足し引きできなかったときは台帳を空にし、次の reconcile で作り直す
+                self.rows = ledger_rows(pd.DataFrame())
+                self.hashes = key_hashes(pd.DataFrame())
+            self.save()
+
+    def reconcile(self, df):
+        # (日付, 卓, セット) ごとの内容のハッシュが前回の計算と違う行だけを df から計算し直す
+        # （シートを直接書き換えた分や、apply で足し引きした行の確かめ）
+        hashes = key_hashes(df)
+        with self._lock:
+            common = hashes.index.intersection(self.hashes.index)
+            stale = common[hashes.loc[common].values != self.hashes.loc[common].values]
+            stale = stale.union(hashes.index.symmetric_difference(self.hashes.index))
+            stale = stale.union(self.rows.index.difference(self.hashes.index))
+            if len(stale) == 0:
+                return False
+            fresh = ledger_rows(df[pd.MultiIndex.from_arrays(_ledger_keys(df)).isin(stale)]) if not df.empty else ledger_rows(df)
+            self.rows = pd.concat([self.rows[~self.rows.index.isin(stale)], fresh]).sort_index()
+            self.hashes = hashes
+            self.save()
+            return True
+
+    # --- 参照 ---
+    def table(self, start=None, end=None):
+        with self._lock:
+            rows = self.rows.reset_index()
+        if start is not None:
+            rows = rows[rows["論理日付"] >= start]
+        if end is not None:
+            rows = rows[rows["論理日付"] <= end]
+        return rows
+
+    def totals(self, start=None, end=None):
+        # 期間内の合計と稼働日数
+        rows = self.table(start, end)
+        res = {c: int(rows[c].sum()) for c in LEDGER_SUMS}
+        res["日数"] = int(rows["論理日付"].nunique())
+        return res
@@ -0,0 +1,269 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pandas as pd
+
+from score_data import STORAGE_BACKEND, missing_score_cols, shape_score_df
+from score_stats import RANK_METRICS, Leaderboard, build_leaderboard, build_player_stats, data_version, logical_today
+from settlement import daily_settlement
+from storage import SCORE_TABLE, STORE_DB_PATH, SqliteStore
+
+# ==========================================
+# 画面なしの成績 API (店内サイネージ・LINE bot 用)
+# アプリが手元に残したデータ (SQLite か .snapshot/score.pkl) を読み、
+# ランキング・個人成績・卓ごとの精算を JSON / CSV で返す。
+# 応答はデータの版ごとに覚えておき、ETag が同じなら 304 だけを返す
+#
+#   python stats_api.py serve --port 8502
+#   python stats_api.py rankings --start 2024-01-01 --metric avg_rank --format csv
+#   python stats_api.py player 山田
+#   python stats_api.py settlement --date 2024-05-01
+# ==========================================
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", f"{SCORE_TABLE}.pkl")
+RESPONSE_CACHE_SIZE = 256
+DEFAULT_TOP_N = 10
+
+def process_score_df(df):
+    # main.py と同じ整形（画面がないので列不足は例外にする）
+    missing_cols = missing_score_cols(df) if not df.empty else []
+    if missing_cols:
+        raise ValueError(f"score の列が足りません: {missing_cols}")
+    return shape_score_df(df)
+
+# ==========================================
+# データの読み込み（元のファイルが変わったときだけ読み直す）
+# ==========================================
+class ScoreSource:
+    def __init__(self, backend=STORAGE_BACKEND, snapshot_path=SNAPSHOT_PATH):
+        self.backend = backend
+        self.snapshot_path = snapshot_path
+        self.store = SqliteStore() if backend == "sqlite" else None
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.df = None
+        self.version = None
+
+    def _current_stamp(self):
+        path = STORE_DB_PATH if self.store is not None else self.snapshot_path
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self):
+        # (整形済みの score, データの版)
+        with self._lock:
+            stamp = self._current_stamp()
+            if self.df is None or stamp != self._stamp:
+                if self.store is not None:
+                    raw = self.store.read(SCORE_TABLE)
+                elif stamp is not None:
+                    raw = pd.read_pickle(self.snapshot_path)
+                else:
+                    raise FileNotFoundError(f"{self.snapshot_path} がありません（アプリを一度開くと作られます）")
+                self.df = process_score_df(raw)
+                self.version = data_version(self.df)
+                self._stamp = stamp
+            return self.df, self.version
+
+# ==========================================
+# 集計 (戻り値は DataFrame。JSON / CSV への変換は呼び出し側)
+# ==========================================
+def _parse_date(text, default=None):
+    if not text:
+        return default
+    return date.fromisoformat(str(text))
+
+def rankings(df, store=None, start=None, end=None, metric="avg_rank", min_games=1, n=DEFAULT_TOP_N):
+    if metric not in RANK_METRICS:
+        raise ValueError(f"metric は {', '.join(RANK_METRICS)} のどれかです")
+    if store is not None:
+        board = Leaderboard.from_totals(store.player_totals(start=start, end=end))
+    else:
+        mask = pd.Series(True, index=df.index)
+        if start: mask &= df["論理日付"] >= start
+        if end: mask &= df["論理日付"] <= end
+        board = build_leaderboard(df[mask])
+    return board.top(metric, int(min_games), int(n))
+
+def player_stats(df, name, start=None, end=None):
+    mask = (df["Aさん"] == name) | (df["Bさん"] == name) | (df["Cさん"] == name)
+    if start: mask &= df["論理日付"] >= start
+    if end: mask &= df["論理日付"] <= end
+    stats = build_player_stats(df[mask])
+    return stats[stats["name"] == name].reset_index(drop=True)
+
+def settlement(df, day=None, end=None):
+    # 指定日 (既定は今日) から end までの卓ごとの精算
+    day = day or logical_today()
+    end = end or day
+    return daily_settlement(df[(df["論理日付"] >= day) & (df["論理日付"] <= end)])
+
+def run_query(source, kind, params):
+    df, _ = source.get()
+    start = _parse_date(params.get("start"))
+    end = _parse_date(params.get("end"))
+    if kind == "rankings":
+        return rankings(
+            df, source.store, start, end,
+            metric=params.get("metric", "avg_rank"),
+            min_games=params.get("min_games", 1), n=params.get("n", DEFAULT_TOP_N),
+        )
+    if kind == "player":
+        if not params.get("name"):
+            raise ValueError("name を指定してください")
+        return player_stats(df, params["name"], start, end)
+    if kind == "settlement":
+        return settlement(df, _parse_date(params.get("date")), end)
+    raise KeyError(kind)
+
+def to_body(res, fmt):
+    if fmt == "csv":
+        return res.to_csv(index=False).encode("utf-8-sig"), "text/csv; charset=utf-8"
+    records = json.loads(res.to_json(orient="records", force_ascii=False, date_format="iso"))
+    return json.dumps(records, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+
+# ==========================================
+# 応答のキャッシュ (データの版 + 問い合わせ内容 -> 本文)
+# ==========================================
+class ResponseCache:
+    def __init__(self, source, size=RESPONSE_CACHE_SIZE):
+        self.source = source
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def etag(version, kind, params, fmt):
+        # 日付を省いた問い合わせは「今日」基準なので、日付が変わったら別物にする
+        key = json.dumps([version, logical_today(), kind, sorted(params.items()), fmt], ensure_ascii=False, default=str)
+        return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+    def current_tag(self, kind, params, fmt):
+        # 本文を作らずに今の ETag だけを出す（304 で済むときはここまでで終わる）
+        _, version = self.source.get()
+        return self.etag(version, kind, params, fmt)
+
+    def get(self, kind, params, fmt):
+        # (ETag, 本文, Content-Type)。同じ版・同じ問い合わせなら計算し直さない
+        tag = self.current_tag(kind, params, fmt)
+        with self._lock:
+            if tag in self._entries:
+                self._entries.move_to_end(tag)
+                return (tag,) + self._entries[tag]
+        body, content_type = to_body(run_query(self.source, kind, params), fmt)
+        with self._lock:
+            self._entries[tag] = (body, content_type)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return tag, body, content_type
+
+# ==========================================
+# HTTP
+# GET /rankings?start=&end=&metric=&min_games=&n=
+# GET /players/<名前>?start=&end=
+# GET /settlement?date=&end=
+# いずれも format=csv で CSV。If-None-Match が今の ETag と同じなら 304
+# ==========================================
+def make_handler(cache):
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            fmt = params.pop("format", "json")
+            parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            if parts[:1] == ["players"] and len(parts) == 2:
+                kind, params["name"] = "player", parts[1]
+            elif len(parts) == 1 and parts[0] in ("rankings", "settlement"):
+                kind = parts[0]
+            else:
+                return self._send(404, b'{"error": "not found"}')
+
+            try:
+                tag = cache.current_tag(kind, params, fmt)
+                if self.headers.get("If-None-Match") == tag:
+                    return self._send(304, b"", tag=tag)
+                tag, body, content_type = cache.get(kind, params, fmt)
+            except (ValueError, KeyError) as e:
+                return self._send(400, json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8"))
+            except Exception as e:
+                return self._send(503, json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8"))
+            self._send(200, body, content_type, tag)
+
+        def _send(self, code, body, content_type="application/json; charset=utf-8", tag=None):
+            self.send_response(code)
+            if tag:
+                self.send_header("ETag", tag)
+                self.send_header("Cache-Control", "no-cache")
+            if code != 304:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if code != 304:
+                self.wfile.write(body)
+
+    return StatsHandler
+
+def serve(host, port):
+    cache = ResponseCache(ScoreSource())
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    print(f"stats api: http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ==========================================
+# コマンドライン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="成績の集計を JSON / CSV で出力する")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="HTTP で公開する")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8502)
+
+    for name in ("rankings", "player", "settlement"):
+        p = sub.add_parser(name)
+        p.add_argument("--format", choices=["json", "csv"], default="json")
+        p.add_argument("--end")
+        if name == "settlement":
+            p.add_argument("--date")
+            continue
+        p.add_argument("--start")
+        if name == "player":
+            p.add_argument("name")
+        else:
+            p.add_argument("--metric", default="avg_rank", choices=list(RANK_METRICS))
+            p.add_argument("--min-games", dest="min_games", type=int, default=1)
+            p.add_argument("--n", type=int, default=DEFAULT_TOP_N)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port)
+        return 0
+
+    params = {k: v for k, v in vars(args).items() if k not in ("command", "format") and v is not None}
+    try:
+        res = run_query(ScoreSource(), args.command, params)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    body, _ = to_body(res, args.format)
+    sys.stdout.buffer.write(body + b"\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+# ==========================================
+# 手元の保存先 (SQLite)
+# シートと同じく「1シート = 1テーブル、値は文字列」で持ち、
+# score には検索用の索引テーブル (対局・座席) を別に作って期間・人・卓の絞り込みと集計を SQL で行う
+# ==========================================
+STORE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot", "store.sqlite")
+SCORE_TABLE = "score"
+TOMBSTONE_COL = "削除日時"
+SEATS = ["A", "B", "C"]
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS score_games (
+    row_id INTEGER PRIMARY KEY, game_no INTEGER, table_no INTEGER, logical_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_games_no ON score_games (game_no);
+CREATE INDEX IF NOT EXISTS idx_games_date ON score_games (logical_date, table_no);
+CREATE TABLE IF NOT EXISTS score_players (
+    row_id INTEGER, game_no INTEGER, logical_date TEXT, seat TEXT, name TEXT, rank INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_players_name ON score_players (name, logical_date);
+CREATE INDEX IF NOT EXISTS idx_players_date ON score_players (logical_date);
+"""
+
+def _q(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _cell(value):
+    # シートと同じく文字列で持つ（空欄は NULL）
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    return text if text != "" else None
+
+def _normalize_datetime(value):
+    # "2024/5/1 9:05" のような書き方は "2024-05-01 09:05" にそろえる（SQLite の date() はゼロ埋めの ISO 形式しか読めない）
+    if value is None:
+        return None
+    ts = pd.to_datetime(value, errors="coerce")
+    if pd.isna(ts):
+        return value
+    return ts.strftime("%Y-%m-%d %H:%M:%S" if ts.second else "%Y-%m-%d %H:%M")
+
+def _score_rows(name, cols, rows):
+    # score の 日時 だけは書き込むときに形をそろえておく
+    if name != SCORE_TABLE or "日時" not in cols:
+        return rows
+    i = cols.index("日時")
+    for r in rows:
+        r[i] = _normalize_datetime(r[i])
+    return rows
+
+class SqliteStore:
+    def __init__(self, path=STORE_DB_PATH):
+        self._lock = threading.RLock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(INDEX_SCHEMA)
+        self._repair_dates()
+
+    # --- シート相当の読み書き ---
+    def columns(self, name):
+        with self._lock:
+            info = self.db.execute(f"PRAGMA table_info({_q(name)})").fetchall()
+        return [r[1] for r in info if r[1] != "_row"]
+
+    def is_empty(self, name):
+        if not self.columns(name):
+            return True
+        with self._lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM {_q(name)}").fetchone()[0] == 0
+
+    def read(self, name, where="", params=()):
+        # シートを読んだときと同じ形 (index + 2 = 行番号) で返す
+        cols = self.columns(name)
+        if not cols:
+            return pd.DataFrame()
+        sql = f"SELECT _row, {', '.join(_q(c) for c in cols)} FROM {_q(name)} {where} ORDER BY _row"
+        with self._lock:
+            rows = self.db.execute(sql, list(params)).fetchall()
+        return pd.DataFrame([r[1:] for r in rows], columns=cols, index=[r[0] - 2 for r in rows])
+
+    def write(self, name, df):
+        # 全体を置き換える（シートへの conn.update に相当）
+        cols = [str(c).strip() for c in df.columns]
+        rows = _score_rows(name, cols, [[_cell(v) for v in r] for r in df.itertuples(index=False)])
+        with self._lock, self.db:
+            self.db.execute(f"DROP TABLE IF EXISTS {_q(name)}")
+            self.db.execute(
+                f"CREATE TABLE {_q(name)} (_row INTEGER PRIMARY KEY, {', '.join(_q(c) + ' TEXT' for c in cols)})"
+            )
+            self._insert(name, cols, rows, start_row=2)
+            if name == SCORE_TABLE:
+                self._reindex()
+
+    def append(self, name, df):
+        # 末尾に行を足す。知らない列は追加する
+        cols = [str(c).strip() for c in df.columns]
+        rows = _score_rows(name, cols, [[_cell(v) for v in r] for r in df.itertuples(index=False)])
+        with self._lock, self.db:
+            existing = self.columns(name)
+            if not existing:
+                self.db.execute(
+                    f"CREATE TABLE {_q(name)} (_row INTEGER PRIMARY KEY, {', '.join(_q(c) + ' TEXT' for c in cols)})"
+                )
+            for c in cols:
+                if existing and c not in existing:
+                    self.db.execute(f"ALTER TABLE {_q(name)} ADD COLUMN {_q(c)} TEXT")
+            last = self.db.execute(f"SELECT COALESCE(MAX(_row), 1) FROM {_q(name)}").fetchone()[0]
+            self._insert(name, cols, rows, start_row=last + 1)
+            if name == SCORE_TABLE:
+                self._reindex(range(last + 1, last + 1 + len(rows)))
+
+    def _insert(self, name, cols, rows, start_row):
+        sql = f"INSERT INTO {_q(name)} (_row, {', '.join(_q(c) for c in cols)}) VALUES ({', '.join('?' * (len(cols) + 1))})"
+        self.db.executemany(sql, [[start_row + i] + r for i, r in enumerate(rows)])
+
+    # --- score の1行単位の操作 ---
+    def _live_row(self, game_no):
+        rows = self.db.execute("SELECT row_id FROM score_games WHERE game_no = ? ORDER BY row_id", [int(game_no)]).fetchall()
+        return rows[0][0] if rows else None
+
+    def update_score_row(self, game_no, new_data):
+        with self._lock, self.db:
+            row_id = self._live_row(game_no)
+            if row_id is None:
+                return False
+            cols = [c for c in new_data if c in self.columns(SCORE_TABLE)]
+            if cols:
+                sets = ", ".join(f"{_q(c)} = ?" for c in cols)
+                self.db.execute(
+                    f"UPDATE {_q(SCORE_TABLE)} SET {sets} WHERE _row = ?",
+                    _score_rows(SCORE_TABLE, cols, [[_cell(new_data[c]) for c in cols]])[0] + [row_id],
+                )
+            self._reindex([row_id])
+            return True
+
+    def soft_delete_score_row(self, game_no, deleted_at):
+        with self._lock, self.db:
+            row_id = self._live_row(game_no)
+            if row_id is None:
+                return False
+            if TOMBSTONE_COL not in self.columns(SCORE_TABLE):
+                self.db.execute(f"ALTER TABLE {_q(SCORE_TABLE)} ADD COLUMN {_q(TOMBSTONE_COL)} TEXT")
+            self.db.execute(f"UPDATE {_q(SCORE_TABLE)} SET {_q(TOMBSTONE_COL)} = ? WHERE _row = ?", [deleted_at, row_id])
+            self._reindex([row_id])
+            return True
+
+    # --- 索引 ---
+    def _repair_dates(self):
+        # 以前そろえずに入った 日時 で論理日付が空になっている行だけを直して索引を入れ直す
+        with self._lock, self.db:
+            if "日時" not in self.columns(SCORE_TABLE):
+                return
+            rows = self.db.execute(
+                f'SELECT g.row_id, s."日時" FROM score_games g JOIN {_q(SCORE_TABLE)} s ON s._row = g.row_id'
+                " WHERE g.logical_date IS NULL"
+            ).fetchall()
+            fixed = [(_normalize_datetime(v), r) for r, v in rows if v is not None and _normalize_datetime(v) != v]
+            if not fixed:
+                return
+            self.db.executemany(f'UPDATE {_q(SCORE_TABLE)} SET "日時" = ? WHERE _row = ?', fixed)
+            self._reindex([r for _, r in fixed])
+
+    def _reindex(self, row_ids=None):
+        # 削除済みでない行だけを対局・座席の索引に入れ直す（すべて SQL の中で完結する）
+        # row_ids を渡したときは、その行の索引だけを消して入れ直す
+        cols = self.columns(SCORE_TABLE)
+        if row_ids is None:
+            scope, params = "1", []
+        else:
+            params = [int(r) for r in row_ids]
+            if not params:
+                return
+            scope = f"row_id IN ({', '.join('?' * len(params))})"
+        self.db.execute(f"DELETE FROM score_games WHERE {scope}", params)
+        self.db.execute(f"DELETE FROM score_players WHERE {scope}", params)
+        if not all(c in cols for c in ["GameNo", "TableNo", "日時"]):
+            return
+        live = f"COALESCE(TRIM({_q(TOMBSTONE_COL)}), '') = ''" if TOMBSTONE_COL in cols else "1"
+        self.db.execute(f"""
+            INSERT INTO score_games (row_id, game_no, table_no, logical_date)
+            SELECT _row, CAST(CAST("GameNo" AS REAL) AS INTEGER), CAST(CAST("TableNo" AS REAL) AS INTEGER),
+                   date(REPLACE("日時", '/', '-'), '-9 hours')
+            FROM {_q(SCORE_TABLE)} WHERE {live} AND {scope.replace("row_id", "_row")}
+        """, params)
+        for seat in SEATS:
+            if f"{seat}さん" not in cols or f"{seat}着順" not in cols:
+                continue
+            self.db.execute(f"""
+                INSERT INTO score_players (row_id, game_no, logical_date, seat, name, rank)
+                SELECT g.row_id, g.game_no, g.logical_date, '{seat}', s.{_q(seat + 'さん')},
+                       CAST(CAST(s.{_q(seat + '着順')} AS REAL) AS INTEGER)
+                FROM score_games g JOIN {_q(SCORE_TABLE)} s ON s._row = g.row_id
+                WHERE COALESCE(s.{_q(seat + 'さん')}, '') != '' AND {scope.replace("row_id", "g.row_id")}
+            """, params)
+
+    # --- 絞り込み・集計 ---
+    def _game_where(self, start=None, end=None, player=None, table_no=None):
+        clauses, params = [], []
+        if start:
+            clauses.append("logical_date >= ?")
+            params.append(str(start))
+        if end:
+            clauses.append("logical_date <= ?")
+            params.append(str(end))
+        if table_no is not None:
+            clauses.append("table_no = ?")
+            params.append(int(table_no))
+        if player:
+            clauses.append("row_id IN (SELECT row_id FROM score_players WHERE name = ?)")
+            params.append(str(player))
+        return " AND ".join(clauses) or "1", params
+
+    def game_numbers(self, **filters):
+        # 条件に合う対局の GameNo（索引だけで答える）
+        where, params = self._game_where(**filters)
+        with self._lock:
+            rows = self.db.execute(f"SELECT game_no FROM score_games WHERE {where}", params).fetchall()
+        return [r[0] for r in rows]
+
+    def player_totals(self, start=None, end=None):
+        # 期間内のプレイヤー別 [打数, 着順合計, 1着回数, 3着回数]
+        clauses, params = ["rank > 0"], []
+        if start:
+            clauses.append("logical_date >= ?")
+            params.append(str(start))
+        if end:
+            clauses.append("logical_date <= ?")
+            params.append(str(end))
+        sql = (
+            "SELECT name, COUNT(*), SUM(rank), SUM(rank = 1), SUM(rank = 3) FROM score_players"
+            f" WHERE {' AND '.join(clauses)} GROUP BY name"
+        )
+        with self._lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return {r[0]: [int(r[1]), int(r[2]), int(r[3]), int(r[4])] for r in rows}
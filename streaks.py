@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from score_stats import game_signatures, to_player_ranks
+
+# ==========================================
+# 連続トップ・連続ラス
+# 対局順に並べた「その人の着順」の列を連長圧縮 (run-length) してまとめて数える
+# ==========================================
+STREAK_KINDS = {"top": 1, "last": 3}
+FIVE_WIN_NOTE = "５連勝〜"
+FIVE_WIN_MIN = 5
+
+def ordered_ranks(df):
+    # (name, rank, 論理日付, TableNo, GameNo) を対局順に並べた縦持ち
+    long = to_player_ranks(df)
+    if long.empty:
+        return long.assign(TableNo=pd.Series(dtype=int))
+    table = df.set_index("GameNo")["TableNo"]
+    long = long.assign(TableNo=long["GameNo"].map(table[~table.index.duplicated()]).fillna(0).astype(int).values)
+    return long.sort_values(["GameNo"], kind="stable").reset_index(drop=True)
+
+def run_lengths(flags, groups):
+    # 各行で「同じグループ内で flags が何回続いているか」(続いていなければ 0)
+    flags = np.asarray(flags, dtype=bool)
+    groups = np.asarray(groups)
+    if len(flags) == 0:
+        return np.zeros(0, dtype=np.int64)
+    new_group = np.r_[True, groups[1:] != groups[:-1]]
+    breaks = new_group | ~flags | np.r_[True, ~flags[:-1]]
+    run_id = np.cumsum(breaks)
+    counts = pd.Series(flags.astype(np.int64)).groupby(run_id).cumsum().to_numpy()
+    return np.where(flags, counts, 0)
+
+def streak_table(long, by=("name",)):
+    # グループ (既定ではプレイヤー) ごとの最長・現在の連続トップ/ラス
+    by = list(by)
+    cols = by + [f"{k}_{m}" for k in STREAK_KINDS for m in ("longest", "current")]
+    if long.empty:
+        return pd.DataFrame(columns=cols)
+    long = long.sort_values(by + ["GameNo"], kind="stable")
+    keys = long[by].astype(str).agg("\x1f".join, axis=1).to_numpy() if len(by) > 1 else long[by[0]].to_numpy()
+    res = long[by].copy()
+    for kind, rank in STREAK_KINDS.items():
+        res[kind] = run_lengths(long["rank"].to_numpy() == rank, keys)
+    grouped = res.groupby(by, sort=False)
+    out = grouped.agg(**{f"{k}_longest": (k, "max") for k in STREAK_KINDS})
+    last = grouped.tail(1).set_index(by)
+    for kind in STREAK_KINDS:
+        out[f"{kind}_current"] = last[kind]
+    return out.reset_index()[cols]
+
+def session_top_streak(df_session, name):
+    # 同じ日・同じ卓での、その人の直近の連続トップ数（その人が入った対局だけを順に見る）
+    long = ordered_ranks(df_session)
+    ranks = long.loc[long["name"] == name, "rank"].to_numpy()
+    if len(ranks) == 0:
+        return 0
+    tail = run_lengths(ranks == 1, np.zeros(len(ranks)))
+    return int(tail[-1])
+
+class StreakTracker:
+    # プレイヤーごとの連続記録。新しい対局が後ろに足されただけなら、その分だけを反映する
+    SIGNATURE_COLS = [f"{seat}{c}" for seat in ("A", "B", "C") for c in ["さん", "着順"]]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.signatures = pd.Series(dtype="uint64")
+        self.state = {}   # name -> {"top": [最長, 現在], "last": [最長, 現在]}
+
+    def _rebuild(self, df):
+        table = streak_table(ordered_ranks(df))
+        self.state = {
+            r["name"]: {k: [int(r[f"{k}_longest"]), int(r[f"{k}_current"])] for k in STREAK_KINDS}
+            for _, r in table.iterrows()
+        }
+
+    def _append(self, df_new):
+        for name, rank in zip(*[ordered_ranks(df_new)[c] for c in ("name", "rank")]):
+            entry = self.state.setdefault(name, {k: [0, 0] for k in STREAK_KINDS})
+            for kind, target in STREAK_KINDS.items():
+                longest, current = entry[kind]
+                current = current + 1 if rank == target else 0
+                entry[kind] = [max(longest, current), current]
+
+    def sync(self, df):
+        sigs = game_signatures(df, self.SIGNATURE_COLS)
+        with self._lock:
+            prev = self.signatures
+            common = sigs.index.intersection(prev.index)
+            changed = (sigs.loc[common].values != prev.loc[common].values).any()
+            removed = len(prev.index.difference(sigs.index)) > 0
+            added = sigs.index.difference(prev.index)
+            if not changed and not removed and len(added) == 0:
+                return False
+            if changed or removed or (len(prev) and len(added) and added.min() <= prev.index.max()):
+                self._rebuild(df)
+            else:
+                self._append(df[df["GameNo"].isin(added)])
+            self.signatures = sigs
+            return True
+
+    def snapshot(self):
+        # 今の連続記録を写した表示専用のもの（次の sync で書き換わらない）
+        with self._lock:
+            tracker = StreakTracker()
+            tracker.state = {name: {k: list(v) for k, v in entry.items()} for name, entry in self.state.items()}
+        return tracker
+
+    def get(self, name):
+        with self._lock:
+            entry = self.state.get(name)
+            return {k: tuple(v) for k, v in entry.items()} if entry else {k: (0, 0) for k in STREAK_KINDS}
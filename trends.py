@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from score_stats import to_player_ranks
+
+# ==========================================
+# プレイヤーの推移 (移動平均の平均着順・トップ率)
+# 系列はまとめて rolling で計算し、画面に送る前に点数を減らす
+# ==========================================
+TREND_WINDOWS = [10, 20, 50, 100]
+TREND_MAX_POINTS = 300
+TREND_METHODS = {"lttb": "形を保って間引く (LTTB)", "day": "1日ごと"}
+
+def player_trend(df, name, window=20):
+    # 対局順の (対局数, 論理日付, 平均着順, トップ率)。最初の window 局までは打った分だけで平均する
+    long = to_player_ranks(df)
+    ranks = long[long["name"] == name].sort_values("GameNo", kind="stable")
+    if ranks.empty:
+        return pd.DataFrame(columns=["対局数", "論理日付", "平均着順", "トップ率"])
+    rank = ranks["rank"].astype(float).reset_index(drop=True)
+    return pd.DataFrame({
+        "対局数": np.arange(1, len(rank) + 1),
+        "論理日付": pd.to_datetime(ranks["論理日付"].values, errors="coerce"),
+        "平均着順": rank.rolling(window, min_periods=1).mean().values,
+        "トップ率": rank.eq(1).rolling(window, min_periods=1).mean().values * 100,
+    })
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: 形を崩さないように threshold 点を選ぶ（先頭と末尾は必ず残す）
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 次のバケツの平均点（最後は末尾の点）
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean() if nhi > nlo else x[-1]
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(np.argmax(area)) if hi > lo else lo
+        picked[i + 1] = prev
+    return picked
+
+def downsample_trend(trend, max_points=TREND_MAX_POINTS, method="lttb"):
+    if len(trend) <= max_points:
+        return trend
+    if method == "day":
+        # 1日の最後の値だけを残す（それでも多ければ LTTB で減らす）
+        trend = trend.groupby(trend["論理日付"].dt.date, sort=False).tail(1)
+        if len(trend) <= max_points:
+            return trend.reset_index(drop=True)
+    idx = lttb_indices(trend["対局数"].to_numpy(), trend["平均着順"].to_numpy(), max_points)
+    return trend.iloc[idx].reset_index(drop=True)